@@ -0,0 +1,91 @@
+"""
+Threshold calibration for the semantic answer cache.
+
+Embeds labelled question pairs with the RAG embedding model (the same one the
+agent uses for cache lookups) and reports their cosine similarities:
+
+  paraphrase  same question reworded; a cached answer may be reused
+  near-miss   neighbouring topic with a different answer; must never share
+
+The answer cache threshold (ANSWER_CACHE_THRESHOLD) has to sit above every
+near-miss. The report prints the highest near-miss, the share of paraphrases
+each candidate threshold would still serve from the cache, and a suggested
+threshold.
+
+Usage:
+    python _bench_answer_cache.py [--margin 0.005]
+"""
+
+import argparse, os
+
+import numpy as np
+
+PARAPHRASES = [
+    ("What is your return policy?", "what's the return policy"),
+    ("What is your return policy?", "Can you tell me your policy on returns?"),
+    ("How can I contact customer support?", "How do I get in touch with customer support?"),
+    ("Any offers or discounts right now?", "Are there any discounts at the moment?"),
+    ("What are your store hours?", "When is the store open?"),
+    ("Tell me about CNXStore", "What is CNXStore?"),
+    ("Do you have a loyalty program?", "Is there a loyalty programme?"),
+    ("What membership benefits do you offer?", "What do members get?"),
+    ("How long does shipping take?", "How many days does delivery take?"),
+    ("What is your phone number?", "What number can I call you on?"),
+]
+
+NEAR_MISSES = [
+    ("What is your return policy?", "What is your refund policy?"),
+    ("What is your return policy?", "What is your exchange policy?"),
+    ("What is your refund policy?", "How long do refunds take?"),
+    ("What is your shipping policy?", "What is your return policy?"),
+    ("What is your phone number?", "What is your email address?"),
+    ("What is your phone number?", "What is your store address?"),
+    ("Any offers on shirts?", "Any offers on dresses?"),
+    ("What are your store hours?", "What are your customer support hours?"),
+    ("Do you have a loyalty program?", "Do you have gift cards?"),
+    ("How do I cancel my order?", "How do I return my order?"),
+    ("Do you ship internationally?", "Do you ship to my city?"),
+    ("What membership benefits do you offer?", "How much does membership cost?"),
+]
+
+
+def load_embedder():
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=os.getenv("RAG_EMBEDDING_MODEL", "intfloat/e5-large"),
+        encode_kwargs={"normalize_embeddings": True}
+    )
+
+
+def cosines(embedder, pairs) -> np.ndarray:
+    texts = sorted({text for pair in pairs for text in pair})
+    vectors = np.asarray([embedder.embed_query(text) for text in texts], dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = {text: i for i, text in enumerate(texts)}
+    return np.array([float(vectors[index[a]] @ vectors[index[b]]) for a, b in pairs])
+
+
+def main(margin: float):
+    embedder = load_embedder()
+    paraphrase = cosines(embedder, PARAPHRASES)
+    near_miss = cosines(embedder, NEAR_MISSES)
+
+    print(f"model: {os.getenv('RAG_EMBEDDING_MODEL', 'intfloat/e5-large')}")
+    for label, pairs, scores in (("near-miss", NEAR_MISSES, near_miss), ("paraphrase", PARAPHRASES, paraphrase)):
+        print(f"\n{label} pairs (cosine)")
+        for (a, b), score in sorted(zip(pairs, scores), key=lambda item: -item[1]):
+            print(f"  {score:.4f}  {a!r} ~ {b!r}")
+    print(f"\nnear-miss  max {near_miss.max():.4f}  mean {near_miss.mean():.4f}")
+    print(f"paraphrase min {paraphrase.min():.4f}  mean {paraphrase.mean():.4f}")
+
+    print(f"\n{'threshold':>9s} {'near-miss hits':>15s} {'paraphrase hits':>16s}")
+    for threshold in (0.90, 0.92, 0.94, 0.95, 0.96, 0.97, 0.98, 0.99):
+        print(f"{threshold:9.2f} {int((near_miss >= threshold).sum()):>15d} {(paraphrase >= threshold).mean():>16.0%}")
+    print(f"\nsuggested ANSWER_CACHE_THRESHOLD: {min(0.999, near_miss.max() + margin):.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--margin", type=float, default=0.005, help="safety margin above the highest near-miss")
+    args = parser.parse_args()
+    main(args.margin)
@@ -0,0 +1,126 @@
+"""
+Accuracy vs latency benchmark for the tiered intent classifier.
+
+Classifies a labelled message set (disjoint from the centroid examples in
+intent_classifier.py) with each tier combination and reports accuracy, mean
+and p95 latency and how often each tier answered:
+
+  rules            rule tier only, best guess when unsure
+  rules+centroid   plus nearest centroid over sentence embeddings (--embeddings)
+  tiered           rules -> centroid -> Gemini, the agent's configuration (--llm)
+  llm              Gemini for every message, the previous behaviour (--llm)
+
+Usage:
+    python _bench_intent.py [--embeddings] [--llm]
+"""
+
+import argparse, asyncio, collections, os, statistics, sys, time
+
+from intent_classifier import CentroidIntentClassifier, RuleIntentClassifier, TieredIntentClassifier
+
+LABELLED = [
+    ("track order 5904242344019", "order_status"),
+    ("Where's my order #1042?", "order_status"),
+    ("has my order been shipped", "order_status"),
+    ("status for order id 5904242344019 please", "order_status"),
+    ("I placed an order last week and it still hasn't come", "order_status"),
+    ("can you check on my delivery", "order_status"),
+    ("tracking info for 5904242344019", "order_status"),
+    ("is order 1001 out for delivery?", "order_status"),
+    ("when will my parcel arrive", "order_status"),
+    ("order update", "order_status"),
+    ("I want to buy variant 42910880890963, email me at a@b.com", "order_creation"),
+    ("purchase 2 units of 42910880890963", "order_creation"),
+    ("place an order for the green hoodie", "order_creation"),
+    ("I'd like to order this one", "order_creation"),
+    ("add 3 of these to my cart and checkout", "order_creation"),
+    ("buy it for me, my email is sam@example.com", "order_creation"),
+    ("I'll take two of variant 42910880890964", "order_creation"),
+    ("create an order with quantity 1", "order_creation"),
+    ("get me this in size M", "order_creation"),
+    ("ok let's purchase", "order_creation"),
+    ("what is the return policy", "info_search"),
+    ("how do I get a refund?", "info_search"),
+    ("customer care number?", "info_search"),
+    ("are there any discounts today", "info_search"),
+    ("do you have promo codes", "info_search"),
+    ("what's your exchange window", "info_search"),
+    ("tell me about your company", "info_search"),
+    ("how can I reach you", "info_search"),
+    ("shipping policy", "info_search"),
+    ("what perks do members get", "info_search"),
+    ("show me red dresses", "product_search"),
+    ("floral shirts under 1500", "product_search"),
+    ("do you sell sneakers", "product_search"),
+    ("looking for a linen kurta", "product_search"),
+    ("black jeans size 34", "product_search"),
+    ("any jackets in stock?", "product_search"),
+    ("something nice for a party", "product_search"),
+    ("cotton t-shirts for kids", "product_search"),
+    ("what bags do you have", "product_search"),
+    ("recommend a gift for my mom", "product_search"),
+]
+
+
+def load_embedder():
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=os.getenv("RAG_EMBEDDING_MODEL", "intfloat/e5-large"),
+        encode_kwargs={"normalize_embeddings": True}
+    )
+
+
+async def run(name: str, classify) -> dict:
+    correct, latencies, tiers = 0, [], collections.Counter()
+    for message, label in LABELLED:
+        started = time.perf_counter()
+        decision = await classify(message)
+        latencies.append((time.perf_counter() - started) * 1000)
+        correct += decision["intent"] == label
+        tiers[decision["tier"]] += 1
+    latencies.sort()
+    return {
+        "name": name,
+        "accuracy": correct / len(LABELLED),
+        "mean_ms": statistics.fmean(latencies),
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        "tiers": ", ".join(f"{tier} {count / len(LABELLED):.0%}" for tier, count in tiers.most_common())
+    }
+
+
+async def main(use_embeddings: bool, use_llm: bool):
+    rules = RuleIntentClassifier()
+    centroid = None
+    if use_embeddings:
+        embedder = load_embedder()
+        centroid = CentroidIntentClassifier(lambda: embedder)
+        centroid.classify("warm up")  # builds centroids outside the timed runs
+
+    rules_only = TieredIntentClassifier(rules=rules)
+    results = [await run("rules", rules_only.classify)]
+    if centroid is not None:
+        local = TieredIntentClassifier(rules=rules, centroid=centroid)
+        results.append(await run("rules+centroid", local.classify))
+    if use_llm:
+        from langgraph_agent_workflow_localmcp import _llm_classify_intent
+
+        tiered = TieredIntentClassifier(rules=rules, centroid=centroid)
+        results.append(await run("tiered", lambda m: tiered.classify(m, llm=_llm_classify_intent)))
+
+        async def llm_only(message):
+            intent, confidence, _ = await _llm_classify_intent(message) or ("product_search", None, {})
+            return {"intent": intent, "tier": "llm"}
+        results.append(await run("llm", llm_only))
+
+    print(f"{len(LABELLED)} labelled messages")
+    print(f"{'classifier':16s} {'accuracy':>8s} {'mean ms':>9s} {'p95 ms':>9s}  tiers")
+    for r in results:
+        print(f"{r['name']:16s} {r['accuracy']:8.1%} {r['mean_ms']:9.2f} {r['p95_ms']:9.2f}  {r['tiers']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--embeddings", action="store_true", help="include the nearest-centroid tier (loads the embedding model)")
+    parser.add_argument("--llm", action="store_true", help="include Gemini tiers (needs GEMINI_API_KEY and the agent dependencies)")
+    args = parser.parse_args()
+    asyncio.run(main(args.embeddings, args.llm))
@@ -0,0 +1,77 @@
+"""
+Memory benchmark: order dicts (get_order_status shape) vs compact OrderRecord.
+
+Builds N realistic orders (3 line items, 1 fulfillment) from freshly parsed
+JSON, as lookups and bulk exports produce them, and measures the memory held
+by each representation with tracemalloc.
+
+Usage:
+    python _bench_order_memory.py [orders]
+"""
+
+import gc, json, random, sys, tracemalloc
+
+from shopify_mcp_server import OrderRecord
+
+STATUSES = ["paid", "pending", "authorized", "refunded", "partially_refunded"]
+PRODUCTS = [f"Product {i} - Cotton Tee" for i in range(200)]
+
+
+def order_json(i: int) -> str:
+    return json.dumps({
+        "order_id": 5904242344019 + i,
+        "order_number": 1001 + i,
+        "financial_status": random.choice(STATUSES),
+        "fulfillment_status": random.choice([None, "fulfilled", "partial"]),
+        "total_price": f"{random.randint(1000, 50000) / 100:.2f}",
+        "currency": "USD",
+        "created_at": "2025-07-01T10:15:00-04:00",
+        "updated_at": "2025-07-02T08:30:00-04:00",
+        "cancelled_at": None,
+        "test_order": False,
+        "customer": {"email": f"customer{i}@example.com", "first_name": "Test", "last_name": "Customer"},
+        "line_items": [
+            {
+                "title": random.choice(PRODUCTS),
+                "quantity": random.randint(1, 3),
+                "price": f"{random.randint(500, 9000) / 100:.2f}",
+                "variant_id": 42910880890963 + random.randint(0, 5000),
+                "fulfillment_status": random.choice([None, "fulfilled"])
+            }
+            for _ in range(3)
+        ],
+        "fulfillments": [{
+            "status": "success",
+            "tracking_company": "USPS",
+            "tracking_number": f"94001111111111{i:08d}",
+            "created_at": "2025-07-02T08:30:00-04:00"
+        }],
+        "tags": "vip, repeat",
+        "note": None
+    })
+
+
+def measure(build, payloads: list[str]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = [build(json.loads(p)) for p in payloads]
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del held
+    return size
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    random.seed(7)
+    payloads = [order_json(i) for i in range(n)]
+
+    dict_bytes = measure(lambda order: order, payloads)
+    record_bytes = measure(OrderRecord.from_dict, payloads)
+
+    print(f"{n} orders")
+    print(f"  dict shape   : {dict_bytes / n:8.0f} bytes/order  ({dict_bytes / 2**20:7.1f} MiB)")
+    print(f"  OrderRecord  : {record_bytes / n:8.0f} bytes/order  ({record_bytes / 2**20:7.1f} MiB)")
+    print(f"  reduction    : {dict_bytes / record_bytes:8.2f}x")
@@ -0,0 +1,72 @@
+"""
+Regression check for the deterministic order entity extractor.
+
+Runs shopper messages through extract_entities and the resolvers and compares
+the slots with the expected ones. Exits non-zero on any mismatch.
+
+Usage:
+    python _check_entity_extractor.py
+"""
+
+import sys
+
+from entity_extractor import extract_entities, order_reference, resolve_order_creation, resolve_order_status
+
+# (message, expected subset of resolve_order_creation's result)
+ORDER_CREATION_CASES = [
+    ("I want to buy variant 42910880890963, email me at a@b.com",
+     {"variant_id": 42910880890963, "email": "a@b.com", "quantity": None, "needs_more_info": False, "ambiguous": False}),
+    # "order" is the verb here, not an order ID label
+    ("I want to order 42910880890963 x2, a@b.com",
+     {"variant_id": 42910880890963, "email": "a@b.com", "quantity": 2, "needs_more_info": False, "ambiguous": False}),
+    ("purchase 2 units of 42910880890963",
+     {"variant_id": 42910880890963, "email": None, "quantity": 2, "needs_more_info": True, "ambiguous": False}),
+    ("buy variant 42910880890963 and variant 42910880890964 for sam@example.com",
+     {"variant_id": None, "needs_more_info": True, "ambiguous": True}),
+    # A number word followed by the variant ID is still the quantity
+    ("buy two 42910880890963 for a@b.com",
+     {"variant_id": 42910880890963, "email": "a@b.com", "quantity": 2, "needs_more_info": False, "ambiguous": False}),
+]
+
+# (message, expected subset of resolve_order_status's result)
+ORDER_STATUS_CASES = [
+    ("track order 5904242344019", {"order_id": 5904242344019, "found": True, "ambiguous": False}),
+    ("status of gid://shopify/Order/5904242344019", {"order_id": 5904242344019, "found": True, "ambiguous": False}),
+    # Order numbers are not Shopify order IDs and are looked up by name
+    ("Where's my order #1042?", {"order_id": None, "order_number": 1042, "found": True, "ambiguous": False}),
+    ("order number 1001", {"order_id": None, "order_number": 1001, "found": True, "ambiguous": False}),
+    ("has my order been shipped", {"order_id": None, "found": False, "ambiguous": False}),
+    ("compare order 5904242344019 with order 5904242344020", {"order_id": None, "found": False, "ambiguous": True}),
+    # The labelled order number wins over a bare phone number, which stays ambiguous
+    ("my phone 9876543210 order 1002", {"order_id": None, "order_number": 1002, "found": True, "ambiguous": True}),
+]
+
+
+# (free-form reference from the LLM, expected order_reference result)
+ORDER_REFERENCE_CASES = [
+    ("5904242344019", {"order_id": 5904242344019}),
+    ("#1001", {"order_number": 1001}),
+    ("", {}),
+]
+
+
+def check(resolver, cases) -> int:
+    failures = 0
+    for message, expected in cases:
+        result = resolver(extract_entities(message))
+        mismatched = {key: (result.get(key), value) for key, value in expected.items() if result.get(key) != value}
+        if mismatched:
+            failures += 1
+            print(f"FAIL {message!r}: " + ", ".join(f"{k}={got!r} (expected {want!r})" for k, (got, want) in mismatched.items()))
+    return failures
+
+
+if __name__ == "__main__":
+    failures = check(resolve_order_creation, ORDER_CREATION_CASES) + check(resolve_order_status, ORDER_STATUS_CASES)
+    for value, expected in ORDER_REFERENCE_CASES:
+        if order_reference(value) != expected:
+            failures += 1
+            print(f"FAIL order_reference({value!r}) = {order_reference(value)!r} (expected {expected!r})")
+    total = len(ORDER_CREATION_CASES) + len(ORDER_STATUS_CASES) + len(ORDER_REFERENCE_CASES)
+    print(f"{total - failures}/{total} cases passed")
+    sys.exit(1 if failures else 0)
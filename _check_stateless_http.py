@@ -0,0 +1,110 @@
+"""
+Multi-process check for the stateless streamable-HTTP MCP mode.
+
+Starts several independent `uvicorn shopify_mcp_server:app` processes with
+MCP_STATELESS_HTTP=true and sends every JSON-RPC request of one logical MCP
+conversation to a different process (round-robin, like a load balancer without
+sticky sessions). Every request must succeed on whichever instance receives it.
+Then measures tool-call throughput against 1..N instances.
+
+Usage:
+    python _check_stateless_http.py [instances] [requests]
+"""
+
+import asyncio, json, os, socket, subprocess, sys, time
+import httpx
+
+HEADERS = {"Accept": "application/json, text/event-stream", "Content-Type": "application/json"}
+MCP_PATH = "/mcp/mcp"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_instance(port: int) -> subprocess.Popen:
+    env = dict(os.environ, MCP_STATELESS_HTTP="true", USE_DUMMY_RESPONSES="true", SHOPIFY_ACCESS_TOKEN="")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "shopify_mcp_server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, base: str):
+    for _ in range(100):
+        try:
+            if (await client.get(f"{base}/api/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"{base} did not start")
+
+
+def parse_rpc(response: httpx.Response) -> dict:
+    """Extract the JSON-RPC message from a JSON or SSE response body."""
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        for line in response.text.splitlines():
+            if line.startswith("data:"):
+                return json.loads(line[5:])
+        raise ValueError("No data in SSE response")
+    return response.json()
+
+
+async def rpc(client: httpx.AsyncClient, base: str, msg_id: int | None, method: str, params: dict | None = None) -> dict | None:
+    body = {"jsonrpc": "2.0", "method": method, "params": params or {}}
+    if msg_id is not None:
+        body["id"] = msg_id
+    response = await client.post(f"{base}{MCP_PATH}", json=body, headers=HEADERS)
+    response.raise_for_status()
+    return parse_rpc(response) if msg_id is not None else None
+
+
+async def main(instances: int, total_requests: int):
+    ports = [free_port() for _ in range(instances)]
+    procs = [start_instance(p) for p in ports]
+    bases = [f"http://127.0.0.1:{p}" for p in ports]
+    try:
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            await asyncio.gather(*(wait_ready(client, b) for b in bases))
+
+            # One conversation, every step on a different instance
+            init = await rpc(client, bases[0], 1, "initialize", {
+                "protocolVersion": "2025-03-26",
+                "capabilities": {},
+                "clientInfo": {"name": "stateless-check", "version": "1.0"}
+            })
+            assert "result" in init, init
+            await rpc(client, bases[1 % instances], None, "notifications/initialized")
+            tools = await rpc(client, bases[2 % instances], 2, "tools/list")
+            names = [t["name"] for t in tools["result"]["tools"]]
+            assert "get_order_status" in names, names
+            for i, base in enumerate(bases):
+                call = await rpc(client, base, 10 + i, "tools/call", {"name": "get_order_status", "arguments": {"order_id": 1000 + i}})
+                payload = json.loads(call["result"]["content"][0]["text"])
+                assert payload["order_id"] == 1000 + i, payload
+            print(f"OK: one MCP conversation served across {instances} processes without session affinity")
+
+            # Throughput: same load spread over 1..N instances
+            for n in range(1, instances + 1):
+                start = time.perf_counter()
+                await asyncio.gather(*(
+                    rpc(client, bases[i % n], 100 + i, "tools/call", {"name": "get_order_status", "arguments": {"order_id": i}})
+                    for i in range(total_requests)
+                ))
+                elapsed = time.perf_counter() - start
+                print(f"{n} instance(s): {total_requests / elapsed:8.1f} tool calls/s")
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 3,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    ))
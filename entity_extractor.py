@@ -0,0 +1,150 @@
+"""
+Deterministic entity extraction for order turns.
+
+Compiled patterns pull Shopify order IDs, order numbers (#1001), customer
+emails, variant IDs and quantities out of a shopper message. The resolvers
+turn those into the slots the order nodes need and report whether the result
+is ambiguous (conflicting candidates or unexplained numbers); the agent only
+asks the LLM in that case.
+"""
+
+import re
+
+EMAIL = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+ORDER_GID = re.compile(r"gid://shopify/Order/(\d+)")
+VARIANT_GID = re.compile(r"gid://shopify/ProductVariant/(\d+)")
+# "order 5904242344019", "order id: 5904242344019", "order #1001", "order no. 1001"
+LABELLED_ORDER = re.compile(r"\border\s*(?:id|number|num|no\.?)?\s*(?:is|:|=)?\s*#?\s*(\d{3,})\b", re.IGNORECASE)
+LABELLED_VARIANT = re.compile(r"\bvariant\s*(?:id)?\s*(?:is|:|=)?\s*#?\s*(\d{6,})\b", re.IGNORECASE)
+ORDER_NUMBER = re.compile(r"#\s?(\d{3,})\b")
+LONG_NUMBER = re.compile(r"\b(\d{8,16})\b")
+ANY_NUMBER = re.compile(r"\d{4,}")
+
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+_QTY = r"(\d{1,3}|" + "|".join(NUMBER_WORDS) + r")"
+QUANTITY_PATTERNS = [
+    re.compile(r"\b(?:qty|quantity)\s*(?:of|is|:|=)?\s*" + _QTY + r"\b", re.IGNORECASE),
+    re.compile(r"\b" + _QTY + r"\s*(?:x|pcs|pieces|units?|items?|qty|of)\b", re.IGNORECASE),
+    re.compile(r"\bx\s*(\d{1,3})\b", re.IGNORECASE),
+    # "buy two 42910880890963" is a quantity; "order 100 250" (a split number) is not
+    re.compile(r"\b(?:buy|order|purchase|get|take)\s+" + _QTY + r"\b(?!\s*(?:@|\d{1,7}\b))", re.IGNORECASE),
+]
+
+# Order IDs at or above this many digits are Shopify IDs; shorter labelled numbers are order numbers
+ORDER_ID_MIN_DIGITS = 8
+
+
+def _overlaps(span: tuple[int, int], taken: list[tuple[int, int]]) -> bool:
+    return any(span[0] < end and start < span[1] for start, end in taken)
+
+
+def extract_entities(message: str) -> dict:
+    """All candidate entities in a message.
+
+    Returns:
+        dict with order_ids, order_numbers, variant_ids, unlabelled_ids (long
+        numbers with no order/variant label), emails (lists, in order of
+        appearance, de-duplicated), quantity (int or None) and
+        unexplained_numbers (digit runs of 4+ not covered by any entity).
+    """
+    taken: list[tuple[int, int]] = []
+    entities = {"order_ids": [], "order_numbers": [], "variant_ids": [], "unlabelled_ids": [], "emails": []}
+
+    def add(key: str, value, span: tuple[int, int]):
+        taken.append(span)
+        if value not in entities[key]:
+            entities[key].append(value)
+
+    for m in EMAIL.finditer(message):
+        add("emails", m.group(0).lower(), m.span())
+    for m in ORDER_GID.finditer(message):
+        add("order_ids", int(m.group(1)), m.span())
+    for m in VARIANT_GID.finditer(message):
+        add("variant_ids", int(m.group(1)), m.span())
+    for m in LABELLED_VARIANT.finditer(message):
+        if not _overlaps(m.span(), taken):
+            add("variant_ids", int(m.group(1)), m.span())
+    for m in LABELLED_ORDER.finditer(message):
+        if not _overlaps(m.span(), taken):
+            digits = m.group(1)
+            add("order_ids" if len(digits) >= ORDER_ID_MIN_DIGITS else "order_numbers", int(digits), m.span())
+    for m in ORDER_NUMBER.finditer(message):
+        if not _overlaps(m.span(), taken):
+            add("order_numbers", int(m.group(1)), m.span())
+    for m in LONG_NUMBER.finditer(message):
+        if not _overlaps(m.span(), taken):
+            add("unlabelled_ids", int(m.group(1)), m.span())
+
+    quantity = None
+    for pattern in QUANTITY_PATTERNS:
+        for m in pattern.finditer(message):
+            if _overlaps(m.span(1), taken):
+                continue
+            raw = m.group(1).lower()
+            quantity = NUMBER_WORDS.get(raw) or int(raw)
+            taken.append(m.span(1))
+            break
+        if quantity is not None:
+            break
+
+    entities["quantity"] = quantity if quantity and quantity > 0 else None
+    entities["unexplained_numbers"] = [m.group(0) for m in ANY_NUMBER.finditer(message) if not _overlaps(m.span(), taken)]
+    return entities
+
+
+def order_reference(value) -> dict:
+    """Split a free-form order reference into {"order_id": ...} or {"order_number": ...}.
+
+    Shopify order IDs are long numeric IDs; shorter numbers are shop-facing
+    order numbers (#1001) and must be looked up by name, never passed as an ID.
+    Returns {} when the value holds no digits.
+    """
+    digits = re.sub(r"\D", "", str(value or ""))
+    if not digits:
+        return {}
+    return {"order_id" if len(digits) >= ORDER_ID_MIN_DIGITS else "order_number": int(digits)}
+
+
+def resolve_order_status(entities: dict) -> dict:
+    """Slots for get_order_status: order_id or order_number, found, ambiguous
+
+    Labelled references ("order 1002", "#1001", order GIDs) win over bare long
+    numbers, which may be phone numbers or other IDs; a bare number next to a
+    labelled reference still marks the result ambiguous.
+    """
+    unexplained = bool(entities["unexplained_numbers"])
+    if entities["order_ids"] or entities["order_numbers"]:
+        ids, numbers = entities["order_ids"], entities["order_numbers"]
+        unexplained = unexplained or bool(entities["unlabelled_ids"])
+    else:
+        ids, numbers = entities["unlabelled_ids"], []
+    if len(ids) == 1:
+        return {"order_id": ids[0], "order_number": None, "found": True, "ambiguous": unexplained}
+    if len(ids) > 1:
+        return {"order_id": None, "order_number": None, "found": False, "ambiguous": True}
+    if len(numbers) == 1:
+        return {"order_id": None, "order_number": numbers[0], "found": True, "ambiguous": unexplained}
+    ambiguous = len(numbers) > 1 or unexplained
+    return {"order_id": None, "order_number": None, "found": False, "ambiguous": ambiguous}
+
+
+def resolve_order_creation(entities: dict) -> dict:
+    """Slots for create_order: variant_id, email, quantity (None when not stated), needs_more_info, ambiguous"""
+    variants = entities["variant_ids"]
+    ambiguous = False
+    if not variants:
+        # A bare long number in a purchase message is most likely the variant; so is
+        # "order 42910880890963", where "order" is the verb rather than a label
+        variants = entities["unlabelled_ids"] or entities["order_ids"]
+    elif entities["unlabelled_ids"]:
+        ambiguous = True
+    variant_id = variants[0] if len(variants) == 1 else None
+    email = entities["emails"][0] if len(entities["emails"]) == 1 else None
+    ambiguous = ambiguous or len(variants) > 1 or len(entities["emails"]) > 1 or bool(entities["unexplained_numbers"])
+    return {
+        "variant_id": variant_id,
+        "email": email,
+        "quantity": entities["quantity"],
+        "needs_more_info": variant_id is None or email is None,
+        "ambiguous": ambiguous
+    }
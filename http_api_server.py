@@ -3,11 +3,12 @@ HTTP REST API Server for MCP Tools
 Exposes MCP server tools as REST endpoints for cross-application use
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import asyncio
-from typing import List, Optional
+from typing import List, Literal, Optional
 import json
 import uvicorn
 import os
@@ -17,7 +18,11 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Import MCP tools
-from shopify_mcp_server import create_order, get_order_status
+from shopify_mcp_server import create_order, get_order_status, compute_order_etag, build_json_response
+
+# Batch limits: operations run concurrently up to BATCH_MAX_CONCURRENCY
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", "100"))
 
 app = FastAPI(
     title="Shopify MCP Server HTTP API",
@@ -55,6 +60,24 @@ class OrderResponse(BaseModel):
     data: dict
     error: Optional[str] = None
 
+class BatchOperation(BaseModel):
+    operation: Literal["create_order", "get_order_status"]
+    # get_order_status
+    order_id: Optional[int] = None
+    # create_order
+    line_items: Optional[List[LineItem]] = None
+    customer_email: Optional[str] = None
+    financial_status: str = "paid"
+    test: bool = True
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation]
+    max_concurrency: Optional[int] = None
+
+class BatchResult(OrderResponse):
+    index: int
+    operation: str
+
 # Health check endpoint
 @app.get("/")
 async def root():
@@ -64,6 +87,7 @@ async def root():
         "endpoints": {
             "create_order": "/api/orders/create",
             "get_order_status": "/api/orders/status",
+            "batch": "/api/batch",
             "health": "/health"
         }
     }
@@ -123,10 +147,13 @@ async def create_order_endpoint(request: CreateOrderRequest):
 
 # Get Order Status Endpoint
 @app.post("/api/orders/status", response_model=OrderResponse)
-async def get_order_status_endpoint(request: GetOrderStatusRequest):
+async def get_order_status_endpoint(request: GetOrderStatusRequest, http_request: Request):
     """
     Get status of a Shopify order
     
+    Supports conditional requests: send the previous ETag in If-None-Match
+    to get 304 Not Modified when the order has not changed.
+    
     Example request:
     ```json
     {
@@ -141,10 +168,15 @@ async def get_order_status_endpoint(request: GetOrderStatusRequest):
         # Parse JSON response
         result = json.loads(result_json)
         
-        return OrderResponse(
+        response = OrderResponse(
             success=True,
             data=result
         )
+        return build_json_response(
+            http_request,
+            response.model_dump(),
+            etag=compute_order_etag(result)
+        )
     except Exception as e:
         return OrderResponse(
             success=False,
@@ -152,6 +184,82 @@ async def get_order_status_endpoint(request: GetOrderStatusRequest):
             error=str(e)
         )
 
+# Batch Endpoint
+async def _run_batch_operation(index: int, op: BatchOperation, semaphore: asyncio.Semaphore) -> BatchResult:
+    """Run one batch operation under the batch's concurrency limit"""
+    async with semaphore:
+        try:
+            if op.operation == "create_order":
+                if not op.line_items or not op.customer_email:
+                    raise ValueError("create_order requires line_items and customer_email")
+                result_json = await create_order(
+                    line_items=[item.model_dump() for item in op.line_items],
+                    customer_email=op.customer_email,
+                    financial_status=op.financial_status,
+                    test=op.test
+                )
+            else:
+                if op.order_id is None:
+                    raise ValueError("get_order_status requires order_id")
+                result_json = await get_order_status(order_id=op.order_id)
+            
+            return BatchResult(index=index, operation=op.operation, success=True, data=json.loads(result_json))
+        except Exception as e:
+            return BatchResult(index=index, operation=op.operation, success=False, data={}, error=str(e))
+
+@app.post("/api/batch")
+async def batch_endpoint(request: BatchRequest, http_request: Request):
+    """
+    Run several create_order / get_order_status operations in one request
+    
+    Operations run concurrently (at most max_concurrency at a time, capped by
+    BATCH_MAX_CONCURRENCY). By default the response is a JSON array of results
+    in request order. With `Accept: application/x-ndjson` each result is
+    streamed as one NDJSON line as soon as it completes; use `index` to match
+    results to operations.
+    
+    Example request:
+    ```json
+    {
+        "operations": [
+            {"operation": "get_order_status", "order_id": 12345},
+            {
+                "operation": "create_order",
+                "line_items": [{"variant_id": 12345, "quantity": 1}],
+                "customer_email": "customer@example.com"
+            }
+        ],
+        "max_concurrency": 4
+    }
+    ```
+    """
+    if not request.operations:
+        raise HTTPException(status_code=400, detail="No operations provided")
+    if len(request.operations) > BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_OPERATIONS} operations per batch")
+    
+    concurrency = min(request.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    tasks = [
+        asyncio.create_task(_run_batch_operation(i, op, semaphore))
+        for i, op in enumerate(request.operations)
+    ]
+    
+    if "application/x-ndjson" in http_request.headers.get("accept", ""):
+        async def stream_results():
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    result = await next_done
+                    yield result.model_dump_json() + "\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+        
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+    
+    results = await asyncio.gather(*tasks)
+    return build_json_response(http_request, [result.model_dump() for result in results])
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     uvicorn.run(
@@ -0,0 +1,235 @@
+"""
+Tiered intent classifier for the shopping agent.
+
+Messages are classified by the cheapest tier that is confident enough:
+
+1. Rules: compiled regex/keyword patterns with per-rule confidence weights
+   (microseconds, no I/O).
+2. Nearest centroid: cosine similarity between the message embedding and the
+   mean embedding of labelled examples per intent (one cached query embedding).
+3. LLM: an async callable (Gemini in the agent), only when both local tiers
+   are unsure.
+
+If the LLM tier fails, the best local guess is used. Thresholds are set via
+INTENT_RULE_THRESHOLD / INTENT_CENTROID_THRESHOLD; `_bench_intent.py`
+measures accuracy versus latency for each tier combination.
+"""
+
+import os
+import re
+import threading
+import time
+from typing import Awaitable, Callable
+
+import numpy as np
+
+INTENTS = ("product_search", "order_creation", "order_status", "info_search")
+
+# Minimum confidence for the rule tier to answer without consulting later tiers
+INTENT_RULE_THRESHOLD = float(os.getenv("INTENT_RULE_THRESHOLD", "0.8"))
+# Minimum softmax probability for the nearest-centroid tier
+INTENT_CENTROID_THRESHOLD = float(os.getenv("INTENT_CENTROID_THRESHOLD", "0.7"))
+# Softmax temperature over centroid cosine similarities (embeddings cluster tightly)
+INTENT_CENTROID_TEMPERATURE = float(os.getenv("INTENT_CENTROID_TEMPERATURE", "0.02"))
+
+# === RULE TIER ===
+# (intent, pattern, weight): weights of matching rules combine as 1 - prod(1 - w)
+INTENT_RULES = [
+    ("order_status", r"\b(track|tracking|trace)\b", 0.85),
+    ("order_status", r"\b(status|update)\b.{0,30}\border\b|\border\b.{0,30}\b(status|update)\b", 0.9),
+    ("order_status", r"\bwhere('?s| is)\b.{0,15}\b(my|the)\b.{0,15}\b(order|package|parcel|delivery|shipment)\b", 0.95),
+    ("order_status", r"\b(has|was|is)\b.{0,10}\b(my|the)\b.{0,10}\border\b.{0,20}\b(shipped|dispatched|delivered|arriv\w*)\b", 0.9),
+    ("order_status", r"\border\s*(id|number|no\.?)?\s*[:#]?\s*#?\d{4,}\b", 0.6),
+    ("order_status", r"\b(my|the)\s+(delivery|parcel|package|shipment)\b|\bwhen will\b.{0,30}\b(arrive|be delivered|ship)\b", 0.85),
+    ("order_creation", r"\b(buy|purchase|checkout|check out|add to (my )?cart)\b", 0.85),
+    ("order_creation", r"\b(place|create|make)\b.{0,10}\border\b", 0.9),
+    ("order_creation", r"\b(want|would like|'d like|wish)\b.{0,5}\bto (order|get)\b", 0.8),
+    ("order_creation", r"\bvariant\b.{0,10}\d{6,}", 0.7),
+    ("order_creation", r"\bquantity\b|\b\d+\s*(pcs|pieces|units|qty)\b", 0.5),
+    ("info_search", r"\b(return|refund|exchange|cancellation|shipping|privacy)\b.{0,15}\bpolic(y|ies)\b", 0.95),
+    ("info_search", r"\bhow (do|can|would) i\b.{0,10}\b(return|exchange|get a refund|contact|reach)\b", 0.9),
+    ("info_search", r"\b(contact|customer (care|service|support)|support (team|email)|phone number|helpline|your (address|email|phone)|reach you)\b", 0.9),
+    ("info_search", r"\b(offers?|discounts?|coupons?|promo(tion)?s?|promo codes?|deals?)\b", 0.75),
+    ("info_search", r"\b(membership|loyalty|rewards?|store hours|opening hours|about (cnx|your (store|company|brand)))\b", 0.85),
+    ("info_search", r"\b(refund|return|exchange)\b", 0.6),
+    ("product_search", r"\b(show me|looking for|do you (have|sell|carry)|search for|find me|browse|recommend)\b", 0.85),
+    ("product_search", r"\b(t-?shirts?|shirts?|dress(es)?|jeans|jackets?|shoes|sneakers|kurtas?|tops?|skirts?|hoodies?|trousers|pants|sarees?|bags?)\b", 0.6),
+    ("product_search", r"\b(under|below|less than|between)\s*(rs\.?|inr|usd|\$|₹)?\s*\d+", 0.7),
+    ("product_search", r"\b(in stock|available in|sizes?|colou?rs?)\b", 0.5),
+]
+
+
+class RuleIntentClassifier:
+    """Weighted regex rules; confidence is the top score discounted by the runner-up."""
+
+    def __init__(self, rules=INTENT_RULES):
+        self.rules = [(intent, re.compile(pattern, re.IGNORECASE), weight) for intent, pattern, weight in rules]
+
+    def scores(self, message: str) -> dict[str, float]:
+        misses = {intent: 1.0 for intent in INTENTS}
+        for intent, pattern, weight in self.rules:
+            if pattern.search(message):
+                misses[intent] *= 1.0 - weight
+        return {intent: 1.0 - miss for intent, miss in misses.items()}
+
+    def classify(self, message: str) -> tuple[str | None, float]:
+        ranked = sorted(self.scores(message).items(), key=lambda item: item[1], reverse=True)
+        (best, top), (_, second) = ranked[0], ranked[1]
+        if top == 0.0:
+            return None, 0.0
+        return best, max(0.0, top - 0.5 * second)
+
+
+# === NEAREST-CENTROID TIER ===
+# Labelled examples per intent; their mean embeddings are the centroids
+INTENT_EXAMPLES = {
+    "product_search": [
+        "Show me floral shirts",
+        "Do you have black jeans in size 32?",
+        "I'm looking for a summer dress under 2000",
+        "Any cotton kurtas available?",
+        "Find me running shoes",
+        "What jackets do you sell?",
+        "Striped t-shirts for men",
+        "Do you have this top in red?",
+        "Recommend something for a wedding",
+        "Show me new arrivals",
+    ],
+    "order_creation": [
+        "I want to buy this product",
+        "Place an order for variant 42910880890963",
+        "Buy 2 of variant 42910880890963, my email is test@example.com",
+        "I'd like to purchase the blue shirt",
+        "Add this to my cart and check out",
+        "Order one of these for me",
+        "Please create an order with quantity 3",
+        "I'll take it, how do I pay?",
+        "Purchase variant 123456789 for jane@example.com",
+        "Can you order this in medium for me?",
+    ],
+    "order_status": [
+        "What's the status of order 5904242344019?",
+        "Track my order",
+        "Where is my package?",
+        "Has my order shipped yet?",
+        "When will order #1001 arrive?",
+        "Check order 5904242344019",
+        "Is my order delivered?",
+        "I need a tracking number for my order",
+        "My order hasn't arrived",
+        "Give me an update on my purchase",
+    ],
+    "info_search": [
+        "What is your return policy?",
+        "How can I contact support?",
+        "Any offers or discounts right now?",
+        "What are your store hours?",
+        "Tell me about CNXStore",
+        "How do I exchange an item?",
+        "Do you have a loyalty program?",
+        "What is your phone number?",
+        "How long do refunds take?",
+        "What membership benefits do you offer?",
+    ],
+}
+
+
+class CentroidIntentClassifier:
+    """Nearest centroid over sentence embeddings of labelled examples.
+
+    The embedder is supplied lazily (any object with `embed_documents` and
+    `embed_query`, e.g. the agent's cached e5 embeddings); centroids are built
+    once per embedder. Confidence is the softmax probability of the nearest
+    centroid at INTENT_CENTROID_TEMPERATURE.
+    """
+
+    def __init__(self, embedder_provider: Callable[[], object | None], examples: dict[str, list[str]] = INTENT_EXAMPLES,
+                 temperature: float = INTENT_CENTROID_TEMPERATURE):
+        self.embedder_provider = embedder_provider
+        self.examples = examples
+        self.temperature = temperature
+        self._lock = threading.Lock()
+        self._embedder = None
+        self._labels: list[str] = []
+        self._centroids: np.ndarray | None = None
+
+    @staticmethod
+    def _unit(vectors) -> np.ndarray:
+        v = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(v, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return v / norms
+
+    def _ensure_centroids(self, embedder):
+        with self._lock:
+            if self._embedder is embedder and self._centroids is not None:
+                return
+            labels, centroids = [], []
+            for intent, texts in self.examples.items():
+                labels.append(intent)
+                centroids.append(self._unit(embedder.embed_documents(texts)).mean(axis=0))
+            self._labels, self._centroids, self._embedder = labels, self._unit(centroids), embedder
+
+    def classify(self, message: str) -> tuple[str | None, float]:
+        """Blocking (embeds the message); returns (None, 0.0) when no embedder is available"""
+        embedder = self.embedder_provider()
+        if embedder is None:
+            return None, 0.0
+        self._ensure_centroids(embedder)
+        scores = self._centroids @ self._unit(embedder.embed_query(message))
+        probs = np.exp((scores - scores.max()) / self.temperature)
+        probs /= probs.sum()
+        best = int(np.argmax(probs))
+        return self._labels[best], float(probs[best])
+
+
+# === TIERED CLASSIFIER ===
+class TieredIntentClassifier:
+    """Rules, then nearest centroid, then the LLM; each tier answers only when confident.
+
+    `classify_local` runs the local tiers (blocking, CPU only). `classify`
+    adds the async LLM tier: `llm(message)` returns `(intent, confidence,
+    details)` or None on failure. Results are dicts with intent, confidence, tier and
+    details.
+    """
+
+    def __init__(self, rules: RuleIntentClassifier | None = None, centroid: CentroidIntentClassifier | None = None,
+                 rule_threshold: float = INTENT_RULE_THRESHOLD, centroid_threshold: float = INTENT_CENTROID_THRESHOLD):
+        self.rules = rules or RuleIntentClassifier()
+        self.centroid = centroid
+        self.rule_threshold = rule_threshold
+        self.centroid_threshold = centroid_threshold
+
+    def classify_local(self, message: str) -> dict:
+        """Best local decision; `confident` tells whether the LLM tier can be skipped"""
+        started = time.perf_counter()
+        intent, confidence = self.rules.classify(message)
+        best = {"intent": intent, "confidence": confidence, "tier": "rules",
+                "confident": intent is not None and confidence >= self.rule_threshold}
+        if not best["confident"] and self.centroid is not None:
+            try:
+                c_intent, c_confidence = self.centroid.classify(message)
+            except Exception as e:
+                print(f"[intent] centroid tier failed: {e}")
+                c_intent, c_confidence = None, 0.0
+            if c_intent is not None and (c_confidence >= self.centroid_threshold or best["intent"] is None):
+                best = {"intent": c_intent, "confidence": c_confidence, "tier": "centroid",
+                        "confident": c_confidence >= self.centroid_threshold}
+        best["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return best
+
+    async def classify(self, message: str, llm: Callable[[str], Awaitable[tuple[str, float | None, dict] | None]] | None = None,
+                       local: dict | None = None) -> dict:
+        """Full tiered decision; pass `local` when classify_local already ran (e.g. in a worker thread)"""
+        local = local or self.classify_local(message)
+        decision = {"intent": local["intent"], "confidence": local["confidence"], "tier": local["tier"], "details": {}}
+        if local["confident"] or llm is None:
+            decision["intent"] = decision["intent"] or "product_search"
+            return decision
+        llm_result = await llm(message)
+        if llm_result and llm_result[0] in INTENTS:
+            intent, confidence, details = llm_result
+            return {"intent": intent, "confidence": confidence, "tier": "llm", "details": details or {}}
+        # LLM unavailable: fall back to the best local guess
+        decision["intent"] = decision["intent"] or "product_search"
+        return decision
@@ -2,15 +2,32 @@ import os
 import json
 import re
 import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import functools
+import hashlib
+import threading
+import time
+import weakref
+import sqlite3
 import requests
+from array import array
+from datetime import datetime
+from collections import OrderedDict
+import numpy as np
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, END, START
 import google.generativeai as genai
 from langchain_pinecone import PineconeVectorStore
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain.chains import RetrievalQA
 from pinecone import Pinecone
+from local_vector_index import LOCAL_INDEX_DIR, LocalVectorIndex, LocalVectorStore
+from intent_classifier import INTENTS, CentroidIntentClassifier, TieredIntentClassifier
+from entity_extractor import extract_entities, order_reference, resolve_order_creation, resolve_order_status
 from dotenv import load_dotenv
 
 # === ENV CONFIG ===
@@ -20,22 +37,286 @@ PRODUCT_SEARCH_MCP_URL = "https://n5ycpj-wu.myshopify.com/api/mcp"
 # MCP Server deployed on Render (Streamable HTTP transport)
 ORDER_MCP_URL = os.getenv("ORDER_MCP_URL", "https://cnx-demo-mcp-server-wmck.onrender.com/mcp")
 USE_LOCAL_MCP = os.getenv("USE_LOCAL_MCP", "false").lower() in ("true", "1", "yes")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-3-flash-preview")
+# Maximum in-flight Gemini requests across all workflow nodes
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+
+# === STREAMING EVENTS ===
+# (loop, queue) of the streaming request being served, if any; copied into graph node tasks
+_agent_event_sink: contextvars.ContextVar = contextvars.ContextVar("agent_event_sink", default=None)
+
+def emit_agent_event(event: str, data: dict):
+    """Send a progress event to the streaming client of the current request (no-op otherwise)"""
+    sink = _agent_event_sink.get()
+    if sink is None:
+        return
+    loop, queue = sink
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        queue.put_nowait((event, data))
+    else:
+        # Emitted from a worker thread (e.g. the two-pass RAG path)
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+# === MCP CLIENT SESSION POOL ===
+# Initialized sessions kept open per MCP server URL
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+# Maximum in-flight tool calls per MCP server URL
+MCP_MAX_CONCURRENT_CALLS = int(os.getenv("MCP_MAX_CONCURRENT_CALLS", "8"))
+# Interval between pings of idle pooled sessions (0 disables health checks)
+MCP_HEALTH_CHECK_SECONDS = float(os.getenv("MCP_HEALTH_CHECK_SECONDS", "30"))
+MCP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("MCP_CONNECT_TIMEOUT_SECONDS", "15"))
+# Read-only tools that may be retried once on a fresh session after a transport failure
+MCP_IDEMPOTENT_TOOLS = {"get_order_status", "get_order_statuses", "search_shop_catalog"}
+# Error code the streamable HTTP client reports when the server no longer knows the session
+MCP_SESSION_TERMINATED_CODE = 32600
+
+class _PooledSession:
+    """One initialized MCP ClientSession owned by a background task.
+
+    The streamable HTTP transport runs inside task groups, so its context
+    managers must be entered and exited by the same task. The owner task keeps
+    them open until `close()` is called or the transport fails.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.session = None
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+        self.error: Exception | None = None
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def _run(self):
+        from mcp.client.streamable_http import streamablehttp_client
+        from mcp import ClientSession
+
+        try:
+            async with streamablehttp_client(self.url) as (read, write, _):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._closing.wait()
+        except Exception as e:
+            # Unwrap the task-group wrapper so the root cause shows up in errors
+            while isinstance(e, ExceptionGroup) and len(e.exceptions) == 1:
+                e = e.exceptions[0]
+            self.error = e
+        finally:
+            self.session = None
+            self._ready.set()
+
+    async def open(self):
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), MCP_CONNECT_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise ConnectionError(f"Timed out connecting to MCP server {self.url}")
+        if self.session is None:
+            raise ConnectionError(f"Could not connect to MCP server {self.url}: {self.error}")
+
+    async def ping(self, timeout: float = 5.0) -> bool:
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+    async def close(self):
+        self._closing.set()
+        if self._task is not None and not self._task.done():
+            try:
+                await asyncio.wait_for(self._task, 5.0)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+
+class MCPSessionPool:
+    """Long-lived pool of initialized MCP sessions for one server URL.
+
+    Sessions are opened lazily (up to `size`), calls go to the least busy live
+    session and at most `max_concurrency` calls run at once. A background task
+    pings idle sessions and drops the ones that stopped answering; dead sessions
+    are replaced on the next call. Calls rejected because the server dropped the
+    session, and read-only tools that hit a transport failure, are retried once
+    on a fresh session.
+    """
+
+    def __init__(self, url: str, size: int = MCP_POOL_SIZE, max_concurrency: int = MCP_MAX_CONCURRENT_CALLS):
+        self.url = url
+        self.size = max(1, size)
+        self._sessions: list[_PooledSession] = []
+        self._slots = asyncio.Semaphore(max(1, max_concurrency))
+        self._connect_lock = asyncio.Lock()
+        self._health_task: asyncio.Task | None = None
+
+    async def _discard(self, pooled: _PooledSession):
+        if pooled in self._sessions:
+            self._sessions.remove(pooled)
+        await pooled.close()
+
+    async def _acquire(self) -> _PooledSession:
+        async with self._connect_lock:
+            for pooled in [s for s in self._sessions if not s.alive]:
+                await self._discard(pooled)
+            busy = all(s.in_flight for s in self._sessions)
+            if not self._sessions or (busy and len(self._sessions) < self.size):
+                pooled = _PooledSession(self.url)
+                await pooled.open()
+                self._sessions.append(pooled)
+                if self._health_task is None and MCP_HEALTH_CHECK_SECONDS > 0:
+                    self._health_task = asyncio.create_task(self._health_loop())
+            return min(self._sessions, key=lambda s: s.in_flight)
+
+    async def call_tool(self, tool_name: str, arguments: dict):
+        """Call a tool on a pooled session and return the raw CallToolResult"""
+        from mcp.shared.exceptions import McpError
+
+        async with self._slots:
+            for attempt in range(2):
+                pooled = await self._acquire()
+                pooled.in_flight += 1
+                try:
+                    return await pooled.session.call_tool(tool_name, arguments)
+                except McpError as e:
+                    # Servers answer 404 for sessions they no longer know (restart, expiry);
+                    # the call never ran, so any tool may be retried on a new session
+                    if e.error.code != MCP_SESSION_TERMINATED_CODE:
+                        raise
+                    await self._discard(pooled)
+                    if attempt:
+                        raise
+                except Exception:
+                    await self._discard(pooled)
+                    if attempt or tool_name not in MCP_IDEMPOTENT_TOOLS:
+                        raise
+                finally:
+                    pooled.in_flight -= 1
+                    pooled.last_used = time.monotonic()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(MCP_HEALTH_CHECK_SECONDS)
+            for pooled in list(self._sessions):
+                if pooled.in_flight:
+                    continue
+                if not pooled.alive or not await pooled.ping():
+                    print(f"[MCP pool] Dropping unhealthy session to {self.url}: {pooled.error or 'ping failed'}")
+                    await self._discard(pooled)
+
+    async def aclose(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        sessions, self._sessions = self._sessions, []
+        await asyncio.gather(*(s.close() for s in sessions), return_exceptions=True)
+
+# event loop -> {url: MCPSessionPool}; asyncio primitives are bound to one loop
+_mcp_pools: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+def get_mcp_pool(url: str) -> MCPSessionPool:
+    """Return the session pool for `url` on the running event loop"""
+    pools = _mcp_pools.setdefault(asyncio.get_running_loop(), {})
+    if url not in pools:
+        pools[url] = MCPSessionPool(url)
+    return pools[url]
+
+async def aclose_mcp_pools():
+    """Close every pooled MCP session owned by the running event loop"""
+    pools = _mcp_pools.pop(asyncio.get_running_loop(), {})
+    await asyncio.gather(*(pool.aclose() for pool in pools.values()), return_exceptions=True)
+
+# === BACKGROUND EVENT LOOP BRIDGE ===
+class AsyncBridge:
+    """Persistent event loop on a daemon thread for synchronous callers.
+
+    Sync entry points submit coroutines here instead of calling `asyncio.run`,
+    so loop-bound resources (MCP session pools, Gemini async models, the
+    Shopify HTTP client of the local tools) survive between calls. The loop
+    is started lazily and shut down at interpreter exit.
+    """
+
+    def __init__(self, name: str = "agent-async-bridge"):
+        self.name = name
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or not self._thread.is_alive():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._run_loop, args=(loop,), name=self.name, daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedule a coroutine on the bridge loop from any thread"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    def run(self, coro, timeout: float | None = None):
+        """Run a coroutine on the bridge loop and block until it finishes"""
+        if self._thread is threading.current_thread():
+            coro.close()
+            raise RuntimeError("AsyncBridge.run() called from the bridge loop; await the coroutine instead")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def stop(self, timeout: float = 5.0):
+        """Close pooled MCP sessions and stop the loop thread"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None or not thread.is_alive():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(aclose_mcp_pools(), loop).result(timeout)
+        except Exception as e:
+            print(f"[AsyncBridge] MCP session cleanup failed: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+
+
+async_bridge = AsyncBridge()
+atexit.register(async_bridge.stop)
 
 # === MCP SERVER INTEGRATION ===
-def call_mcp_server_local(tool_name: str, arguments: dict) -> dict:
+async def acall_mcp_server_local(tool_name: str, arguments: dict) -> dict:
     """Call local MCP server tools directly (for testing/development)"""
     try:
         # Import the tools directly from the local server
         import sys
-        import asyncio
         sys.path.insert(0, os.path.dirname(__file__))
         from shopify_mcp_server import create_order, get_order_status
         
-        # Run the async tool function
+        # Await the async tool function
         if tool_name == "create_order":
-            result = asyncio.run(create_order(**arguments))
+            result = await create_order(**arguments)
         elif tool_name == "get_order_status":
-            result = asyncio.run(get_order_status(**arguments))
+            result = await get_order_status(**arguments)
         else:
             return {"error": f"Unknown tool: {tool_name}"}
         
@@ -44,24 +325,37 @@ def call_mcp_server_local(tool_name: str, arguments: dict) -> dict:
     except Exception as e:
         return {"error": f"Local MCP call error: {str(e)}"}
 
+def call_mcp_server_local(tool_name: str, arguments: dict) -> dict:
+    """Synchronous wrapper around acall_mcp_server_local (runs on the shared bridge loop)"""
+    return async_bridge.run(acall_mcp_server_local(tool_name, arguments))
+
 async def call_mcp_server_remote(url: str, tool_name: str, arguments: dict) -> dict:
-    """Call remote MCP server using Streamable HTTP transport (MCP SDK)"""
+    """Call remote MCP server using Streamable HTTP transport (pooled, pre-initialized sessions)"""
     try:
-        from mcp.client.streamable_http import streamablehttp_client
-        from mcp import ClientSession
-
-        async with streamablehttp_client(url) as (read, write, _):
-            async with ClientSession(read, write) as session:
-                await session.initialize()
-                result = await session.call_tool(tool_name, arguments)
-                # Extract text content from MCP response
-                for content in result.content:
-                    if hasattr(content, 'text'):
-                        return json.loads(content.text)
-                return {"error": "No text content in MCP response"}
+        result = await get_mcp_pool(url).call_tool(tool_name, arguments)
+        # Extract text content from MCP response
+        for content in result.content:
+            if hasattr(content, 'text'):
+                return json.loads(content.text)
+        return {"error": "No text content in MCP response"}
     except Exception as e:
         return {"error": f"MCP server error: {str(e)}"}
 
+async def acall_mcp_server(url: str, tool_name: str, arguments: dict) -> dict:
+    """Async MCP server call for graph nodes (supports local and remote MCP servers)"""
+    emit_agent_event("tool_call", {"tool": tool_name, "server": "local" if USE_LOCAL_MCP else url})
+    started = time.perf_counter()
+    if USE_LOCAL_MCP:
+        result = await acall_mcp_server_local(tool_name, arguments)
+    else:
+        result = await call_mcp_server_remote(url, tool_name, arguments)
+    emit_agent_event("tool_result", {
+        "tool": tool_name,
+        "ok": not (isinstance(result, dict) and "error" in result),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    })
+    return result
+
 def call_mcp_server(url: str, tool_name: str, arguments: dict) -> dict:
     """Generic MCP server call function (supports local and remote MCP servers)"""
     
@@ -69,29 +363,69 @@ def call_mcp_server(url: str, tool_name: str, arguments: dict) -> dict:
     if USE_LOCAL_MCP:
         return call_mcp_server_local(tool_name, arguments)
     
-    # Use MCP SDK Streamable HTTP client for remote servers
-    try:
-        return asyncio.run(call_mcp_server_remote(url, tool_name, arguments))
-    except RuntimeError:
-        # If event loop is already running, use nest_asyncio or create new loop
-        loop = asyncio.new_event_loop()
-        try:
-            return loop.run_until_complete(call_mcp_server_remote(url, tool_name, arguments))
-        finally:
-            loop.close()
+    # Remote calls run on the bridge loop so pooled sessions are reused between calls
+    return async_bridge.run(call_mcp_server_remote(url, tool_name, arguments))
 
 # === LLM Setup using Google Generative AI directly ===
-def call_gemini_llm(prompt: str) -> str:
-    """Call Gemini LLM directly using google.generativeai"""
-    try:
-        if not GEMINI_API_KEY:
-            raise ValueError("GEMINI_API_KEY not set")
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel("gemini-3-flash-preview")
-        response = model.generate_content(prompt)
-        
-        # Extract text from response
-        text = getattr(response, "text", None)
+class GeminiClient:
+    """Shared Gemini client for all workflow nodes.
+
+    Configures the API key once and reuses GenerativeModel objects (and with
+    them the underlying transport channels) instead of rebuilding them per call.
+    Async calls go through `generate_content_async`; models are cached per event
+    loop because the async transport is bound to the loop that created it.
+    Concurrent calls are capped by `max_concurrency` on both the async and the
+    sync path.
+    """
+
+    def __init__(self, api_key: str, model_name: str, max_concurrency: int):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.max_concurrency = max(1, max_concurrency)
+        self._configured = False
+        self._lock = threading.Lock()
+        self._sync_models: dict[str, genai.GenerativeModel] = {}
+        self._sync_slots = threading.BoundedSemaphore(self.max_concurrency)
+        # event loop -> (semaphore, {model name: GenerativeModel})
+        self._loops: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def _configure(self):
+        if self._configured:
+            return
+        with self._lock:
+            if not self._configured:
+                if not self.api_key:
+                    raise ValueError("GEMINI_API_KEY not set")
+                genai.configure(api_key=self.api_key)
+                self._configured = True
+
+    def model(self, model_name: str | None = None) -> genai.GenerativeModel:
+        """Return the cached model for synchronous calls."""
+        self._configure()
+        name = model_name or self.model_name
+        with self._lock:
+            if name not in self._sync_models:
+                self._sync_models[name] = genai.GenerativeModel(name)
+            return self._sync_models[name]
+
+    def _loop_state(self, model_name: str) -> tuple[asyncio.Semaphore, genai.GenerativeModel]:
+        self._configure()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._loops:
+                self._loops[loop] = (asyncio.Semaphore(self.max_concurrency), {})
+            semaphore, models = self._loops[loop]
+            if model_name not in models:
+                models[model_name] = genai.GenerativeModel(model_name)
+            return semaphore, models[model_name]
+
+    @staticmethod
+    def extract_text(response) -> str:
+        """Extract text from a Gemini response, falling back to candidate parts"""
+        try:
+            text = getattr(response, "text", None)
+        except Exception:
+            text = None
         if not text and response and getattr(response, "candidates", None):
             try:
                 parts = []
@@ -102,8 +436,47 @@ def call_gemini_llm(prompt: str) -> str:
                 text = "\n".join(parts)
             except Exception:
                 text = None
-        
         return text or ""
+
+    def generate(self, prompt: str, model_name: str | None = None, generation_config: dict | None = None) -> str:
+        """Blocking generation with the shared model"""
+        model = self.model(model_name)
+        with self._sync_slots:
+            response = model.generate_content(prompt, generation_config=generation_config)
+        return self.extract_text(response)
+
+    async def agenerate(self, prompt: str, model_name: str | None = None, generation_config: dict | None = None) -> str:
+        """Non-blocking generation, limited to `max_concurrency` in-flight calls per loop"""
+        semaphore, model = self._loop_state(model_name or self.model_name)
+        async with semaphore:
+            response = await model.generate_content_async(prompt, generation_config=generation_config)
+        return self.extract_text(response)
+
+    async def astream(self, prompt: str, model_name: str | None = None, generation_config: dict | None = None):
+        """Yield response text chunks as Gemini produces them (holds one concurrency slot throughout)"""
+        semaphore, model = self._loop_state(model_name or self.model_name)
+        async with semaphore:
+            response = await model.generate_content_async(prompt, generation_config=generation_config, stream=True)
+            async for chunk in response:
+                text = self.extract_text(chunk)
+                if text:
+                    yield text
+
+
+gemini_client = GeminiClient(GEMINI_API_KEY, GEMINI_MODEL, GEMINI_MAX_CONCURRENCY)
+
+def call_gemini_llm(prompt: str) -> str:
+    """Call Gemini LLM directly using google.generativeai"""
+    try:
+        return gemini_client.generate(prompt)
+    except Exception as e:
+        print(f"Gemini LLM call failed: {e}")
+        return ""
+
+async def acall_gemini_llm(prompt: str) -> str:
+    """Call Gemini without blocking the event loop (shared async client, bounded concurrency)"""
+    try:
+        return await gemini_client.agenerate(prompt)
     except Exception as e:
         print(f"Gemini LLM call failed: {e}")
         return ""
@@ -113,6 +486,7 @@ class AgentState(TypedDict, total=False):
     user_message: str
     intent: str
     intent_details: dict
+    slots: dict
     products: dict
     order_result: dict
     order_status: dict
@@ -120,18 +494,100 @@ class AgentState(TypedDict, total=False):
     final_response: str
 
 # === INTENT ANALYSIS NODE ===
-def analyze_user_intent(state: AgentState):
-    """Analyze user message to determine intent: product_search, order_creation, order_status, or info_search"""
+# Embeddings for the nearest-centroid tier: reuse the RAG model once it is loaded
+# (RAG_PRELOAD loads it at startup) so intent detection never triggers the load itself
+INTENT_CENTROID_TIER = os.getenv("INTENT_CENTROID_TIER", "true").lower() in ("true", "1", "yes")
+
+intent_classifier = TieredIntentClassifier(
+    centroid=CentroidIntentClassifier(lambda: rag_resources.embeddings if rag_resources.ready else None)
+    if INTENT_CENTROID_TIER else None
+)
+
+async def analyze_user_intent(state: AgentState):
+    """Analyze user message to determine intent: product_search, order_creation, order_status, or info_search.
+
+    Local rule and nearest-centroid tiers answer confident cases; otherwise one structured
+    Gemini call returns the intent together with the slots the downstream nodes need.
+    """
+    message = state["user_message"]
+    local = await asyncio.to_thread(intent_classifier.classify_local, message)
+    decision = await intent_classifier.classify(message, llm=_llm_classify_intent, local=local)
+    print(f"[DEBUG] Intent {decision['intent']} via {decision['tier']} (confidence {decision['confidence']})")
+    details = dict(decision["details"])
+    slots = details.pop("slots", None) or {}
+    details.setdefault("classifier", {"tier": decision["tier"], "confidence": decision["confidence"]})
+    return {
+        "intent": decision["intent"],
+        "intent_details": details,
+        "slots": slots
+    }
+
+# Structured output schema for the fused intent + slot extraction call
+_NULLABLE_STRING = {"type": "STRING", "nullable": True}
+INTENT_SLOTS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "intent": {"type": "STRING", "format": "enum", "enum": list(INTENTS)},
+        "confidence": {"type": "NUMBER"},
+        "extracted_info": {"type": "STRING"},
+        "order_id": _NULLABLE_STRING,
+        "email": _NULLABLE_STRING,
+        "variant_id": _NULLABLE_STRING,
+        "quantity": {"type": "INTEGER", "nullable": True},
+        "search": {
+            "type": "OBJECT",
+            "nullable": True,
+            "properties": {
+                "query": {"type": "STRING"},
+                "price_min": {"type": "NUMBER", "nullable": True},
+                "price_max": {"type": "NUMBER", "nullable": True},
+                "availability": {"type": "BOOLEAN", "nullable": True},
+                "sizes": {"type": "ARRAY", "items": {"type": "STRING"}},
+                "colors": {"type": "ARRAY", "items": {"type": "STRING"}},
+                "design": {"type": "ARRAY", "items": {"type": "STRING"}}
+            },
+            "required": ["query"]
+        }
+    },
+    "required": ["intent", "confidence"]
+}
+INTENT_SLOTS_CONFIG = {"response_mime_type": "application/json", "response_schema": INTENT_SLOTS_SCHEMA}
+
+def _slot_id(value) -> int | None:
+    digits = re.sub(r"\D", "", str(value or ""))
+    return int(digits) if digits else None
+
+def _intent_slots(data: dict) -> dict:
+    """Normalize the fused call's slots: numeric IDs (order numbers kept apart), positive quantity,
+    search filters in llm_parse_query's shape"""
+    slots = {
+        "order_id": None,
+        "order_number": None,
+        **order_reference(data.get("order_id")),
+        "email": (data.get("email") or "").strip().lower() or None,
+        "variant_id": _slot_id(data.get("variant_id")),
+        "quantity": data.get("quantity") if isinstance(data.get("quantity"), int) and data["quantity"] > 0 else None
+    }
+    search = data.get("search") or {}
+    if search.get("query"):
+        filters = {key: search[key] for key in ("sizes", "colors", "design") if search.get(key)}
+        price = {bound: search[f"price_{bound}"] for bound in ("min", "max") if search.get(f"price_{bound}") is not None}
+        if price:
+            filters["price"] = price
+        if search.get("availability") is not None:
+            filters["availability"] = search["availability"]
+        slots["search"] = {"query": search["query"], "filters": filters}
+    return slots
+
+async def _llm_classify_intent(message: str) -> tuple[str, float | None, dict] | None:
+    """Gemini intent classification fused with slot extraction (one structured call).
+
+    Returns (intent, confidence, details) or None on failure; details["slots"]
+    holds order_id, email, variant_id, quantity and search filters.
+    """
     
     prompt = f"""
-    Analyze the user message and classify the intent. Return ONLY a JSON object with the following structure:
-    {{
-        "intent": "product_search" | "order_creation" | "order_status" | "info_search",
-        "confidence": 0.0-1.0,
-        "details": {{
-            "extracted_info": "relevant information extracted from the message"
-        }}
-    }}
+    Analyze the user message, classify the intent and extract every slot that is mentioned.
 
     Intent Classification Rules:
     - "product_search": User is looking for products, asking about availability, prices, or product information
@@ -139,50 +595,37 @@ def analyze_user_intent(state: AgentState):
     - "order_status": User wants to track/check order status, mentions order ID or tracking
     - "info_search": User is asking for business information such as return/exchange policy, contact details (phone/email/address), current offers/discounts/promotions
 
-    User Message: "{state["user_message"]}"
+    Slots (null when not mentioned, never guessed):
+    - order_id: the order ID or order number to look up, digits only
+    - email: the customer's email address
+    - variant_id: the product variant ID to order
+    - quantity: how many items to order
+    - search: for product searches only; query is the full search text including patterns,
+      plus price_min/price_max, availability, sizes, colors and design (pattern keywords such as floral, striped)
+
+    User Message: "{message}"
 
     Examples:
-    - "Show me floral shirts" -> product_search
-    - "I want to buy this product" -> order_creation  
-    - "What's the status of order 12345?" -> order_status
+    - "Show me floral shirts" -> product_search, search.query "floral shirts", search.design ["floral"]
+    - "I want to buy variant 42910880890963, email a@b.com" -> order_creation, variant_id "42910880890963", email "a@b.com"
+    - "What's the status of order 12345?" -> order_status, order_id "12345"
     - "Track my order" -> order_status
     - "What is your return policy?" -> info_search
     - "How can I contact support?" -> info_search
     - "Any offers or discounts right now?" -> info_search
-
-    Return ONLY the JSON object, no other text.
     """
     
-    result = call_gemini_llm(prompt)
-    
-    # Extract JSON from response
     try:
-        # Remove markdown formatting if present
-        cleaned = re.sub(r"```[a-zA-Z]*", "", result).strip("` \n")
-        json_match = re.search(r"\{.*\}", cleaned, re.DOTALL)
-        
-        if json_match:
-            intent_data = json.loads(json_match.group())
-            return {
-                "intent": intent_data.get("intent", "product_search"),
-                "intent_details": intent_data.get("details", {})
-            }
+        result = await gemini_client.agenerate(prompt, generation_config=INTENT_SLOTS_CONFIG)
+        intent_data = json.loads(result)
+        return (
+            intent_data.get("intent", "product_search"),
+            intent_data.get("confidence"),
+            {"extracted_info": intent_data.get("extracted_info", ""), "slots": _intent_slots(intent_data)}
+        )
     except Exception as e:
         print(f"Intent analysis error: {e}")
-    
-    # Fallback intent analysis
-    message_lower = state["user_message"].lower()
-    if any(word in message_lower for word in ["buy", "purchase", "order", "add to cart"]):
-        return {"intent": "order_creation", "intent_details": {}}
-    elif any(word in message_lower for word in ["track", "status", "order id", "tracking"]):
-        return {"intent": "order_status", "intent_details": {}}
-    elif any(word in message_lower for word in [
-        "return", "refund", "exchange", "contact", "phone", "email", "support", "address",
-        "offer", "discount", "sale", "promotion", "deal"
-    ]):
-        return {"intent": "info_search", "intent_details": {}}
-    else:
-        return {"intent": "product_search", "intent_details": {}}
+    return None
 
 # === PRODUCT SEARCH NODE ===
 # Context sent to MCP to guide server-side filtering
@@ -197,7 +640,7 @@ SEARCH_CONTEXT_TEMPLATE = (
     "- Include similar or related products when appropriate"
 )
 
-def llm_parse_query(user_query: str) -> dict:
+async def llm_parse_query(user_query: str) -> dict:
     """Extract structured shopping intent from user query"""
     prompt = (
         "Extract structured shopping intent from the following message and return STRICT JSON only. "
@@ -211,7 +654,7 @@ def llm_parse_query(user_query: str) -> dict:
         "Output JSON:"
     )
     try:
-        llm_out = call_gemini_llm(prompt)
+        llm_out = await acall_gemini_llm(prompt)
         if llm_out:
             start = llm_out.find('{')
             end = llm_out.rfind('}')
@@ -223,11 +666,11 @@ def llm_parse_query(user_query: str) -> dict:
     # fallback
     return {"query": user_query, "filters": {}}
 
-def product_search_node(state: AgentState):
+async def product_search_node(state: AgentState):
     """Handle product search requests using direct MCP calls with pre-filtering"""
     try:
-        # Step 1: Parse user query to extract structured filters
-        parsed = llm_parse_query(state["user_message"])
+        # Step 1: Structured filters (from the fused intent call when it ran, else a parse call)
+        parsed = (state.get("slots") or {}).get("search") or await llm_parse_query(state["user_message"])
         mcp_query = parsed.get("query", state["user_message"])
         context = SEARCH_CONTEXT_TEMPLATE.format(message=state["user_message"])
         
@@ -321,7 +764,7 @@ def product_search_node(state: AgentState):
         }
         
         # Step 3: Call MCP server with structured arguments
-        mcp_result = call_mcp_server(PRODUCT_SEARCH_MCP_URL, "search_shop_catalog", arguments)
+        mcp_result = await acall_mcp_server(PRODUCT_SEARCH_MCP_URL, "search_shop_catalog", arguments)
         
         # Extract products from MCP response
         raw_products = []
@@ -415,7 +858,7 @@ def product_search_node(state: AgentState):
         Return ONLY the filtered JSON with products that match ALL criteria, no other text.
         """
         
-        formatted_result = call_gemini_llm(filter_prompt)
+        formatted_result = await acall_gemini_llm(filter_prompt)
         
         # Extract JSON from LLM response
         try:
@@ -445,12 +888,127 @@ def product_search_node(state: AgentState):
             "final_response": json.dumps(error_response, indent=2)
         }
 
-# === ORDER CREATION NODE ===
-def order_creation_node(state: AgentState):
-    """Handle order creation requests"""
+# === ORDER RESPONSE FORMATTING ===
+# "template" maps MCP results into the response shapes directly; "llm" asks Gemini to format them (template on failure)
+ORDER_FORMAT_MODE = os.getenv("ORDER_FORMAT_MODE", "template").lower()
+
+ORDER_CREATED_MESSAGE = "Your order has been placed successfully! Use the ID: {id} to track your order status at any time."
+
+def _order_failed(raw_result: dict) -> bool:
+    return not isinstance(raw_result, dict) or "error" in raw_result or raw_result.get("success") is False
+
+def _order_amount(raw_result: dict) -> str:
+    return f"{raw_result.get('total_price')} {raw_result.get('currency') or 'INR'}"
+
+def _order_products(line_items: list[dict]) -> str | None:
+    titles = [item["title"] for item in line_items if item.get("title") and item.get("title") != "Product"]
+    return ", ".join(dict.fromkeys(titles)) or None
+
+def _order_date(timestamp: str | None) -> str | None:
+    """ISO 8601 timestamp from Shopify as YYYY-MM-DD HH:MM:SS (store-local, offset dropped)"""
+    if not timestamp:
+        return None
+    try:
+        return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return timestamp
+
+def format_order_created(raw_result: dict, variant_id: int | None = None) -> dict:
+    """create_order result in the order_created response shape; failures are returned unchanged"""
+    if _order_failed(raw_result):
+        return raw_result
+    product = _order_products(raw_result.get("line_items") or [])
+    if product is None and variant_id is not None:
+        product = f"Variant {variant_id}"
+    order_id = raw_result.get("order_id")
+    return {
+        "order_created": {
+            "id": str(order_id),
+            "order_id": str(raw_result.get("order_number")),
+            "product": product,
+            "total_paid": _order_amount(raw_result),
+            "message": ORDER_CREATED_MESSAGE.format(id=order_id)
+        }
+    }
+
+def format_order_status(raw_result: dict) -> dict:
+    """get_order_status result in the order status response shape; failures are returned unchanged"""
+    if _order_failed(raw_result):
+        return raw_result
+    line_items = raw_result.get("line_items") or []
+    return {
+        "order_id": raw_result.get("order_id"),
+        "order_number": f"#{raw_result.get('order_number')}",
+        "product": _order_products(line_items),
+        "quantity": sum(item.get("quantity") or 0 for item in line_items),
+        "total_paid": _order_amount(raw_result),
+        "status": "cancelled" if raw_result.get("cancelled_at") else raw_result.get("financial_status"),
+        "fulfillment_status": raw_result.get("fulfillment_status") or "Not yet shipped",
+        "order_date": _order_date(raw_result.get("created_at"))
+    }
+
+async def _llm_format(prompt: str, label: str) -> dict | None:
+    """Gemini formatting pass (ORDER_FORMAT_MODE=llm); None when no JSON comes back"""
     try:
-        # Extract order details from user message using LLM
-        prompt = f"""
+        formatted_result = await acall_gemini_llm(prompt)
+        cleaned = re.sub(r"```[a-zA-Z]*", "", formatted_result).strip("` \n")
+        json_match = re.search(r"\{.*\}", cleaned, re.DOTALL)
+        if json_match:
+            return json.loads(json_match.group())
+    except Exception as e:
+        print(f"{label} formatting error: {e}")
+    return None
+
+async def _llm_format_order_created(raw_result: dict) -> dict | None:
+    prompt = f"""
+    Format the order creation result into the exact JSON structure below:
+
+    Required JSON format:
+    {{
+      "order_created": {{
+        "id": "ORDER_ID",
+        "order_id": "ORDER_NUMBER",
+        "product": "PRODUCT_TITLE",
+        "total_paid": "AMOUNT INR",
+        "message": "Your order has been placed successfully! Use the ID: ORDER_ID to track your order status at any time."
+      }}
+    }}
+
+    Raw order result: {json.dumps(raw_result, indent=2)}
+
+    Extract the order ID, order number, product title, and total amount from the raw data.
+    Return ONLY the formatted JSON, no other text.
+    """
+    return await _llm_format(prompt, "Order")
+
+async def _llm_format_order_status(raw_result: dict) -> dict | None:
+    prompt = f"""
+    Format the order status result into the exact JSON structure below:
+
+    Required JSON format:
+    {{
+      "order_id": order_id_number,
+      "order_number": "#ORDER_NUMBER",
+      "product": "PRODUCT_NAME",
+      "quantity": quantity_number,
+      "total_paid": "AMOUNT INR",
+      "status": "STATUS",
+      "fulfillment_status": "FULFILLMENT_STATUS",
+      "order_date": "YYYY-MM-DD HH:MM:SS"
+    }}
+
+    Raw order status result: {json.dumps(raw_result, indent=2)}
+
+    Extract the order ID, order number, product name, quantity, total amount, status, fulfillment status, and order date from the raw data.
+    For fulfillment_status, use "Not yet shipped" if null or empty, otherwise use the actual status.
+    Return ONLY the formatted JSON, no other text.
+    """
+    return await _llm_format(prompt, "Order status")
+
+# === ORDER CREATION NODE ===
+async def _llm_extract_order_creation(message: str) -> dict | None:
+    """Gemini extraction of variant_id, email and quantity (used when the pattern extractor is ambiguous)"""
+    prompt = f"""
         Extract order information from the user message and return a JSON object:
         {{
             "variant_id": "extracted variant ID if mentioned",
@@ -459,89 +1017,82 @@ def order_creation_node(state: AgentState):
             "needs_more_info": true/false
         }}
 
-        User Message: "{state["user_message"]}"
+        User Message: "{message}"
 
         If variant_id or email is missing, set needs_more_info to true.
         Return ONLY the JSON object.
         """
-        
-        result = call_gemini_llm(prompt)
-        
-        # Parse extraction result
+    
+    result = await acall_gemini_llm(prompt)
+    cleaned = re.sub(r"```[a-zA-Z]*", "", result).strip("` \n")
+    json_match = re.search(r"\{.*\}", cleaned, re.DOTALL)
+    return json.loads(json_match.group()) if json_match else None
+
+def _merge_order_creation_slots(order_info: dict, slots: dict) -> dict:
+    """
+    Combine the pattern extractor's result with the fused intent call's slots.
+    
+    Unambiguous extracted values win and slots only fill the gaps; when the
+    extraction was ambiguous, every slot the intent call returned replaces
+    the extracted value, as the LLM read the whole message.
+    """
+    merged = dict(order_info)
+    for key in ("variant_id", "email", "quantity"):
+        if slots.get(key) is not None and (order_info.get("ambiguous") or merged.get(key) is None):
+            merged[key] = slots[key]
+    merged["needs_more_info"] = merged["variant_id"] is None or merged["email"] is None
+    merged["ambiguous"] = False
+    return merged
+
+async def order_creation_node(state: AgentState):
+    """Handle order creation requests"""
+    try:
+        # Parse extraction result: patterns first, then slots from the fused intent call, the LLM only as a last resort
         try:
-            cleaned = re.sub(r"```[a-zA-Z]*", "", result).strip("` \n")
-            json_match = re.search(r"\{.*\}", cleaned, re.DOTALL)
+            order_info = resolve_order_creation(extract_entities(state["user_message"]))
+            if order_info["ambiguous"] or order_info["needs_more_info"]:
+                slots = state.get("slots")
+                if slots:
+                    order_info = _merge_order_creation_slots(order_info, slots)
+                elif order_info["ambiguous"]:
+                    order_info = await _llm_extract_order_creation(state["user_message"])
             
-            if json_match:
-                order_info = json.loads(json_match.group())
-                
-                if order_info.get("needs_more_info", True):
-                    error_response = {"error": "Missing information. Please provide variant ID and email address to create an order."}
-                    return {
-                        "order_result": error_response,
-                        "final_response": json.dumps(error_response, indent=2)
-                    }
-                
-                # Create order payload for NEW MCP SDK server
-                # New signature: create_order(line_items, customer_email, financial_status, test)
-                order_payload = {
-                    "line_items": [{
-                        "variant_id": int(order_info["variant_id"]),
-                        "quantity": order_info.get("quantity", 1),
-                        "title": "Product",  # Will be filled by server
-                        "price": 0  # Will be filled by server
-                    }],
-                    "customer_email": order_info["email"],
-                    "financial_status": "paid",
-                    "test": True
-                }
-                
-                # Call MCP server directly for order creation
-                raw_order_result = call_mcp_server(ORDER_MCP_URL, "create_order", order_payload)
-                
-                # Format response using LLM
-                format_prompt = f"""
-                Format the order creation result into the exact JSON structure below:
-
-                Required JSON format:
-                {{
-                  "order_created": {{
-                    "id": "ORDER_ID",
-                    "order_id": "ORDER_NUMBER",
-                    "product": "PRODUCT_TITLE",
-                    "total_paid": "AMOUNT INR",
-                    "message": "Your order has been placed successfully! Use the ID: ORDER_ID to track your order status at any time."
-                  }}
-                }}
-
-                Raw order result: {json.dumps(raw_order_result, indent=2)}
-
-                Extract the order ID, order number, product title, and total amount from the raw data.
-                Return ONLY the formatted JSON, no other text.
-                """
-                
-                formatted_result = call_gemini_llm(format_prompt)
-                
-                # Extract JSON from LLM response
-                try:
-                    cleaned = re.sub(r"```[a-zA-Z]*", "", formatted_result).strip("` \n")
-                    json_match = re.search(r"\{.*\}", cleaned, re.DOTALL)
-                    
-                    if json_match:
-                        formatted_order = json.loads(json_match.group())
-                        return {
-                            "order_result": formatted_order,
-                            "final_response": json.dumps(formatted_order, indent=2)
-                        }
-                except Exception as e:
-                    print(f"Order formatting error: {e}")
-                
-                # Fallback to raw data if formatting fails
+            if not order_info:
+                raise ValueError("Could not extract order details")
+            
+            if order_info.get("needs_more_info", True):
+                error_response = {"error": "Missing information. Please provide variant ID and email address to create an order."}
                 return {
-                    "order_result": raw_order_result,
-                    "final_response": json.dumps(raw_order_result, indent=2)
+                    "order_result": error_response,
+                    "final_response": json.dumps(error_response, indent=2)
                 }
-                
+            
+            # Create order payload for NEW MCP SDK server
+            # New signature: create_order(line_items, customer_email, financial_status, test)
+            order_payload = {
+                "line_items": [{
+                    "variant_id": int(order_info["variant_id"]),
+                    "quantity": order_info.get("quantity") or 1,
+                    "title": "Product",  # Will be filled by server
+                    "price": 0  # Will be filled by server
+                }],
+                "customer_email": order_info["email"],
+                "financial_status": "paid",
+                "test": True
+            }
+            
+            # Call MCP server directly for order creation
+            raw_order_result = await acall_mcp_server(ORDER_MCP_URL, "create_order", order_payload)
+            
+            # Map the result into the response shape; Gemini only in ORDER_FORMAT_MODE=llm
+            formatted_order = format_order_created(raw_order_result, int(order_info["variant_id"]))
+            if ORDER_FORMAT_MODE == "llm" and not _order_failed(raw_order_result):
+                formatted_order = await _llm_format_order_created(raw_order_result) or formatted_order
+            return {
+                "order_result": formatted_order,
+                "final_response": json.dumps(formatted_order, indent=2)
+            }
+            
         except Exception as e:
             error_response = {"error": f"Order parsing failed: {str(e)}"}
             return {
@@ -557,94 +1108,88 @@ def order_creation_node(state: AgentState):
         }
 
 # === ORDER STATUS NODE ===
-def order_status_node(state: AgentState):
-    """Handle order status requests"""
-    try:
-        # Extract order ID from user message
-        prompt = f"""
+async def _llm_extract_order_id(message: str) -> dict | None:
+    """Gemini extraction of the order ID (used when the pattern extractor is ambiguous)"""
+    prompt = f"""
         Extract the order ID from the user message. Return ONLY a JSON object:
         {{
             "order_id": "extracted order ID",
             "found": true/false
         }}
 
-        User Message: "{state["user_message"]}"
+        User Message: "{message}"
 
         Look for numbers that could be order IDs. Return ONLY the JSON object.
         """
-        
-        result = call_gemini_llm(prompt)
-        
+    
+    result = await acall_gemini_llm(prompt)
+    cleaned = re.sub(r"```[a-zA-Z]*", "", result).strip("` \n")
+    json_match = re.search(r"\{.*\}", cleaned, re.DOTALL)
+    if not json_match:
+        return None
+    # Short numbers are order numbers (#1001), not Shopify order IDs
+    reference = order_reference(json.loads(json_match.group()).get("order_id"))
+    return {"order_id": None, "order_number": None, **reference, "found": bool(reference)}
+
+def _merge_order_status_slots(order_info: dict, slots: dict) -> dict:
+    """
+    Combine the pattern extractor's result with the fused intent call's slots.
+    
+    An unambiguous extracted order reference wins; an ambiguous one (e.g. a
+    phone number next to "order 1002") is replaced by the slot's reference
+    when the intent call returned one.
+    """
+    slot_found = slots.get("order_id") is not None or slots.get("order_number") is not None
+    if order_info.get("found") and not (order_info.get("ambiguous") and slot_found):
+        return {**order_info, "ambiguous": False}
+    return {"order_id": slots.get("order_id"), "order_number": slots.get("order_number"), "found": slot_found, "ambiguous": False}
+
+async def order_status_node(state: AgentState):
+    """Handle order status requests"""
+    try:
+        # Extract order ID: patterns first, then slots from the fused intent call, the LLM only as a last resort
         try:
-            cleaned = re.sub(r"```[a-zA-Z]*", "", result).strip("` \n")
-            json_match = re.search(r"\{.*\}", cleaned, re.DOTALL)
+            order_info = resolve_order_status(extract_entities(state["user_message"]))
+            if order_info["ambiguous"] or not order_info["found"]:
+                slots = state.get("slots")
+                if slots:
+                    order_info = _merge_order_status_slots(order_info, slots)
+                elif order_info["ambiguous"]:
+                    order_info = await _llm_extract_order_id(state["user_message"])
             
-            if json_match:
-                order_info = json.loads(json_match.group())
-                
-                if not order_info.get("found", False):
-                    error_response = {"error": "Please provide a valid order ID to check status."}
-                    return {
-                        "order_status": error_response,
-                        "final_response": json.dumps(error_response, indent=2)
-                    }
-                
-                # Get order status using direct MCP call
-                try:
-                    order_id = int(order_info["order_id"])
-                    raw_status_result = call_mcp_server(ORDER_MCP_URL, "get_order_status", {"order_id": order_id})
-                except (ValueError, TypeError):
-                    error_response = {"error": "Invalid order ID format."}
-                    return {
-                        "order_status": error_response,
-                        "final_response": json.dumps(error_response, indent=2)
-                    }
-                
-                # Format response using LLM
-                format_prompt = f"""
-                Format the order status result into the exact JSON structure below:
-
-                Required JSON format:
-                {{
-                  "order_id": order_id_number,
-                  "order_number": "#ORDER_NUMBER",
-                  "product": "PRODUCT_NAME",
-                  "quantity": quantity_number,
-                  "total_paid": "AMOUNT INR",
-                  "status": "STATUS",
-                  "fulfillment_status": "FULFILLMENT_STATUS",
-                  "order_date": "YYYY-MM-DD HH:MM:SS"
-                }}
-
-                Raw order status result: {json.dumps(raw_status_result, indent=2)}
-
-                Extract the order ID, order number, product name, quantity, total amount, status, fulfillment status, and order date from the raw data.
-                For fulfillment_status, use "Not yet shipped" if null or empty, otherwise use the actual status.
-                Return ONLY the formatted JSON, no other text.
-                """
-                
-                formatted_result = call_gemini_llm(format_prompt)
-                
-                # Extract JSON from LLM response
-                try:
-                    cleaned = re.sub(r"```[a-zA-Z]*", "", formatted_result).strip("` \n")
-                    json_match = re.search(r"\{.*\}", cleaned, re.DOTALL)
-                    
-                    if json_match:
-                        formatted_status = json.loads(json_match.group())
-                        return {
-                            "order_status": formatted_status,
-                            "final_response": json.dumps(formatted_status, indent=2)
-                        }
-                except Exception as e:
-                    print(f"Order status formatting error: {e}")
-                
-                # Fallback to raw data if formatting fails
+            if not order_info:
+                raise ValueError("Could not extract order ID")
+            
+            if not order_info.get("found", False):
+                error_response = {"error": "Please provide a valid order ID to check status."}
+                return {
+                    "order_status": error_response,
+                    "final_response": json.dumps(error_response, indent=2)
+                }
+            
+            # Get order status using direct MCP call; order numbers are looked up by name on the server
+            try:
+                if order_info.get("order_id") is not None:
+                    arguments = {"order_id": int(order_info["order_id"])}
+                else:
+                    arguments = {"order_number": int(order_info["order_number"])}
+                raw_status_result = await acall_mcp_server(ORDER_MCP_URL, "get_order_status", arguments)
+            except (ValueError, TypeError):
+                error_response = {"error": "Invalid order ID format."}
                 return {
-                    "order_status": raw_status_result,
-                    "final_response": json.dumps(raw_status_result, indent=2)
+                    "order_status": error_response,
+                    "final_response": json.dumps(error_response, indent=2)
                 }
-                
+            
+            # Map the result into the response shape; Gemini only in ORDER_FORMAT_MODE=llm
+            formatted_status = format_order_status(raw_status_result)
+            if ORDER_FORMAT_MODE == "llm" and not _order_failed(raw_status_result):
+                formatted_status = await _llm_format_order_status(raw_status_result) or formatted_status
+            return {
+                "order_status": formatted_status,
+                "final_response": json.dumps(formatted_status, indent=2)
+            }
+            
         except Exception as e:
             error_response = {"error": f"Order ID parsing failed: {str(e)}"}
             return {
@@ -659,64 +1204,560 @@ def order_status_node(state: AgentState):
             "final_response": json.dumps(error_response, indent=2)
         }
 
-# === INFO SEARCH (RAG) NODE ===
-def info_search_node(state: AgentState):
-    """Handle informational queries using RAG over existing knowledge base (Pinecone)."""
-    user_q = state.get("user_message", "")
-    topic = "general"
-    
-    print(f"[DEBUG] RAG query: {user_q}")
+# === QUERY EMBEDDING CACHE ===
+# In-memory LRU capacity for query embeddings
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+# Optional SQLite file that persists query embeddings across restarts
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+# Micro-batching: flush after this many queued misses or this many milliseconds
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "10"))
+
+def normalize_query(text: str) -> str:
+    """Cache key for a shopper question: case, spacing and trailing punctuation ignored"""
+    return " ".join(text.lower().split()).rstrip("?!. ")
+
+class EmbeddingCache:
+    """Thread-safe LRU of query embeddings, optionally backed by SQLite on disk."""
+
+    def __init__(self, model_name: str, max_size: int = EMBEDDING_CACHE_SIZE, path: str = EMBEDDING_CACHE_PATH):
+        self.model_name = model_name
+        self.max_size = max(1, max_size)
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings "
+                "(model TEXT NOT NULL, query TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, query))"
+            )
+            self._db.commit()
+
+    def get(self, key: str) -> list[float] | None:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT vector FROM query_embeddings WHERE model = ? AND query = ?", (self.model_name, key)
+                ).fetchone()
+                if row:
+                    vector = array("f", row[0]).tolist()
+                    self._remember(key, vector)
+                    self.hits += 1
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, key: str, vector: list[float]):
+        with self._lock:
+            self._remember(key, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (model, query, vector) VALUES (?, ?, ?)",
+                    (self.model_name, key, array("f", vector).tobytes())
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, vector: list[float]):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+class EmbeddingBatcher:
+    """Groups concurrent embedding requests from worker threads into one embed_documents call.
+
+    Callers block on a future; a daemon thread collects pending texts until the
+    batch is full or EMBEDDING_BATCH_WAIT_MS has passed since the first one,
+    then encodes the distinct texts in a single call.
+    """
 
-    # Try RAG with Pinecone + Gemini
-    try:
-        # Get API keys with proper fallback
+    def __init__(self, embed_documents, max_batch: int = EMBEDDING_BATCH_SIZE, max_wait_ms: float = EMBEDDING_BATCH_WAIT_MS):
+        self._embed_documents = embed_documents
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.batches = 0
+        self._pending: list[tuple[str, concurrent.futures.Future]] = []
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def embed(self, text: str) -> list[float]:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._cond:
+            self._pending.append((text, future))
+            self._cond.notify()
+        return future.result()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+
+            waiters: dict[str, list[concurrent.futures.Future]] = {}
+            for text, future in batch:
+                waiters.setdefault(text, []).append(future)
+            try:
+                vectors = self._embed_documents(list(waiters))
+                self.batches += 1
+                for futures, vector in zip(waiters.values(), vectors):
+                    for future in futures:
+                        future.set_result(list(vector))
+            except Exception as e:
+                for futures in waiters.values():
+                    for future in futures:
+                        future.set_exception(e)
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings wrapper that caches and micro-batches query encodings.
+
+    Document embedding (index ingestion) passes straight through to the base
+    model; only `embed_query`, which runs on every shopper question, is cached.
+    """
+
+    def __init__(self, base: Embeddings, model_name: str):
+        self.base = base
+        self.cache = EmbeddingCache(model_name)
+        self.batcher = EmbeddingBatcher(base.embed_documents)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.batcher.embed(key)
+            self.cache.put(key, vector)
+        return vector
+
+# === SEMANTIC ANSWER CACHE ===
+# Minimum cosine similarity between questions for a cached answer to be reused. e5 embeddings
+# cluster tightly, so near-misses score high; _bench_answer_cache.py measures the margin
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+def retrieval_key(documents) -> str:
+    """Fingerprint of the retrieved chunks (order-insensitive), so answers are only shared across identical context"""
+    digests = sorted(hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest() for doc in documents or [])
+    return hashlib.sha1("|".join(digests).encode("ascii")).hexdigest()
+
+class SemanticAnswerCache:
+    """Formatted info_search answers keyed by question embedding.
+
+    A stored answer is reused for the same normalized question, or for a
+    similar question (cosine similarity at least `threshold`) that retrieved
+    exactly the same chunks (`retrieval_key`), so a question about a
+    neighbouring topic never gets another topic's answer. Entries expire after
+    `ttl` seconds. Offer questions and general questions are formatted
+    differently, so entries only match questions of the same kind. The cache
+    is cleared whenever the knowledge-base index changes.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl: float = ANSWER_CACHE_TTL_SECONDS,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors: list[np.ndarray] = []
+        self._entries: list[dict] = []
+        self._matrix: np.ndarray | None = None
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _expire(self):
+        now = time.monotonic()
+        keep = [i for i, e in enumerate(self._entries) if now - e["stored_at"] < self.ttl]
+        if len(keep) != len(self._entries):
+            self._vectors = [self._vectors[i] for i in keep]
+            self._entries = [self._entries[i] for i in keep]
+            self._matrix = None
+
+    def _similar(self, vector, kind: str) -> list[int]:
+        """Indexes of same-kind entries at or above the threshold, most similar first (lock held)"""
+        if not self._entries:
+            return []
+        if self._matrix is None:
+            self._matrix = np.vstack(self._vectors)
+        scores = self._matrix @ self._unit(vector)
+        return [int(i) for i in np.argsort(scores)[::-1]
+                if scores[i] >= self.threshold and self._entries[i]["kind"] == kind]
+
+    def has_similar(self, vector, kind: str) -> bool:
+        """Whether a retrieval-checked lookup could hit (lets callers skip the extra retrieval)"""
+        with self._lock:
+            self._expire()
+            return bool(self._similar(vector, kind))
+
+    def lookup(self, vector, kind: str, question: str, documents_key: str | None = None) -> dict | None:
+        """Cached payload for the same normalized question, or, with `documents_key`, for a
+        similar question whose retrieval returned the same chunks"""
+        key = normalize_query(question)
+        with self._lock:
+            self._expire()
+            match = next((e for e in reversed(self._entries) if e["kind"] == kind and e["question"] == key), None)
+            if match is None and documents_key is not None:
+                match = next((self._entries[i] for i in self._similar(vector, kind)
+                              if self._entries[i]["documents_key"] == documents_key), None)
+            if match is not None:
+                self.hits += 1
+                return json.loads(json.dumps(match["payload"]))
+            if documents_key is not None:
+                self.misses += 1
+            return None
+
+    def store(self, vector, kind: str, payload: dict, question: str, documents_key: str):
+        with self._lock:
+            self._expire()
+            if len(self._entries) >= self.max_entries:
+                # Entries are kept in insertion order, so the first one is the oldest
+                del self._vectors[0], self._entries[0]
+            self._vectors.append(self._unit(vector))
+            self._entries.append({"kind": kind, "question": normalize_query(question), "documents_key": documents_key,
+                                  "payload": payload, "stored_at": time.monotonic()})
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._vectors, self._entries, self._matrix = [], [], None
+
+
+answer_cache = SemanticAnswerCache()
+
+# === RAG RESOURCE REGISTRY ===
+RAG_EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "intfloat/e5-large")
+# Vector store behind the retriever: "pinecone" or "local" (see local_vector_index.py)
+RAG_BACKEND = os.getenv("RAG_BACKEND", "pinecone").lower()
+# Interval between background index health checks (0 disables them)
+RAG_HEALTH_CHECK_SECONDS = float(os.getenv("RAG_HEALTH_CHECK_SECONDS", "300"))
+# "single_pass": one streamed generation with the brand/offer rules in the prompt;
+# "two_pass": RetrievalQA answer followed by a separate formatting rewrite
+RAG_GENERATION_MODE = os.getenv("RAG_GENERATION_MODE", "single_pass").lower()
+# Build the RAG stack when the API starts instead of on the first info question
+RAG_PRELOAD = os.getenv("RAG_PRELOAD", "false").lower() in ("true", "1", "yes")
+
+class RAGResources:
+    """Process-wide RAG stack shared by every info_search request.
+
+    The embedding model, vector store, retriever and QA chain are built once
+    (at startup with RAG_PRELOAD, otherwise on first use) under a lock and then
+    reused. The vector store is Pinecone or the local memory-mapped index,
+    chosen by RAG_BACKEND. Index health is checked by a background thread from
+    index stats, so requests never pay for a probe query.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread: threading.Thread | None = None
+        self.ready = False
+        self.embeddings = None
+        self.vectordb = None
+        self.retriever = None
+        self.qa_chain = None
+        self.index = None
+        self.index_name: str | None = None
+        self.index_healthy: bool | None = None  # None until the first check completes
+        self.vector_count: int | None = None
+        self.index_version = 0
+        self.last_health_check: float | None = None
+        self.last_error: str | None = None
+
+    def get(self) -> "RAGResources":
+        """Return the shared resources, building them on first use"""
+        if not self.ready:
+            with self._lock:
+                if not self.ready:
+                    self._build()
+                    self.ready = True
+            self.start_health_checks()
+        return self
+
+    def _build(self):
         google_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
         pinecone_key = os.getenv("PINECONE_API_KEY")
         pinecone_index = os.getenv("PINECONE_INDEX")
-        
+        use_local = RAG_BACKEND == "local"
+
         # Avoid non-ASCII symbols in logs to prevent Windows console encoding errors
         google_ok = 'OK' if google_key else 'MISSING'
         pinecone_ok = 'OK' if pinecone_key else 'MISSING'
-        print(f"[DEBUG] API Keys - Google: {google_ok}, Pinecone: {pinecone_ok}, Index: {pinecone_index}")
+        if use_local:
+            print(f"[DEBUG] API Keys - Google: {google_ok}, Local index: {LOCAL_INDEX_DIR}")
+        else:
+            print(f"[DEBUG] API Keys - Google: {google_ok}, Pinecone: {pinecone_ok}, Index: {pinecone_index}")
 
+        if RAG_BACKEND not in ("pinecone", "local"):
+            raise ValueError(f"Unknown RAG_BACKEND: {RAG_BACKEND} (expected 'pinecone' or 'local')")
         if not google_key:
             raise ValueError("Google API key not found (GOOGLE_API_KEY or GEMINI_API_KEY)")
-        if not pinecone_key:
-            raise ValueError("Pinecone API key not found (PINECONE_API_KEY)")
-        if not pinecone_index:
-            raise ValueError("Pinecone index not found (PINECONE_INDEX)")
-
-        # Configure providers
-        genai.configure(api_key=google_key)
-        _pc = Pinecone(api_key=pinecone_key)
-        print("[DEBUG] Pinecone client initialized")
-
-        # Initialize embeddings and vector store
-        embeddings = HuggingFaceEmbeddings(
-            model_name="intfloat/e5-large",
-            encode_kwargs={"normalize_embeddings": True}
+        if use_local:
+            if LocalVectorIndex.read_version(LOCAL_INDEX_DIR) is None:
+                raise ValueError(f"Local vector index not found in {LOCAL_INDEX_DIR} (run local_vector_index.py ingest)")
+        else:
+            if not pinecone_key:
+                raise ValueError("Pinecone API key not found (PINECONE_API_KEY)")
+            if not pinecone_index:
+                raise ValueError("Pinecone index not found (PINECONE_INDEX)")
+
+        started = time.perf_counter()
+        self.embeddings = CachedQueryEmbeddings(
+            HuggingFaceEmbeddings(
+                model_name=RAG_EMBEDDING_MODEL,
+                encode_kwargs={"normalize_embeddings": True}
+            ),
+            RAG_EMBEDDING_MODEL
         )
         print("[DEBUG] Embeddings initialized")
-        
-        vectordb = PineconeVectorStore.from_existing_index(
-            index_name=pinecone_index,
-            embedding=embeddings
+
+        if use_local:
+            self.vectordb = LocalVectorStore(LOCAL_INDEX_DIR, self.embeddings)
+            self.index_name = LOCAL_INDEX_DIR
+        else:
+            self.index = Pinecone(api_key=pinecone_key).Index(pinecone_index)
+            self.index_name = pinecone_index
+            self.vectordb = PineconeVectorStore.from_existing_index(
+                index_name=pinecone_index,
+                embedding=self.embeddings
+            )
+        print(f"[DEBUG] Vector store connected ({RAG_BACKEND})")
+
+        self.retriever = self.vectordb.as_retriever(search_type="similarity", k=8)
+        self.qa_chain = RetrievalQA.from_chain_type(
+            llm=ChatGoogleGenerativeAI(model=GEMINI_MODEL, google_api_key=google_key),
+            retriever=self.retriever,
+            # The two-pass path reads sources and the answer cache's retrieval key from these
+            return_source_documents=True
         )
-        print("[DEBUG] Vector store connected")
-        
-        # Test if index has data
-        test_results = vectordb.similarity_search("test", k=1)
-        if not test_results:
-            raise ValueError("Pinecone index appears to be empty")
-        print(f"[DEBUG] Index has {len(test_results)} test results")
-
-        # Setup retrieval chain
-        retriever = vectordb.as_retriever(search_type="similarity", k=8)
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=ChatGoogleGenerativeAI(model="gemini-3-flash-preview", google_api_key=google_key),
-            retriever=retriever
+        print(f"[DEBUG] RAG resources ready in {time.perf_counter() - started:.1f}s")
+
+    def _probe_index(self) -> tuple[bool, int]:
+        """(rebuilt since last probe, vector count) from index stats, no query involved"""
+        if isinstance(self.vectordb, LocalVectorStore):
+            rebuilt = self.vectordb.reload()
+            return rebuilt, self.vectordb.index.count
+        stats = self.index.describe_index_stats()
+        count = getattr(stats, "total_vector_count", None)
+        if count is None:
+            count = stats.get("total_vector_count", 0)
+        return False, int(count)
+
+    def check_health(self) -> bool:
+        """Refresh index health from index stats (no embedding or query involved)"""
+        try:
+            rebuilt, count = self._probe_index()
+            if rebuilt or (self.vector_count is not None and count != self.vector_count):
+                self.mark_index_updated()
+            self.vector_count = count
+            self.index_healthy = self.vector_count > 0
+            self.last_error = None if self.index_healthy else f"{RAG_BACKEND} index appears to be empty"
+        except Exception as e:
+            self.index_healthy = False
+            self.last_error = f"Index health check failed: {e}"
+        self.last_health_check = time.time()
+        if not self.index_healthy:
+            print(f"[RAG] {self.last_error}")
+        return self.index_healthy
+
+    def mark_index_updated(self):
+        """Record a knowledge-base change and drop answers generated from the old index.
+
+        Health checks call this when the index vector count changes or the
+        local index was re-ingested; jobs that replace Pinecone vectors in
+        place should call it explicitly.
+        """
+        self.index_version += 1
+        answer_cache.clear()
+        print(f"[RAG] Index {self.index_name} updated (version {self.index_version}); answer cache cleared")
+
+    def start_health_checks(self):
+        with self._lock:
+            if self._health_thread is not None or RAG_HEALTH_CHECK_SECONDS <= 0:
+                return
+            self._health_thread = threading.Thread(target=self._health_loop, name="rag-health", daemon=True)
+            self._health_thread.start()
+
+    def _health_loop(self):
+        while not self._stop.is_set():
+            self.check_health()
+            self._stop.wait(RAG_HEALTH_CHECK_SECONDS)
+
+    def warm(self):
+        """Build the resources ahead of the first request; failures fall back to lazy init"""
+        try:
+            self.get()
+        except Exception as e:
+            print(f"[RAG] Preload failed, will retry on first info question: {e}")
+
+
+rag_resources = RAGResources()
+
+# === INFO SEARCH (RAG) NODE ===
+OFFER_KEYWORDS = ["offer", "offers", "discount", "sale", "flash", "deal", "coupon", "membership", "loyalty"]
+
+def _is_offer_query(user_q: str) -> bool:
+    return any(k in user_q.lower() for k in OFFER_KEYWORDS)
+
+def _info_update(payload: dict) -> dict:
+    return {
+        "info_result": payload,
+        "final_response": json.dumps(payload, indent=2)
+    }
+
+def _info_sources(documents) -> list:
+    sources = []
+    for doc in documents or []:
+        if hasattr(doc, 'metadata') and doc.metadata:
+            src = doc.metadata.get("source")
+            if src:
+                sources.append(src)
+    return list(dict.fromkeys(sources))
+
+def _single_pass_prompt(user_q: str, documents, is_offer_query: bool) -> str:
+    """One prompt that answers from the retrieved context and applies the CNX Store formatting rules"""
+    context = "\n\n---\n\n".join(doc.page_content for doc in documents) or "(no documents retrieved)"
+    if is_offer_query:
+        structure = (
+            "FORMAT THE ANSWER LIKE THIS:\n"
+            "- Title: \"Current Offers at CNX Store 🌟\"\n"
+            "- A warm one-line welcome.\n"
+            "- Numbered sections for each distinct offer found (name + 1–2 bullets with percentages, codes, timing, or categories when available). Do not invent details.\n"
+            "- Optional section: \"Exclusive Member Benefits\" if such info appears in the content.\n"
+            "- Close with a friendly invitation to ask more.\n"
         )
-        print("[DEBUG] QA chain initialized")
+    else:
+        structure = (
+            "Preferred structure when applicable:\n"
+            "- Start with a friendly heading (e.g., ### About CNX Store)\n"
+            "- Include subheadings such as **Who We Are**, **Product Range**, **Why Choose Us**, **Member Benefits**, **Sustainability & Community**, **How to Stay Updated**.\n"
+            "- Close with a helpful invitation to explore or ask more.\n"
+        )
+    return (
+        "You are a CNX Store copywriter. Answer the user's question strictly based on the retrieved documents below. "
+        "If nothing relevant is retrieved, say so politely.\n\n"
+        "STYLE:\n"
+        "- Polished, conversational CNXStore-branded response; warm, helpful, and modern.\n"
+        "- Use headings, bullet points, and bold highlights; keep it scannable, with sparse emojis.\n"
+        "- Do not include citations, source paths, IDs, technical details, or raw snippets.\n\n"
+        f"{structure}\n"
+        f"RETRIEVED DOCUMENTS:\n{context}\n\n"
+        f"User question: {user_q}"
+    )
+
+async def astream_info_answer(user_q: str):
+    """Single-pass RAG: yield ("token", text) chunks as the answer is generated, then ("result", state update).
+
+    Retrieval and generation happen once; the brand and offer formatting rules
+    are part of the generation prompt instead of a second rewrite call. Semantic
+    cache hits are yielded as a single token. Failures end with the same
+    fallback answers as the two-pass path.
+    """
+    try:
+        rag = await asyncio.to_thread(rag_resources.get)
+        if rag.index_healthy is False:
+            raise ValueError(rag.last_error or "Pinecone index unavailable")
+
+        is_offer_query = _is_offer_query(user_q)
+        answer_kind = "offers" if is_offer_query else "general"
+        query_vector = await asyncio.to_thread(rag.embeddings.embed_query, user_q)
+        cached_payload = answer_cache.lookup(query_vector, answer_kind, user_q)
+        documents = None
+        if cached_payload is None:
+            documents = await asyncio.to_thread(rag.retriever.invoke, user_q)
+            cached_payload = answer_cache.lookup(query_vector, answer_kind, user_q, retrieval_key(documents))
+        if cached_payload is not None:
+            print("[DEBUG] RAG answer served from semantic cache")
+            yield "token", cached_payload["info"]["answer"]
+            yield "result", _info_update(cached_payload)
+            return
+
+        parts = []
+        async for text in gemini_client.astream(_single_pass_prompt(user_q, documents, is_offer_query)):
+            parts.append(text)
+            yield "token", text
+        answer = "".join(parts).strip()
+        if not answer:
+            raise ValueError("Empty answer from Gemini")
+
+        sources = _info_sources(documents)
+        print(f"[DEBUG] RAG successful (single pass) - Answer length: {len(answer)}, Sources: {len(sources)}")
+        payload = {
+            "info": {
+                "topic": "general",
+                "answer": answer
+            },
+            "sources": sources
+        }
+        answer_cache.store(query_vector, answer_kind, payload, user_q, retrieval_key(documents))
+        yield "result", _info_update(payload)
+    except Exception as e:
+        print(f"[DEBUG] RAG failed: {str(e)}")
+        yield "result", _info_fallback(user_q, e)
+
+async def info_search_node(state: AgentState):
+    """Handle informational queries using RAG (single streamed generation, or the two-pass chain in a worker thread)."""
+    if RAG_GENERATION_MODE == "two_pass":
+        return await asyncio.to_thread(_run_info_search, state)
+    update = {}
+    async for kind, value in astream_info_answer(state.get("user_message", "")):
+        if kind == "token":
+            emit_agent_event("token", {"node": "info_search", "text": value})
+        else:
+            update = value
+    return update
+
+def _run_info_search(state: AgentState):
+    """Handle informational queries using RAG over existing knowledge base (Pinecone)."""
+    user_q = state.get("user_message", "")
+    topic = "general"
+    
+    print(f"[DEBUG] RAG query: {user_q}")
+
+    # Try RAG with Pinecone + Gemini
+    try:
+        rag = rag_resources.get()
+        if rag.index_healthy is False:
+            raise ValueError(rag.last_error or "Pinecone index unavailable")
+        qa_chain = rag.qa_chain
+
+        # Offers-aware formatting
+        is_offer_query = _is_offer_query(user_q)
+        answer_kind = "offers" if is_offer_query else "general"
+
+        # Reuse a formatted answer to the same question, or to a similar one with the same retrieved chunks
+        # (retrieval runs here only when a similar question is cached; the chain retrieves on its own)
+        query_vector = rag.embeddings.embed_query(user_q)
+        cached_payload = answer_cache.lookup(query_vector, answer_kind, user_q)
+        if cached_payload is None and answer_cache.has_similar(query_vector, answer_kind):
+            documents_key = retrieval_key(rag.retriever.invoke(user_q))
+            cached_payload = answer_cache.lookup(query_vector, answer_kind, user_q, documents_key)
+        if cached_payload is not None:
+            print("[DEBUG] RAG answer served from semantic cache")
+            return _info_update(cached_payload)
 
         # Execute query
         prompt_q = (
@@ -764,10 +1805,6 @@ def info_search_node(state: AgentState):
             "- Do not include citations, technical details, or raw snippets.\n"
         )
 
-        # Offers-aware formatting
-        offer_keywords = ["offer", "offers", "discount", "sale", "flash", "deal", "coupon", "membership", "loyalty"]
-        is_offer_query = any(k in user_q.lower() for k in offer_keywords)
-
         if is_offer_query:
             format_prompt = f"""
             You are a CNX Store copywriter. Based strictly on the following content, produce a marketing-quality answer.
@@ -803,12 +1840,7 @@ def info_search_node(state: AgentState):
         answer = formatted.strip()
         
         # Extract sources
-        sources = []
-        for doc in result.get("source_documents", []) or []:
-            if hasattr(doc, 'metadata') and doc.metadata:
-                src = doc.metadata.get("source")
-                if src:
-                    sources.append(src)
+        sources = _info_sources(result.get("source_documents"))
         
         print(f"[DEBUG] RAG successful - Answer length: {len(answer)}, Sources: {len(sources)}")
 
@@ -817,42 +1849,41 @@ def info_search_node(state: AgentState):
                 "topic": topic,
                 "answer": answer.strip()
             },
-            "sources": list(dict.fromkeys(sources)) if sources else []
-        }
-        return {
-            "info_result": payload,
-            "final_response": json.dumps(payload, indent=2)
+            "sources": sources
         }
+        answer_cache.store(query_vector, answer_kind, payload, user_q, retrieval_key(result.get("source_documents")))
+        return _info_update(payload)
 
     except Exception as e:
         print(f"[DEBUG] RAG failed: {str(e)}")
+        return _info_fallback(user_q, e)
+
+def _info_fallback(user_q: str, error: Exception) -> dict:
+    """Static answers by topic when the RAG stack is unavailable"""
+    topic = "general"
+    # Enhanced fallback with better topic detection
+    message_lower = user_q.lower()
+    
+    if any(word in message_lower for word in ["return", "refund", "exchange", "policy"]):
+        topic = "return_policy"
+        answer = "Our standard return/exchange window is 7–14 days for unused items with original tags and receipt. Certain items may be non-returnable. For exact policy details, please refer to our Return Policy page or contact support."
+    elif any(word in message_lower for word in ["contact", "phone", "email", "support", "address", "reach"]):
+        topic = "contact_details"
+        answer = "You can reach support via email at support@example.com or phone at +1-000-000-0000. Business hours: Mon–Fri, 9am–6pm IST."
+    elif any(word in message_lower for word in ["offer", "discount", "sale", "promotion", "deal", "coupon"]):
+        topic = "current_offers"
+        answer = "Current promotions vary by season. Please check the Offers page or sign up for our newsletter/app notifications for the latest discounts and coupon codes."
+    else:
+        answer = "I can help with return policy, contact details, or current offers. Please specify your question."
         
-        # Enhanced fallback with better topic detection
-        message_lower = user_q.lower()
-        
-        if any(word in message_lower for word in ["return", "refund", "exchange", "policy"]):
-            topic = "return_policy"
-            answer = "Our standard return/exchange window is 7–14 days for unused items with original tags and receipt. Certain items may be non-returnable. For exact policy details, please refer to our Return Policy page or contact support."
-        elif any(word in message_lower for word in ["contact", "phone", "email", "support", "address", "reach"]):
-            topic = "contact_details"
-            answer = "You can reach support via email at support@example.com or phone at +1-000-000-0000. Business hours: Mon–Fri, 9am–6pm IST."
-        elif any(word in message_lower for word in ["offer", "discount", "sale", "promotion", "deal", "coupon"]):
-            topic = "current_offers"
-            answer = "Current promotions vary by season. Please check the Offers page or sign up for our newsletter/app notifications for the latest discounts and coupon codes."
-        else:
-            answer = "I can help with return policy, contact details, or current offers. Please specify your question."
-            
-        payload = {
-            "info": {
-                "topic": topic,
-                "answer": answer,
-                "note": f"RAG not available; showing fallback information. Error: {str(e)}"
-            }
-        }
-        return {
-            "info_result": payload,
-            "final_response": json.dumps(payload, indent=2)
+    payload = {
+        "info": {
+            "topic": topic,
+            "answer": answer,
+            "note": f"RAG not available; showing fallback information. Error: {str(error)}"
         }
+    }
+    return _info_update(payload)
 
 # === ROUTING FUNCTION ===
 def route_by_intent(state: AgentState):
@@ -869,16 +1900,33 @@ def route_by_intent(state: AgentState):
         return "product_search"
 
 # === GRAPH CONSTRUCTION ===
+def _traced_node(name: str, node):
+    """Wrap a node so streaming clients see when it starts and finishes"""
+    @functools.wraps(node)
+    async def traced(state: AgentState):
+        emit_agent_event("node", {"node": name, "status": "started"})
+        started = time.perf_counter()
+        update = await node(state)
+        emit_agent_event("node", {
+            "node": name,
+            "status": "completed",
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        })
+        if name == "analyze_intent" and update:
+            emit_agent_event("intent", {"intent": update.get("intent"), "details": update.get("intent_details")})
+        return update
+    return traced
+
 def create_agent_workflow():
     """Create and return the LangGraph workflow"""
     workflow = StateGraph(AgentState)
     
     # Add nodes
-    workflow.add_node("analyze_intent", analyze_user_intent)
-    workflow.add_node("product_search", product_search_node)
-    workflow.add_node("order_creation", order_creation_node)
-    workflow.add_node("order_status", order_status_node)
-    workflow.add_node("info_search", info_search_node)
+    workflow.add_node("analyze_intent", _traced_node("analyze_intent", analyze_user_intent))
+    workflow.add_node("product_search", _traced_node("product_search", product_search_node))
+    workflow.add_node("order_creation", _traced_node("order_creation", order_creation_node))
+    workflow.add_node("order_status", _traced_node("order_status", order_status_node))
+    workflow.add_node("info_search", _traced_node("info_search", info_search_node))
     
     # Set entry point
     workflow.set_entry_point("analyze_intent")
@@ -903,14 +1951,54 @@ def create_agent_workflow():
     
     return workflow.compile()
 
+# Compiled once at import; the compiled graph is stateless and safe to share across requests
+agent_graph = create_agent_workflow()
+
 # === MAIN EXECUTION FUNCTION ===
-def process_user_message(user_message: str) -> dict:
-    """Process a user message through the LangGraph workflow"""
-    graph = create_agent_workflow()
-    
+async def aprocess_user_message(user_message: str) -> dict:
+    """Process a user message through the LangGraph workflow without blocking the event loop"""
     # Execute the workflow
-    result = graph.invoke({"user_message": user_message})
-    
+    result = await agent_graph.ainvoke({"user_message": user_message})
+    return _build_agent_result(result)
+
+async def astream_user_message(user_message: str):
+    """Run the workflow and yield (event, data) pairs as it progresses.
+
+    Events are "node", "intent", "tool_call", "tool_result" and "token"; the
+    last pair is ("final", agent result). Workflow errors propagate to the
+    caller after the events emitted so far.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run():
+        try:
+            return await aprocess_user_message(user_message)
+        finally:
+            queue.put_nowait(None)
+
+    # The task copies the current context, so every node it runs sees this sink
+    token = _agent_event_sink.set((loop, queue))
+    try:
+        task = asyncio.create_task(run())
+    finally:
+        _agent_event_sink.reset(token)
+
+    try:
+        while (item := await queue.get()) is not None:
+            yield item
+        yield "final", await task
+    finally:
+        # Client went away mid-run
+        if not task.done():
+            task.cancel()
+
+def process_user_message(user_message: str) -> dict:
+    """Process a user message through the LangGraph workflow (sync entry point for scripts)"""
+    return async_bridge.run(aprocess_user_message(user_message))
+
+def _build_agent_result(result: dict) -> dict:
+    """Shape the final graph state into the agent result"""
     # Augment final_response JSON with user_intent when possible
     intent = result.get("intent")
     final_response = result.get("final_response") or ""
@@ -937,6 +2025,7 @@ def process_user_message(user_message: str) -> dict:
 # === FASTAPI INTEGRATION ===
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import uvicorn
@@ -967,40 +2056,101 @@ class AgentResponse(BaseModel):
     inner_messages: Optional[List[Dict[str, Any]]] = None
     user_intent: Optional[str] = None
 
+def _last_user_message(request: MessageRequest) -> str:
+    """Content of the most recent user message, or a 400 error"""
+    if not request.messages:
+        raise HTTPException(status_code=400, detail="No messages provided")
+    
+    # Get the last user message
+    last_message = None
+    for msg in reversed(request.messages):
+        if msg.get("source") == "user":
+            last_message = msg.get("content", "")
+            break
+    
+    if not last_message:
+        raise HTTPException(status_code=400, detail="No user message found")
+    return last_message
+
+def _agent_response(result: dict) -> AgentResponse:
+    """Shape a workflow result into the API response"""
+    # Get the formatted response from the workflow
+    chat_message = result.get("final_response", "")
+    
+    return AgentResponse(
+        chat_message=chat_message,
+        intent=result.get("intent"),
+        intent_details=result.get("intent_details"),
+        inner_messages=[result.get("full_state", {})],
+        user_intent=result.get("user_intent") or result.get("intent")
+    )
+
+def _sse(event: str, data: Any) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
 @app.post("/agent-assistant/", response_model=AgentResponse)
 async def agent_assistant(request: MessageRequest):
     """Process user messages through the LangGraph workflow"""
     try:
-        if not request.messages:
-            raise HTTPException(status_code=400, detail="No messages provided")
-        
-        # Get the last user message
-        last_message = None
-        for msg in reversed(request.messages):
-            if msg.get("source") == "user":
-                last_message = msg.get("content", "")
-                break
-        
-        if not last_message:
-            raise HTTPException(status_code=400, detail="No user message found")
+        last_message = _last_user_message(request)
         
         # Process through LangGraph workflow
-        result = process_user_message(last_message)
-        
-        # Get the formatted response from the workflow
-        chat_message = result.get("final_response", "")
+        result = await aprocess_user_message(last_message)
         
-        return AgentResponse(
-            chat_message=chat_message,
-            intent=result.get("intent"),
-            intent_details=result.get("intent_details"),
-            inner_messages=[result.get("full_state", {})],
-            user_intent=result.get("user_intent") or result.get("intent")
-        )
+        return _agent_response(result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Agent processing failed: {str(e)}")
 
+@app.post("/agent-assistant/stream")
+async def agent_assistant_stream(request: MessageRequest):
+    """Stream the LangGraph run as SSE.
+
+    Emits `node` (started/completed), `intent`, `tool_call`, `tool_result` and
+    `token` events as they happen, then a `final` event with the same body as
+    /agent-assistant/, or an `error` event if the run fails.
+    """
+    last_message = _last_user_message(request)
+
+    async def events():
+        try:
+            async for event, data in astream_user_message(last_message):
+                if event == "final":
+                    data = _agent_response(data).model_dump()
+                yield _sse(event, data)
+        except Exception as e:
+            yield _sse("error", {"detail": f"Agent processing failed: {str(e)}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/agent-assistant/info/stream")
+async def info_assistant_stream(request: MessageRequest):
+    """Stream a knowledge-base answer as SSE: `token` events while generating, then one `final` event"""
+    last_message = _last_user_message(request)
+
+    async def events():
+        async for kind, value in astream_info_answer(last_message):
+            if kind == "token":
+                yield _sse("token", {"text": value})
+            else:
+                yield _sse("final", value["info_result"])
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.on_event("startup")
+async def preload_rag_resources():
+    """Optionally build the RAG stack in the background so the first info question is fast"""
+    if RAG_PRELOAD:
+        asyncio.get_running_loop().run_in_executor(None, rag_resources.warm)
+
+@app.on_event("shutdown")
+async def close_mcp_sessions():
+    """Close pooled MCP client sessions on shutdown"""
+    await aclose_mcp_pools()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -0,0 +1,508 @@
+"""
+Local vector index: an offline stand-in for the Pinecone knowledge base.
+
+Embeddings are stored as a memory-mapped float32 matrix next to a JSONL file
+of documents, so an index larger than RAM can be searched and several worker
+processes share the same pages. Small corpora are searched exhaustively with
+NumPy; larger ones get an IVF (inverted file) structure: k-means centroids
+plus rows regrouped so that every list is a contiguous slice of the matrix,
+and a query only scans the `nprobe` lists closest to it.
+
+`LocalVectorStore` wraps the index in the LangChain VectorStore interface, so
+`as_retriever()` and RetrievalQA work exactly as with PineconeVectorStore. The
+agent selects it with RAG_BACKEND=local.
+
+Usage:
+    python local_vector_index.py ingest <dir|file.jsonl> [--index-dir rag_index] [--chunk-size 1000] [--chunk-overlap 150]
+    python local_vector_index.py export-pinecone [--index-dir rag_index] [--namespace NAME]
+    python local_vector_index.py query "what is your return policy" [--k 4]
+    python local_vector_index.py bench [--queries 200] [--k 8]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Iterable
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# === CONFIG ===
+LOCAL_INDEX_DIR = os.getenv("RAG_LOCAL_INDEX_DIR", "rag_index")
+# Corpora up to this many vectors are searched exhaustively; larger ones get IVF lists
+LOCAL_INDEX_BRUTE_FORCE_MAX = int(os.getenv("LOCAL_INDEX_BRUTE_FORCE_MAX", "20000"))
+# IVF lists scanned per query (higher = better recall, slower)
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+RAG_EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "intfloat/e5-large")
+
+EMBEDDINGS_FILE = "embeddings.f32"
+DOCUMENTS_FILE = "documents.jsonl"
+OFFSETS_FILE = "documents.offsets.npy"
+CENTROIDS_FILE = "ivf_centroids.npy"
+LISTS_FILE = "ivf_lists.npy"
+META_FILE = "meta.json"
+
+# Rows per matrix product when scanning or assigning, to bound temporary memory
+SCAN_CHUNK_ROWS = 16384
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by inner product) for every row, computed in chunks"""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SCAN_CHUNK_ROWS):
+        chunk = np.asarray(vectors[start:start + SCAN_CHUNK_ROWS], dtype=np.float32)
+        assignment[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignment
+
+
+def _train_ivf(vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the corpus; returns unit-length centroids"""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), max(nlist * 32, 10_000), 50_000)
+    # Seeding picks distinct sample points, so there can be no more lists than points
+    nlist = min(nlist, sample_size)
+    rows = np.sort(rng.choice(len(vectors), sample_size, replace=False))
+    sample = np.asarray(vectors[rows], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = _assign(sample, centroids)
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=nlist)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        sums = np.zeros_like(centroids)
+        sums[filled] = np.add.reduceat(sample[order], starts, axis=0)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty lists with random sample points
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def _write_atomic(path: str, write):
+    tmp = f"{path}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _npy_writer(array: np.ndarray):
+    """_write_atomic callback saving `array` as .npy (np.save on a path would append .npy to the temp name)"""
+    def write(tmp):
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+    return write
+
+
+# === INDEX ===
+class LocalVectorIndex:
+    """Read-only view of an index directory written by `LocalVectorIndex.build`.
+
+    Safe to search from several threads. Rebuilding the directory replaces the
+    files atomically (meta.json last), and open memory maps keep reading the
+    previous files until the index is reopened.
+    """
+
+    def __init__(self, path: str = LOCAL_INDEX_DIR):
+        self.path = path
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.version: str = self.meta["version"]
+        self.count: int = self.meta["count"]
+        self.dim: int = self.meta["dim"]
+        if self.count:
+            self.vectors = np.memmap(os.path.join(path, EMBEDDINGS_FILE), dtype=np.float32, mode="r",
+                                     shape=(self.count, self.dim))
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.doc_offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        self.centroids: np.ndarray | None = None
+        self.list_offsets: np.ndarray | None = None
+        if self.meta.get("nlist"):
+            self.centroids = np.load(os.path.join(path, CENTROIDS_FILE))
+            self.list_offsets = np.load(os.path.join(path, LISTS_FILE))
+        self._docs = open(os.path.join(path, DOCUMENTS_FILE), "rb")
+        self._docs_lock = threading.Lock()
+
+    @staticmethod
+    def read_version(path: str = LOCAL_INDEX_DIR) -> str | None:
+        """Version id of the index on disk, or None if there is no index"""
+        try:
+            with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+                return json.load(f)["version"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @classmethod
+    def build(cls, path: str, vectors: np.ndarray, documents: list[dict], *,
+              brute_force_max: int = LOCAL_INDEX_BRUTE_FORCE_MAX, nlist: int | None = None,
+              model: str | None = None) -> "LocalVectorIndex":
+        """Write an index directory from embeddings and their documents.
+
+        Args:
+            path: Index directory (created if missing)
+            vectors: (n, dim) float32 embeddings, may itself be a memmap
+            documents: n dicts with "page_content" and "metadata"
+            brute_force_max: Above this many vectors an IVF structure is built
+            nlist: Number of IVF lists (default: about sqrt(n))
+            model: Embedding model name recorded in meta.json
+        """
+        if len(vectors) != len(documents):
+            raise ValueError(f"{len(vectors)} vectors for {len(documents)} documents")
+        os.makedirs(path, exist_ok=True)
+        count = len(vectors)
+        dim = int(vectors.shape[1]) if np.ndim(vectors) == 2 else 0
+
+        order = np.arange(count)
+        centroids = list_offsets = None
+        if count > brute_force_max:
+            nlist = min(nlist or int(np.clip(np.sqrt(count), 8, 4096)), count)
+            centroids = _train_ivf(vectors, nlist)
+            nlist = len(centroids)
+            assignment = _assign(vectors, centroids)
+            # Regroup rows so each IVF list is one contiguous slice of the matrix
+            order = np.argsort(assignment, kind="stable")
+            list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=nlist)))).astype(np.int64)
+
+        def write_vectors(tmp):
+            if not count:
+                open(tmp, "wb").close()
+                return
+            out = np.memmap(tmp, dtype=np.float32, mode="w+", shape=(count, dim))
+            for start in range(0, count, SCAN_CHUNK_ROWS):
+                rows = order[start:start + SCAN_CHUNK_ROWS]
+                out[start:start + len(rows)] = _normalize(np.asarray(vectors[rows], dtype=np.float32))
+            out.flush()
+            del out
+
+        def write_documents(tmp):
+            offsets = [0]
+            with open(tmp, "wb") as f:
+                for row in order:
+                    doc = documents[row]
+                    line = json.dumps({"page_content": doc["page_content"], "metadata": doc.get("metadata") or {}},
+                                      ensure_ascii=False).encode("utf-8") + b"\n"
+                    f.write(line)
+                    offsets.append(offsets[-1] + len(line))
+            np.save(offsets_tmp, np.asarray(offsets, dtype=np.int64))
+
+        offsets_tmp = os.path.join(path, f"{OFFSETS_FILE}.tmp.npy")
+        _write_atomic(os.path.join(path, EMBEDDINGS_FILE), write_vectors)
+        _write_atomic(os.path.join(path, DOCUMENTS_FILE), write_documents)
+        os.replace(offsets_tmp, os.path.join(path, OFFSETS_FILE))
+        if centroids is not None:
+            _write_atomic(os.path.join(path, CENTROIDS_FILE), _npy_writer(centroids.astype(np.float32)))
+            _write_atomic(os.path.join(path, LISTS_FILE), _npy_writer(list_offsets))
+
+        meta = {
+            "version": uuid.uuid4().hex,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "count": count,
+            "dim": dim,
+            "model": model,
+            "nlist": int(len(centroids)) if centroids is not None else 0
+        }
+
+        def write_meta(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=2)
+
+        _write_atomic(os.path.join(path, META_FILE), write_meta)
+        return cls(path)
+
+    def _scan(self, q: np.ndarray, ranges: Iterable[tuple[int, int]]) -> tuple[np.ndarray, np.ndarray]:
+        rows, scores = [], []
+        for start, end in ranges:
+            for chunk_start in range(start, end, SCAN_CHUNK_ROWS):
+                chunk_end = min(end, chunk_start + SCAN_CHUNK_ROWS)
+                scores.append(self.vectors[chunk_start:chunk_end] @ q)
+                rows.append(np.arange(chunk_start, chunk_end))
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return np.concatenate(rows), np.concatenate(scores)
+
+    def search(self, query, k: int = 4, nprobe: int | None = None, exact: bool = False) -> list[tuple[int, float]]:
+        """Top-k rows by cosine similarity as (row, score), best first.
+
+        Uses the IVF lists when the index has them, unless `exact` is set.
+        """
+        if not self.count or k <= 0:
+            return []
+        q = _normalize(np.asarray(query, dtype=np.float32))
+        if exact or self.centroids is None:
+            rows, scores = self._scan(q, [(0, self.count)])
+        else:
+            nprobe = min(nprobe or LOCAL_INDEX_NPROBE, len(self.centroids))
+            probe = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+            rows, scores = self._scan(q, ((int(self.list_offsets[l]), int(self.list_offsets[l + 1])) for l in probe))
+        k = min(k, len(scores))
+        if not k:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def document(self, row: int) -> dict:
+        start, end = int(self.doc_offsets[row]), int(self.doc_offsets[row + 1])
+        with self._docs_lock:
+            self._docs.seek(start)
+            line = self._docs.read(end - start)
+        return json.loads(line)
+
+    def documents(self) -> Iterable[dict]:
+        with open(os.path.join(self.path, DOCUMENTS_FILE), encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def close(self):
+        self._docs.close()
+
+
+# === LANGCHAIN VECTOR STORE ===
+class LocalVectorStore(VectorStore):
+    """LangChain vector store over a LocalVectorIndex, interchangeable with PineconeVectorStore.
+
+    Scores are cosine similarities. `reload()` picks up a re-ingested index
+    without restarting the process.
+    """
+
+    def __init__(self, index_dir: str = LOCAL_INDEX_DIR, embedding: Embeddings | None = None):
+        self.index_dir = index_dir
+        self._embedding = embedding
+        self.index = LocalVectorIndex(index_dir)
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self) -> Embeddings | None:
+        return self._embedding
+
+    def reload(self) -> bool:
+        """Reopen the index if it was rebuilt on disk; returns True when it changed"""
+        version = LocalVectorIndex.read_version(self.index_dir)
+        if version is None or version == self.index.version:
+            return False
+        with self._lock:
+            if version != self.index.version:
+                old, self.index = self.index, LocalVectorIndex(self.index_dir)
+                old.close()
+        return True
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1.0) / 2.0
+
+    def similarity_search_with_score_by_vector(self, embedding: list[float], k: int = 4,
+                                               **kwargs: Any) -> list[tuple[Document, float]]:
+        index = self.index
+        results = []
+        for row, score in index.search(embedding, k, nprobe=kwargs.get("nprobe")):
+            doc = index.document(row)
+            results.append((Document(page_content=doc["page_content"], metadata=doc["metadata"]), score))
+        return results
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def add_texts(self, texts: Iterable[str], metadatas: list[dict] | None = None, **kwargs: Any) -> list[str]:
+        """Embed and append texts, rewriting the index directory"""
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = [uuid.uuid4().hex for _ in texts]
+        new_vectors = np.asarray(self._embedding.embed_documents(texts), dtype=np.float32)
+        with self._lock:
+            existing = list(self.index.documents())
+            vectors = np.vstack([np.asarray(self.index.vectors), new_vectors]) if self.index.count else new_vectors
+            documents = existing + [
+                {"page_content": text, "metadata": {**meta, "id": doc_id}}
+                for text, meta, doc_id in zip(texts, metadatas, ids)
+            ]
+            old, self.index = self.index, LocalVectorIndex.build(self.index_dir, vectors, documents,
+                                                                  model=self.index.meta.get("model"))
+            old.close()
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts: list[str], embedding: Embeddings, metadatas: list[dict] | None = None,
+                   index_dir: str = LOCAL_INDEX_DIR, **kwargs: Any) -> "LocalVectorStore":
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.asarray(embedding.embed_documents(list(texts)), dtype=np.float32)
+        documents = [{"page_content": t, "metadata": m} for t, m in zip(texts, metadatas)]
+        LocalVectorIndex.build(index_dir, vectors, documents)
+        return cls(index_dir, embedding)
+
+
+# === INGESTION ===
+def _chunk_text(text: str, size: int, overlap: int) -> list[str]:
+    """Split text into ~size-character chunks on paragraph/line/word boundaries"""
+    text = text.strip()
+    chunks, start = [], 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            for sep in ("\n\n", "\n", ". ", " "):
+                cut = text.rfind(sep, start + size // 2, end)
+                if cut != -1:
+                    end = cut + len(sep)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def _read_source(source: str) -> Iterable[dict]:
+    """Yield {"page_content", "metadata"} records from a directory of .txt/.md files or a JSONL file"""
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith((".txt", ".md")):
+                    file_path = os.path.join(root, name)
+                    with open(file_path, encoding="utf-8") as f:
+                        yield {"page_content": f.read(), "metadata": {"source": os.path.relpath(file_path, source)}}
+    else:
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    text = record.get("page_content") or record.get("text") or ""
+                    yield {"page_content": text, "metadata": record.get("metadata") or {}}
+
+
+def _load_embedder(model_name: str) -> Embeddings:
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"normalize_embeddings": True})
+
+
+def ingest(source: str, index_dir: str = LOCAL_INDEX_DIR, chunk_size: int = 1000, chunk_overlap: int = 150,
+           batch_size: int = 64, model_name: str = RAG_EMBEDDING_MODEL) -> LocalVectorIndex:
+    """Chunk, embed and index a document source into `index_dir`"""
+    documents = []
+    for record in _read_source(source):
+        for i, chunk in enumerate(_chunk_text(record["page_content"], chunk_size, chunk_overlap)):
+            documents.append({"page_content": chunk, "metadata": {**record["metadata"], "chunk": i}})
+    if not documents:
+        raise ValueError(f"No text found in {source}")
+
+    embedder = _load_embedder(model_name)
+    os.makedirs(index_dir, exist_ok=True)
+    staging = os.path.join(index_dir, "ingest.f32.tmp")
+    dim = None
+    started = time.perf_counter()
+    with open(staging, "wb") as f:
+        for start in range(0, len(documents), batch_size):
+            batch = np.asarray(embedder.embed_documents(
+                [d["page_content"] for d in documents[start:start + batch_size]]
+            ), dtype=np.float32)
+            dim = batch.shape[1]
+            f.write(batch.tobytes())
+            print(f"Embedded {min(start + batch_size, len(documents))}/{len(documents)} chunks", file=sys.stderr)
+    vectors = np.memmap(staging, dtype=np.float32, mode="r", shape=(len(documents), dim))
+    index = LocalVectorIndex.build(index_dir, vectors, documents, model=model_name)
+    del vectors
+    os.remove(staging)
+    print(f"Indexed {index.count} chunks (dim {index.dim}, nlist {index.meta['nlist']}) "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return index
+
+
+def export_pinecone(index_dir: str = LOCAL_INDEX_DIR, namespace: str = "", batch_size: int = 100) -> LocalVectorIndex:
+    """Copy vectors and texts from the PINECONE_INDEX index into a local index (no re-embedding)"""
+    from pinecone import Pinecone
+
+    pinecone_index = os.environ["PINECONE_INDEX"]
+    index = Pinecone(api_key=os.environ["PINECONE_API_KEY"]).Index(pinecone_index)
+    vectors, documents = [], []
+    for ids in index.list(namespace=namespace, limit=batch_size):
+        fetched = index.fetch(ids=list(ids), namespace=namespace)
+        for vector in fetched.vectors.values():
+            metadata = dict(vector.metadata or {})
+            # PineconeVectorStore keeps the chunk text in the "text" metadata field
+            text = metadata.pop("text", "")
+            vectors.append(vector.values)
+            documents.append({"page_content": text, "metadata": {**metadata, "id": vector.id}})
+        print(f"Fetched {len(documents)} vectors", file=sys.stderr)
+    return LocalVectorIndex.build(index_dir, np.asarray(vectors, dtype=np.float32), documents,
+                                  model=f"pinecone:{pinecone_index}")
+
+
+def bench(index_dir: str = LOCAL_INDEX_DIR, queries: int = 200, k: int = 8, nprobe: int | None = None):
+    """Latency of exact vs IVF search and IVF recall@k, using indexed vectors as queries"""
+    index = LocalVectorIndex(index_dir)
+    rng = np.random.default_rng(0)
+    rows = rng.choice(index.count, min(queries, index.count), replace=False)
+    probes = np.asarray(index.vectors[np.sort(rows)]) + rng.normal(0, 0.01, (len(rows), index.dim)).astype(np.float32)
+
+    timings, results = {}, {}
+    for mode, exact in (("exact", True), ("ivf", False)):
+        if mode == "ivf" and index.centroids is None:
+            continue
+        started = time.perf_counter()
+        results[mode] = [{row for row, _ in index.search(q, k, nprobe=nprobe, exact=exact)} for q in probes]
+        timings[mode] = (time.perf_counter() - started) / len(probes) * 1000
+
+    print(f"{index.count} vectors, dim {index.dim}, nlist {index.meta['nlist']}")
+    for mode, ms in timings.items():
+        print(f"  {mode:5s}: {ms:8.2f} ms/query")
+    if "ivf" in results:
+        recall = np.mean([len(a & b) / len(a) for a, b in zip(results["exact"], results["ivf"])])
+        print(f"  ivf recall@{k}: {recall:.3f} (nprobe {nprobe or LOCAL_INDEX_NPROBE})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local vector index for the agent's RAG knowledge base")
+    parser.add_argument("--index-dir", default=LOCAL_INDEX_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_cmd = commands.add_parser("ingest", help="Chunk, embed and index a directory of .txt/.md files or a JSONL file")
+    ingest_cmd.add_argument("source")
+    ingest_cmd.add_argument("--chunk-size", type=int, default=1000)
+    ingest_cmd.add_argument("--chunk-overlap", type=int, default=150)
+    ingest_cmd.add_argument("--model", default=RAG_EMBEDDING_MODEL)
+
+    export_cmd = commands.add_parser("export-pinecone", help="Copy the PINECONE_INDEX index into a local index")
+    export_cmd.add_argument("--namespace", default="")
+
+    query_cmd = commands.add_parser("query", help="Search the local index")
+    query_cmd.add_argument("text")
+    query_cmd.add_argument("--k", type=int, default=4)
+
+    bench_cmd = commands.add_parser("bench", help="Measure exact vs IVF latency and recall")
+    bench_cmd.add_argument("--queries", type=int, default=200)
+    bench_cmd.add_argument("--k", type=int, default=8)
+    bench_cmd.add_argument("--nprobe", type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == "ingest":
+        ingest(args.source, args.index_dir, args.chunk_size, args.chunk_overlap, model_name=args.model)
+    elif args.command == "export-pinecone":
+        export_pinecone(args.index_dir, args.namespace)
+    elif args.command == "query":
+        store = LocalVectorStore(args.index_dir, _load_embedder(RAG_EMBEDDING_MODEL))
+        started = time.perf_counter()
+        hits = store.similarity_search_with_score(args.text, k=args.k)
+        print(f"{len(hits)} results in {(time.perf_counter() - started) * 1000:.1f} ms")
+        for doc, score in hits:
+            print(f"\n[{score:.3f}] {doc.metadata}\n{doc.page_content[:300]}")
+    elif args.command == "bench":
+        bench(args.index_dir, args.queries, args.k, args.nprobe)
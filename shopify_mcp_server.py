@@ -1,16 +1,35 @@
 import os
 import json
-from typing import Any
+import gzip
+import time
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import math
+import sys
+import threading
+import weakref
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Iterable
 import httpx
-from mcp.server.fastmcp import FastMCP
-from dotenv import load_dotenv
+from mcp.server.fastmcp import FastMCP, Context
 from starlette.applications import Starlette
 from starlette.routing import Route, Mount
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response, FileResponse, PlainTextResponse
 
-# Load environment variables from .env file
-load_dotenv()
+try:
+    import brotli  # Optional: enables "br" response compression
+except ImportError:
+    brotli = None
+
+# Load environment variables from .env file (local development only; hosted
+# deployments set real env vars, so skip the dotenv search/parse on cold start)
+_DOTENV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+if os.path.exists(_DOTENV_PATH):
+    from dotenv import load_dotenv
+    load_dotenv(_DOTENV_PATH)
 
 # Read from environment variables for security
 SHOPIFY_ADMIN_API_BASE_URL = os.getenv(
@@ -22,12 +41,71 @@ SHOPIFY_ACCESS_TOKEN = os.getenv("SHOPIFY_ACCESS_TOKEN")
 # Enable dummy responses for testing (returns mock data when API fails)
 USE_DUMMY_RESPONSES = os.getenv("USE_DUMMY_RESPONSES", "false").lower() in ("true", "1", "yes")
 
+# REST responses smaller than this (in bytes) are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+
+# Directory where bulk export JSONL files are written
+BULK_EXPORT_DIR = os.getenv("BULK_EXPORT_DIR", "exports")
+
+# Export files older than this are deleted whenever a new export is written (0 keeps them)
+EXPORT_RETENTION_SECONDS = float(os.getenv("EXPORT_RETENTION_SECONDS", "86400"))
+
+# Token required by the /debug/* profiling endpoints (endpoints are disabled when unset)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Number of keep-alive connections to Shopify opened during startup warm-up
+SHOPIFY_WARM_CONNECTIONS = int(os.getenv("SHOPIFY_WARM_CONNECTIONS", "2"))
+
+# Stateless streamable HTTP: every /mcp request is self-contained (no Mcp-Session-Id
+# affinity), so any instance behind a load balancer can serve any request
+MCP_STATELESS_HTTP = os.getenv("MCP_STATELESS_HTTP", "false").lower() in ("true", "1", "yes")
+
+# Answer /mcp requests with plain JSON instead of an SSE stream (disables progress notifications)
+MCP_JSON_RESPONSE = os.getenv("MCP_JSON_RESPONSE", "false").lower() in ("true", "1", "yes")
+
 # Initialize FastMCP server (host=0.0.0.0 allows any Host header for cloud deployment)
-mcp = FastMCP("shopify-orders", host="0.0.0.0")
+mcp = FastMCP(
+    "shopify-orders",
+    host="0.0.0.0",
+    stateless_http=MCP_STATELESS_HTTP,
+    json_response=MCP_JSON_RESPONSE
+)
 
 # MCP ASGI app (Streamable HTTP transport)
 mcp_app = mcp.streamable_http_app()
 
+# === SHOPIFY CONNECTION POOL ===
+# event loop -> shared keep-alive client for that loop
+_shopify_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _get_shopify_client() -> httpx.AsyncClient:
+    """
+    Return the shared keep-alive HTTP client for the running event loop.
+    
+    Reusing one client keeps TLS connections to Shopify open between calls.
+    Connections cannot be shared across loops, so each loop (the server loop,
+    a background bridge loop, asyncio.run in scripts) keeps its own client;
+    switching between loops reuses them instead of replacing one another.
+    """
+    loop = asyncio.get_running_loop()
+    client = _shopify_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=300.0)
+        )
+        _shopify_clients[loop] = client
+    return client
+
+
+async def _close_shopify_client() -> None:
+    """Close the running loop's client (each client must be closed on its own loop)."""
+    client = _shopify_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
 async def _make_shopify_request(
     method: str, 
     endpoint: str, 
@@ -57,16 +135,601 @@ async def _make_shopify_request(
         "X-Shopify-Access-Token": SHOPIFY_ACCESS_TOKEN
     }
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        if method.upper() == "GET":
-            response = await client.get(url, headers=headers)
-        elif method.upper() == "POST":
-            response = await client.post(url, json=json_data, headers=headers)
-        else:
-            raise ValueError(f"Unsupported HTTP method: {method}")
+    client = _get_shopify_client()
+    if method.upper() == "GET":
+        response = await client.get(url, headers=headers)
+    elif method.upper() == "POST":
+        response = await client.post(url, json=json_data, headers=headers)
+    else:
+        raise ValueError(f"Unsupported HTTP method: {method}")
+    
+    response.raise_for_status()
+    return response.json()
+
+
+async def _make_shopify_graphql(query: str, variables: dict | None = None) -> dict[str, Any]:
+    """
+    Run a query or mutation against the Shopify Admin GraphQL API.
+    
+    Args:
+        query: GraphQL document
+        variables: Optional GraphQL variables
+        
+    Returns:
+        The "data" member of the GraphQL response
+        
+    Raises:
+        ValueError: If access token is missing
+        httpx.HTTPError: If the request fails
+        RuntimeError: If the response contains GraphQL errors
+    """
+    result = await _make_shopify_request("POST", "/graphql.json", {"query": query, "variables": variables or {}})
+    if result.get("errors"):
+        raise RuntimeError(f"GraphQL errors: {json.dumps(result['errors'])}")
+    return result.get("data", {})
+
+
+async def _iter_shopify_pages(endpoint: str, params: dict | None = None):
+    """
+    Iterate over the pages of a paginated Shopify Admin REST list endpoint.
+    
+    Follows the cursor-based `Link: <...>; rel="next"` header until exhausted.
+    
+    Args:
+        endpoint: API endpoint path (e.g., '/products.json')
+        params: Query parameters for the first page (cursor pages carry their own)
+        
+    Yields:
+        Response JSON data for each page
         
+    Raises:
+        ValueError: If access token is missing
+        httpx.HTTPError: If a request fails
+    """
+    if not SHOPIFY_ACCESS_TOKEN:
+        raise ValueError("SHOPIFY_ACCESS_TOKEN environment variable is not set")
+    
+    url = f"{SHOPIFY_ADMIN_API_BASE_URL}{endpoint}"
+    headers = {"X-Shopify-Access-Token": SHOPIFY_ACCESS_TOKEN}
+    client = _get_shopify_client()
+    while url:
+        response = await client.get(url, params=params, headers=headers)
         response.raise_for_status()
-        return response.json()
+        yield response.json()
+        url = response.links.get("next", {}).get("url")
+        params = None
+
+
+# === VARIANT CATALOG CACHE ===
+# Seconds between incremental catalog refreshes (0 disables background loading)
+VARIANT_CACHE_REFRESH_SECONDS = int(os.getenv("VARIANT_CACHE_REFRESH_SECONDS", "300"))
+
+_VARIANT_FIELDS = "id,title,status,variants"
+
+
+class VariantCache:
+    """
+    In-memory catalog of product variants used to fill and validate order line items.
+    
+    The cache is bulk-loaded from /products.json, then refreshed incrementally with
+    updated_at_min so only products changed since the last refresh are fetched.
+    Variants missing from the cache are fetched individually on demand.
+    """
+
+    def __init__(self):
+        self._variants: dict[int, dict] = {}
+        self._product_variants: dict[int, set[int]] = {}
+        self._lock = asyncio.Lock()
+        self.loaded = False
+        self.last_refresh: str | None = None
+
+    def __len__(self) -> int:
+        return len(self._variants)
+
+    def _store_product(self, product: dict) -> None:
+        """Replace the cached variants of a product (drops variants removed from it)."""
+        product_id = product.get("id")
+        active = product.get("status", "active") == "active"
+        variant_ids = set()
+        for variant in product.get("variants", []) or []:
+            variant_ids.add(variant["id"])
+            self._variants[variant["id"]] = {
+                "variant_id": variant["id"],
+                "product_id": product_id,
+                "title": product.get("title"),
+                "variant_title": variant.get("title"),
+                "price": variant.get("price"),
+                "active": active,
+                "inventory_management": variant.get("inventory_management"),
+                "inventory_policy": variant.get("inventory_policy"),
+                "inventory_quantity": variant.get("inventory_quantity")
+            }
+        for stale_id in self._product_variants.get(product_id, set()) - variant_ids:
+            self._variants.pop(stale_id, None)
+        self._product_variants[product_id] = variant_ids
+
+    async def _load(self, params: dict) -> int:
+        refresh_started = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        count = 0
+        async for page in _iter_shopify_pages("/products.json", params):
+            for product in page.get("products", []):
+                self._store_product(product)
+                count += 1
+        self.last_refresh = refresh_started
+        return count
+
+    async def bulk_load(self) -> int:
+        """Load the whole catalog. Returns the number of products loaded."""
+        async with self._lock:
+            count = await self._load({"limit": 250, "fields": _VARIANT_FIELDS})
+            self.loaded = True
+            return count
+
+    async def refresh(self) -> int:
+        """Fetch only products updated since the last refresh. Returns the number refreshed."""
+        if not self.loaded:
+            return await self.bulk_load()
+        async with self._lock:
+            return await self._load({
+                "limit": 250,
+                "fields": _VARIANT_FIELDS,
+                "updated_at_min": self.last_refresh
+            })
+
+    async def get(self, variant_id: int, refresh: bool = False) -> dict | None:
+        """
+        Look up a variant, fetching it from Shopify on a cache miss.
+        
+        Args:
+            variant_id: Shopify variant ID
+            refresh: Fetch the variant from Shopify even if it is cached, e.g.
+                to confirm stock before rejecting an order (inventory changes
+                do not always bump the product's updated_at)
+        
+        Returns:
+            Cached variant info, or None if the variant does not exist
+        """
+        variant = None if refresh else self._variants.get(variant_id)
+        if variant is not None:
+            return variant
+        try:
+            result = await _make_shopify_request("GET", f"/variants/{variant_id}.json")
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                return None
+            raise
+        product_id = result.get("variant", {}).get("product_id")
+        product = await _make_shopify_request("GET", f"/products/{product_id}.json?fields={_VARIANT_FIELDS}")
+        self._store_product(product.get("product", {}))
+        return self._variants.get(variant_id)
+
+    async def run_refresh_loop(self) -> None:
+        """Bulk-load the catalog, then refresh it every VARIANT_CACHE_REFRESH_SECONDS."""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Variant cache refresh failed: {e}")
+            await asyncio.sleep(VARIANT_CACHE_REFRESH_SECONDS)
+
+
+variant_cache = VariantCache()
+
+
+def _variant_available(variant: dict, quantity: int) -> bool:
+    """Whether a cached variant can be sold in the requested quantity."""
+    if not variant.get("active"):
+        return False
+    if not variant.get("inventory_management") or variant.get("inventory_policy") == "continue":
+        return True
+    return (variant.get("inventory_quantity") or 0) >= quantity
+
+
+async def _resolve_line_items(line_items: list[dict]) -> tuple[list[dict], list[dict]]:
+    """
+    Fill title/price of variant line items from the catalog cache and validate them.
+    
+    Placeholder values sent by clients ("Product", price 0) are replaced with the
+    catalog values; explicit values are kept. Line items without a variant_id
+    (custom items) are passed through unchanged.
+    
+    Returns:
+        Tuple of (resolved line items, problems) where problems lists invalid
+        or unavailable line items; the order must not be created if non-empty
+    """
+    resolved = []
+    problems = []
+    for index, item in enumerate(line_items):
+        item = dict(item)
+        if "variant_id" not in item:
+            resolved.append(item)
+            continue
+        quantity = item.get("quantity", 1)
+        try:
+            variant_id = int(item["variant_id"])
+        except (TypeError, ValueError):
+            problems.append({"index": index, "variant_id": item["variant_id"], "reason": "invalid variant ID"})
+            continue
+        variant = await variant_cache.get(variant_id)
+        if variant is None:
+            problems.append({"index": index, "variant_id": variant_id, "reason": "variant not found"})
+            continue
+        if not _variant_available(variant, quantity):
+            # The cached stock may be stale; only reject on Shopify's current numbers
+            variant = await variant_cache.get(variant_id, refresh=True)
+            if variant is None:
+                problems.append({"index": index, "variant_id": variant_id, "reason": "variant not found"})
+                continue
+            if not _variant_available(variant, quantity):
+                problems.append({"index": index, "variant_id": variant_id, "reason": "out of stock"})
+                continue
+        item["variant_id"] = variant_id
+        if not item.get("title") or item.get("title") == "Product":
+            item["title"] = variant["title"]
+        if not item.get("price"):
+            item["price"] = variant["price"]
+        resolved.append(item)
+    return resolved, problems
+
+
+# === ORDER STORE ===
+def _project_order(order: dict) -> dict:
+    """Project a Shopify REST order into the order shape returned by get_order_status."""
+    # Format line items
+    line_items = []
+    for item in order.get("line_items", []):
+        line_items.append({
+            "title": item.get("title"),
+            "quantity": item.get("quantity"),
+            "price": item.get("price"),
+            "variant_id": item.get("variant_id"),
+            "fulfillment_status": item.get("fulfillment_status")
+        })
+    
+    # Format fulfillments
+    fulfillments = []
+    for fulfillment in order.get("fulfillments", []):
+        fulfillments.append({
+            "status": fulfillment.get("status"),
+            "tracking_company": fulfillment.get("tracking_company"),
+            "tracking_number": fulfillment.get("tracking_number"),
+            "created_at": fulfillment.get("created_at")
+        })
+    
+    customer = order.get("customer") or {}
+    return {
+        "order_id": order.get("id"),
+        "order_number": order.get("order_number"),
+        "financial_status": order.get("financial_status"),
+        "fulfillment_status": order.get("fulfillment_status"),
+        "total_price": order.get("total_price"),
+        "currency": order.get("currency"),
+        "created_at": order.get("created_at"),
+        "updated_at": order.get("updated_at"),
+        "cancelled_at": order.get("cancelled_at"),
+        "test_order": order.get("test"),
+        "customer": {
+            "email": customer.get("email"),
+            "first_name": customer.get("first_name"),
+            "last_name": customer.get("last_name")
+        },
+        "line_items": line_items,
+        "fulfillments": fulfillments,
+        "tags": order.get("tags"),
+        "note": order.get("note")
+    }
+
+
+def _intern(value: str | None) -> str | None:
+    """Intern repeated strings (statuses, currencies, titles) so records share one object."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+# Amounts are held as integer thousandths of the currency unit, exact for every
+# ISO 4217 currency (at most 3 decimals) and comparable across currencies
+_AMOUNT_SCALE = 3
+# Currencies with 3 minor-unit digits; Shopify prints every other currency with 2 decimals
+_THREE_DECIMAL_CURRENCIES = frozenset({"BHD", "IQD", "JOD", "KWD", "LYD", "OMR", "TND"})
+
+
+def _currency_exponent(currency: str | None) -> int:
+    return 3 if currency in _THREE_DECIMAL_CURRENCIES else 2
+
+
+def _to_milli(value) -> int | None:
+    """Convert a Shopify price string ("29.99", "1.234") to integer thousandths, without float rounding."""
+    if value in (None, ""):
+        return None
+    return int(Decimal(str(value)).scaleb(_AMOUNT_SCALE).to_integral_value(ROUND_HALF_UP))
+
+
+def _milli_to_decimal(milli: int | None) -> Decimal | None:
+    """Convert integer thousandths into a 3-place Decimal (None if missing)."""
+    return None if milli is None else Decimal(milli).scaleb(-_AMOUNT_SCALE)
+
+
+def _from_milli(milli: int | None, currency: str | None) -> str | None:
+    """Convert integer thousandths back to a Shopify price string with the currency's decimals."""
+    if milli is None:
+        return None
+    exponent = Decimal(1).scaleb(-_currency_exponent(currency))
+    return str(_milli_to_decimal(milli).quantize(exponent, rounding=ROUND_HALF_UP))
+
+
+class LineItemRecord:
+    """Compact line item: interned title/status, price in integer thousandths."""
+
+    __slots__ = ("title", "quantity", "price_milli", "variant_id", "fulfillment_status")
+
+    def __init__(self, title, quantity, price_milli, variant_id, fulfillment_status):
+        self.title = _intern(title)
+        self.quantity = quantity
+        self.price_milli = price_milli
+        self.variant_id = variant_id
+        self.fulfillment_status = _intern(fulfillment_status)
+
+    @classmethod
+    def from_dict(cls, item: dict) -> "LineItemRecord":
+        return cls(
+            item.get("title"),
+            item.get("quantity"),
+            _to_milli(item.get("price")),
+            item.get("variant_id"),
+            item.get("fulfillment_status")
+        )
+
+    def to_dict(self, currency: str | None = None) -> dict:
+        return {
+            "title": self.title,
+            "quantity": self.quantity,
+            "price": _from_milli(self.price_milli, currency),
+            "variant_id": self.variant_id,
+            "fulfillment_status": self.fulfillment_status
+        }
+
+
+class FulfillmentRecord:
+    """Compact fulfillment: interned status and carrier."""
+
+    __slots__ = ("status", "tracking_company", "tracking_number", "created_at")
+
+    def __init__(self, status, tracking_company, tracking_number, created_at):
+        self.status = _intern(status)
+        self.tracking_company = _intern(tracking_company)
+        self.tracking_number = tracking_number
+        self.created_at = created_at
+
+    @classmethod
+    def from_dict(cls, fulfillment: dict) -> "FulfillmentRecord":
+        return cls(
+            fulfillment.get("status"),
+            fulfillment.get("tracking_company"),
+            fulfillment.get("tracking_number"),
+            fulfillment.get("created_at")
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "tracking_company": self.tracking_company,
+            "tracking_number": self.tracking_number,
+            "created_at": self.created_at
+        }
+
+
+class OrderRecord:
+    """
+    Compact in-memory order.
+    
+    Uses __slots__ instead of a per-order dict, interned statuses and
+    currency, integer thousandths instead of price strings, a flattened customer
+    and tuples of line item / fulfillment records. to_dict() rebuilds the
+    shape returned by get_order_status.
+    """
+
+    __slots__ = (
+        "order_id", "order_number", "financial_status", "fulfillment_status",
+        "total_milli", "currency", "created_at", "updated_at", "cancelled_at",
+        "test_order", "email", "first_name", "last_name",
+        "line_items", "fulfillments", "tags", "note"
+    )
+
+    def __init__(self, order_id, order_number, financial_status, fulfillment_status,
+                 total_milli, currency, created_at, updated_at, cancelled_at,
+                 test_order, email, first_name, last_name,
+                 line_items=(), fulfillments=(), tags=None, note=None):
+        self.order_id = order_id
+        self.order_number = order_number
+        self.financial_status = _intern(financial_status)
+        self.fulfillment_status = _intern(fulfillment_status)
+        self.total_milli = total_milli
+        self.currency = _intern(currency)
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.cancelled_at = cancelled_at
+        self.test_order = test_order
+        self.email = email
+        self.first_name = first_name
+        self.last_name = last_name
+        self.line_items = tuple(line_items)
+        self.fulfillments = tuple(fulfillments)
+        self.tags = tags
+        self.note = note
+
+    @classmethod
+    def from_dict(cls, order: dict) -> "OrderRecord":
+        """Build a record from the order shape returned by get_order_status."""
+        customer = order.get("customer") or {}
+        return cls(
+            order.get("order_id"),
+            order.get("order_number"),
+            order.get("financial_status"),
+            order.get("fulfillment_status"),
+            _to_milli(order.get("total_price")),
+            order.get("currency"),
+            order.get("created_at"),
+            order.get("updated_at"),
+            order.get("cancelled_at"),
+            order.get("test_order"),
+            customer.get("email"),
+            customer.get("first_name"),
+            customer.get("last_name"),
+            [LineItemRecord.from_dict(item) for item in order.get("line_items") or []],
+            [FulfillmentRecord.from_dict(f) for f in order.get("fulfillments") or []],
+            order.get("tags"),
+            order.get("note")
+        )
+
+    def to_dict(self) -> dict:
+        """Rebuild the order shape returned by get_order_status."""
+        return {
+            "order_id": self.order_id,
+            "order_number": self.order_number,
+            "financial_status": self.financial_status,
+            "fulfillment_status": self.fulfillment_status,
+            "total_price": _from_milli(self.total_milli, self.currency),
+            "currency": self.currency,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "cancelled_at": self.cancelled_at,
+            "test_order": self.test_order,
+            "customer": {
+                "email": self.email,
+                "first_name": self.first_name,
+                "last_name": self.last_name
+            },
+            "line_items": [item.to_dict(self.currency) for item in self.line_items],
+            "fulfillments": [f.to_dict() for f in self.fulfillments],
+            "tags": self.tags,
+            "note": self.note
+        }
+
+
+class OrderStore:
+    """
+    In-memory mirror of orders, keyed by order ID.
+    
+    Filled by get_order_status lookups and bulk exports. Orders are held as
+    compact OrderRecord objects; use OrderRecord.to_dict() for the shape
+    returned by get_order_status.
+    """
+
+    def __init__(self):
+        self._orders: dict[int, OrderRecord] = {}
+        # Bumped on every change so derived snapshots know when to rebuild
+        self.version = 0
+        # Order IDs upserted since the last drain_changed() (patched into the analytics columns)
+        self._changed: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self._orders
+
+    def get(self, order_id: int) -> OrderRecord | None:
+        return self._orders.get(order_id)
+
+    def upsert(self, order: "dict | OrderRecord") -> None:
+        if isinstance(order, dict):
+            order = OrderRecord.from_dict(order)
+        if order.order_id is not None:
+            self._orders[order.order_id] = order
+            self._changed.add(order.order_id)
+            self.version += 1
+
+    def add_line_items(self, order_id: int, line_items: Iterable[dict]) -> None:
+        """Append line items to a stored order; pass all of an order's items at once (the tuple is copied per call)."""
+        order = self._orders.get(order_id)
+        if order is not None:
+            order.line_items += tuple(LineItemRecord.from_dict(item) for item in line_items)
+            self._changed.add(order_id)
+            self.version += 1
+
+    def values(self):
+        return self._orders.values()
+
+    def drain_changed(self) -> list[OrderRecord]:
+        """Records upserted or given line items since the previous call."""
+        changed, self._changed = self._changed, set()
+        return [self._orders[order_id] for order_id in changed]
+
+
+order_store = OrderStore()
+
+
+# === TOOL PROGRESS & PARTIAL RESULTS ===
+# Minimum seconds between progress notifications (also the keep-alive interval)
+PROGRESS_INTERVAL_SECONDS = float(os.getenv("PROGRESS_INTERVAL_SECONDS", "1.0"))
+
+
+class ToolProgress:
+    """
+    Progress and partial-result reporting for long-running tools.
+    
+    Only active when the client sent a progress token with the tool call;
+    otherwise (and for direct, non-MCP calls with ctx=None) every method is a
+    no-op. Progress notifications are throttled to PROGRESS_INTERVAL_SECONDS.
+    Partial results are sent as `notifications/message` with logger
+    "partial_result", so clients can consume early results before the final
+    tool result arrives.
+    """
+
+    def __init__(self, ctx: Context | None, tool: str, total: float | None = None):
+        meta = ctx.request_context.meta if ctx is not None else None
+        self.ctx = ctx if meta is not None and meta.progressToken is not None else None
+        self.tool = tool
+        self.total = total
+        self.progress = 0.0
+        self.message: str | None = None
+        self._last_sent = 0.0
+        self._partials = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ctx is not None
+
+    async def advance(self, amount: float = 1, message: str | None = None, force: bool = False) -> None:
+        """Add to the progress count and notify the client if the interval has passed."""
+        self.progress += amount
+        if message is not None:
+            self.message = message
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if force or now - self._last_sent >= PROGRESS_INTERVAL_SECONDS:
+            self._last_sent = now
+            await self.ctx.report_progress(self.progress, self.total, self.message)
+
+    async def partial(self, data: Any) -> None:
+        """Send a partial result for the current tool call."""
+        if not self.enabled:
+            return
+        self._partials += 1
+        await self.ctx.request_context.session.send_log_message(
+            level="info",
+            data={"tool": self.tool, "sequence": self._partials, "progress": self.progress, "result": data},
+            logger="partial_result",
+            related_request_id=self.ctx.request_id
+        )
+
+    @contextlib.asynccontextmanager
+    async def keepalive(self, message: str | None = None):
+        """Re-send the current progress periodically while a long step is awaited."""
+        if not self.enabled:
+            yield
+            return
+
+        async def beat():
+            while True:
+                await asyncio.sleep(PROGRESS_INTERVAL_SECONDS)
+                await self.advance(0, message, force=True)
+
+        task = asyncio.create_task(beat())
+        try:
+            yield
+        finally:
+            task.cancel()
 
 
 @mcp.tool()
@@ -86,15 +749,16 @@ async def create_order(
         line_items: Array of line item objects. Each line item should contain:
             - variant_id (int): The Shopify variant ID
             - quantity (int): Quantity to order
-            - title (str, optional): Product title
-            - price (float, optional): Price per item
+            - title (str, optional): Product title (filled from the catalog if omitted)
+            - price (float, optional): Price per item (filled from the catalog if omitted)
         customer_email: Optional customer email address
         financial_status: Financial status of the order (default: "pending")
             Options: "pending", "authorized", "paid", "partially_paid", "refunded", "voided"
         test: Whether to create as a test order (default: True)
     
     Returns:
-        JSON string with the created order details including order ID, status, and line items
+        JSON string with the created order details including order ID, status, and line items.
+        Unknown or out-of-stock variants are rejected before the order is created.
         
     Example:
         create_order(
@@ -109,20 +773,30 @@ async def create_order(
             test=True
         )
     """
-    # Build the order payload
-    order_payload = {
-        "order": {
-            "line_items": line_items,
-            "financial_status": financial_status,
-            "test": test
-        }
-    }
-    
-    # Add customer email if provided
-    if customer_email:
-        order_payload["order"]["customer"] = {"email": customer_email}
-    
     try:
+        # Fill title/price and reject invalid variants before spending a write call
+        resolved_items, problems = await _resolve_line_items(line_items)
+        if problems:
+            return json.dumps({
+                "success": False,
+                "error": "Invalid Line Items",
+                "message": "One or more line items cannot be ordered",
+                "invalid_line_items": problems
+            }, indent=2)
+        
+        # Build the order payload
+        order_payload = {
+            "order": {
+                "line_items": resolved_items,
+                "financial_status": financial_status,
+                "test": test
+            }
+        }
+        
+        # Add customer email if provided
+        if customer_email:
+            order_payload["order"]["customer"] = {"email": customer_email}
+        
         result = await _make_shopify_request("POST", "/orders.json", order_payload)
         
         # Format the response nicely
@@ -137,6 +811,10 @@ async def create_order(
             "created_at": order.get("created_at"),
             "test_order": order.get("test"),
             "line_items_count": len(order.get("line_items", [])),
+            "line_items": [
+                {"title": item.get("title"), "quantity": item.get("quantity"), "price": item.get("price"), "variant_id": item.get("variant_id")}
+                for item in order.get("line_items", [])
+            ],
             "customer_email": order.get("customer", {}).get("email")
         }, indent=2)
         
@@ -216,16 +894,27 @@ async def create_order(
         }, indent=2)
 
 
+async def _find_order_id(order_number: int) -> int | None:
+    """Resolve a shop-facing order number (#1001) to the Shopify order ID by order name."""
+    result = await _make_shopify_request("GET", f"/orders.json?name=%23{order_number}&status=any&fields=id,name")
+    for order in result.get("orders", []):
+        if order.get("name", "").lstrip("#") == str(order_number):
+            return order.get("id")
+    return None
+
+
 @mcp.tool()
-async def get_order_status(order_id: int) -> str:
+async def get_order_status(order_id: int | None = None, order_number: int | None = None) -> str:
     """
-    Get the status and details of a Shopify order by order ID.
+    Get the status and details of a Shopify order by order ID or order number.
     
     This tool retrieves complete order information including current status,
     fulfillment details, line items, customer information, and payment status.
     
     Args:
         order_id: The Shopify order ID (numeric ID, not order number)
+        order_number: The shop-facing order number (e.g. 1001 for "#1001"), looked
+            up by order name when order_id is not given
     
     Returns:
         JSON string with comprehensive order details including:
@@ -238,56 +927,30 @@ async def get_order_status(order_id: int) -> str:
         
     Example:
         get_order_status(5904242344019)
+        get_order_status(order_number=1001)
     """
+    if order_id is None and order_number is None:
+        return json.dumps({
+            "success": False,
+            "error": "Invalid Arguments",
+            "message": "Provide order_id or order_number"
+        }, indent=2)
     try:
+        if order_id is None:
+            order_id = await _find_order_id(order_number)
+            if order_id is None:
+                return json.dumps({
+                    "success": False,
+                    "error": "Order Not Found",
+                    "message": f"No order with number #{order_number}"
+                }, indent=2)
         result = await _make_shopify_request("GET", f"/orders/{order_id}.json")
         
         # Extract and format key order information
-        order = result.get("order", {})
+        order = _project_order(result.get("order", {}))
+        order_store.upsert(order)
         
-        # Format line items
-        line_items = []
-        for item in order.get("line_items", []):
-            line_items.append({
-                "title": item.get("title"),
-                "quantity": item.get("quantity"),
-                "price": item.get("price"),
-                "variant_id": item.get("variant_id"),
-                "fulfillment_status": item.get("fulfillment_status")
-            })
-        
-        # Format fulfillments
-        fulfillments = []
-        for fulfillment in order.get("fulfillments", []):
-            fulfillments.append({
-                "status": fulfillment.get("status"),
-                "tracking_company": fulfillment.get("tracking_company"),
-                "tracking_number": fulfillment.get("tracking_number"),
-                "created_at": fulfillment.get("created_at")
-            })
-        
-        return json.dumps({
-            "success": True,
-            "order_id": order.get("id"),
-            "order_number": order.get("order_number"),
-            "financial_status": order.get("financial_status"),
-            "fulfillment_status": order.get("fulfillment_status"),
-            "total_price": order.get("total_price"),
-            "currency": order.get("currency"),
-            "created_at": order.get("created_at"),
-            "updated_at": order.get("updated_at"),
-            "cancelled_at": order.get("cancelled_at"),
-            "test_order": order.get("test"),
-            "customer": {
-                "email": order.get("customer", {}).get("email"),
-                "first_name": order.get("customer", {}).get("first_name"),
-                "last_name": order.get("customer", {}).get("last_name")
-            },
-            "line_items": line_items,
-            "fulfillments": fulfillments,
-            "tags": order.get("tags"),
-            "note": order.get("note")
-        }, indent=2)
+        return json.dumps({"success": True, **order}, indent=2)
         
     except ValueError as e:
         if USE_DUMMY_RESPONSES:
@@ -296,8 +959,8 @@ async def get_order_status(order_id: int) -> str:
             return json.dumps({
                 "success": True,
                 "dummy_mode": True,
-                "order_id": order_id,
-                "order_number": 1001,
+                "order_id": order_id or 9999999999,
+                "order_number": order_number or 1001,
                 "financial_status": "paid",
                 "fulfillment_status": "fulfilled",
                 "total_price": "150.00",
@@ -343,8 +1006,8 @@ async def get_order_status(order_id: int) -> str:
             return json.dumps({
                 "success": True,
                 "dummy_mode": True,
-                "order_id": order_id,
-                "order_number": 1001,
+                "order_id": order_id or 9999999999,
+                "order_number": order_number or 1001,
                 "financial_status": "paid",
                 "fulfillment_status": "fulfilled",
                 "total_price": "150.00",
@@ -398,8 +1061,8 @@ async def get_order_status(order_id: int) -> str:
             return json.dumps({
                 "success": True,
                 "dummy_mode": True,
-                "order_id": order_id,
-                "order_number": 1001,
+                "order_id": order_id or 9999999999,
+                "order_number": order_number or 1001,
                 "financial_status": "paid",
                 "fulfillment_status": "fulfilled",
                 "total_price": "150.00",
@@ -440,6 +1103,964 @@ async def get_order_status(order_id: int) -> str:
         }, indent=2)
 
 
+# Concurrent Shopify lookups per get_order_statuses call
+ORDER_LOOKUP_CONCURRENCY = int(os.getenv("ORDER_LOOKUP_CONCURRENCY", "4"))
+
+
+@mcp.tool()
+async def get_order_statuses(order_ids: list[int], ctx: Context | None = None) -> str:
+    """
+    Get the status of several Shopify orders at once.
+    
+    Orders are looked up concurrently. When the client sends a progress token,
+    progress is reported per order and each order is sent as a partial result
+    as soon as it arrives, before the complete result is returned.
+    
+    Args:
+        order_ids: Shopify order IDs (numeric IDs, not order numbers)
+    
+    Returns:
+        JSON string with one get_order_status result per order ID, in request order
+        
+    Example:
+        get_order_statuses([5904242344019, 5904242344020])
+    """
+    progress = ToolProgress(ctx, "get_order_statuses", total=len(order_ids))
+    semaphore = asyncio.Semaphore(max(1, ORDER_LOOKUP_CONCURRENCY))
+
+    async def lookup(order_id: int) -> dict:
+        async with semaphore:
+            result = json.loads(await get_order_status(order_id))
+        await progress.advance(1, f"Order {order_id}")
+        await progress.partial(result)
+        return result
+
+    results = await asyncio.gather(*(lookup(order_id) for order_id in order_ids))
+    await progress.advance(0, "Done", force=True)
+    return json.dumps({
+        "success": all(r.get("success") for r in results),
+        "count": len(results),
+        "orders": results
+    }, indent=2)
+
+
+# === BULK OPERATIONS EXPORT ===
+# Orders with nested line items; Shopify flattens nested connections into
+# JSONL rows that point at their parent through __parentId
+_BULK_ORDERS_QUERY = """
+{
+  orders%s {
+    edges {
+      node {
+        id
+        legacyResourceId
+        name
+        displayFinancialStatus
+        displayFulfillmentStatus
+        totalPriceSet { shopMoney { amount currencyCode } }
+        createdAt
+        updatedAt
+        cancelledAt
+        test
+        customer { email firstName lastName }
+        fulfillments { status createdAt trackingInfo { company number } }
+        tags
+        note
+        lineItems {
+          edges {
+            node {
+              id
+              title
+              quantity
+              originalUnitPriceSet { shopMoney { amount } }
+              variant { legacyResourceId }
+              unfulfilledQuantity
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+_BULK_RUN_MUTATION = """
+mutation bulkRun($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+
+_BULK_STATUS_QUERY = """
+query bulkStatus($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation {
+      id status errorCode objectCount fileSize url partialDataUrl createdAt completedAt
+    }
+  }
+}
+"""
+
+# Emit a progress notification every this many JSONL rows
+_BULK_PROGRESS_EVERY = 1000
+
+
+def _gid_to_id(gid: str | None) -> int | None:
+    """Convert a GraphQL global ID (gid://shopify/Order/123) to its numeric ID."""
+    if not gid:
+        return None
+    try:
+        return int(gid.rsplit("/", 1)[-1])
+    except ValueError:
+        return None
+
+
+def _project_bulk_order(node: dict) -> dict:
+    """Project a bulk export Order row into the order shape returned by get_order_status."""
+    money = (node.get("totalPriceSet") or {}).get("shopMoney") or {}
+    customer = node.get("customer") or {}
+    fulfillment_status = (node.get("displayFulfillmentStatus") or "").lower()
+    name = (node.get("name") or "").lstrip("#")
+    fulfillments = []
+    for fulfillment in node.get("fulfillments") or []:
+        tracking = (fulfillment.get("trackingInfo") or [{}])[0]
+        fulfillments.append({
+            "status": (fulfillment.get("status") or "").lower() or None,
+            "tracking_company": tracking.get("company"),
+            "tracking_number": tracking.get("number"),
+            "created_at": fulfillment.get("createdAt")
+        })
+    return {
+        "order_id": int(node["legacyResourceId"]) if node.get("legacyResourceId") else _gid_to_id(node.get("id")),
+        "order_number": int(name) if name.isdigit() else node.get("name"),
+        "financial_status": (node.get("displayFinancialStatus") or "").lower() or None,
+        "fulfillment_status": None if fulfillment_status in ("", "unfulfilled") else fulfillment_status,
+        "total_price": money.get("amount"),
+        "currency": money.get("currencyCode"),
+        "created_at": node.get("createdAt"),
+        "updated_at": node.get("updatedAt"),
+        "cancelled_at": node.get("cancelledAt"),
+        "test_order": node.get("test"),
+        "customer": {
+            "email": customer.get("email"),
+            "first_name": customer.get("firstName"),
+            "last_name": customer.get("lastName")
+        },
+        "line_items": [],
+        "fulfillments": fulfillments,
+        "tags": ", ".join(node.get("tags") or []),
+        "note": node.get("note")
+    }
+
+
+def _project_bulk_line_item(node: dict) -> dict:
+    """Project a bulk export LineItem row into the line item shape returned by get_order_status."""
+    price = ((node.get("originalUnitPriceSet") or {}).get("shopMoney") or {}).get("amount")
+    return {
+        "title": node.get("title"),
+        "quantity": node.get("quantity"),
+        "price": price,
+        "variant_id": int((node.get("variant") or {}).get("legacyResourceId") or 0) or None,
+        "fulfillment_status": "fulfilled" if node.get("unfulfilledQuantity") == 0 else None
+    }
+
+
+@mcp.tool()
+async def start_bulk_export(updated_since: str | None = None) -> str:
+    """
+    Start a Shopify Bulk Operation that exports all orders with their line items.
+    
+    Bulk operations run asynchronously on Shopify's side and do not consume the
+    REST rate limit. Poll get_bulk_export with the returned operation ID to
+    download the result once it completes.
+    
+    Args:
+        updated_since: Optional ISO 8601 timestamp; only export orders updated since then
+    
+    Returns:
+        JSON string with the bulk operation ID and its initial status
+        
+    Example:
+        start_bulk_export(updated_since="2025-01-01T00:00:00Z")
+    """
+    try:
+        filter_clause = ""
+        if updated_since:
+            since = updated_since.replace("'", "").replace('"', "")
+            filter_clause = f'(query: "updated_at:>=\'{since}\'")'
+
+        data = await _make_shopify_graphql(_BULK_RUN_MUTATION, {"query": _BULK_ORDERS_QUERY % filter_clause})
+        run = data.get("bulkOperationRunQuery") or {}
+        if run.get("userErrors"):
+            return json.dumps({
+                "success": False,
+                "error": "Bulk Operation Error",
+                "message": "; ".join(err.get("message", "") for err in run["userErrors"]),
+                "user_errors": run["userErrors"]
+            }, indent=2)
+        operation = run.get("bulkOperation") or {}
+        return json.dumps({
+            "success": True,
+            "operation_id": operation.get("id"),
+            "status": operation.get("status")
+        }, indent=2)
+    except ValueError as e:
+        return json.dumps({
+            "success": False,
+            "error": "Configuration Error",
+            "message": str(e)
+        }, indent=2)
+    except httpx.HTTPStatusError as e:
+        return json.dumps({
+            "success": False,
+            "error": "Shopify API Error",
+            "status_code": e.response.status_code,
+            "message": str(e)
+        }, indent=2)
+    except Exception as e:
+        return json.dumps({
+            "success": False,
+            "error": "Unexpected Error",
+            "message": str(e)
+        }, indent=2)
+
+
+@mcp.tool()
+async def get_bulk_export(
+    operation_id: str,
+    load_into_store: bool = True,
+    ctx: Context | None = None
+) -> str:
+    """
+    Check a bulk order export and download its result once completed.
+    
+    The JSONL result is streamed line by line (constant memory) into a local
+    file under BULK_EXPORT_DIR and, optionally, into the in-memory order store.
+    Download progress is reported through MCP progress notifications, and the
+    IDs of exported orders are sent as partial results while downloading.
+    
+    Args:
+        operation_id: Bulk operation ID returned by start_bulk_export
+        load_into_store: Also load exported orders into the in-memory order store (default: True)
+    
+    Returns:
+        JSON string with the operation status; for completed operations also the
+        local file path and the number of orders and line items exported
+        
+    Example:
+        get_bulk_export("gid://shopify/BulkOperation/1234567890")
+    """
+    try:
+        data = await _make_shopify_graphql(_BULK_STATUS_QUERY, {"id": operation_id})
+        operation = data.get("node") or {}
+        if not operation:
+            return json.dumps({
+                "success": False,
+                "error": "Not Found",
+                "message": f"Bulk operation {operation_id} not found"
+            }, indent=2)
+        
+        status = operation.get("status")
+        total_rows = int(operation.get("objectCount") or 0)
+        if status != "COMPLETED" or not operation.get("url"):
+            return json.dumps({
+                "success": status not in ("FAILED", "CANCELED", "EXPIRED"),
+                "operation_id": operation_id,
+                "status": status,
+                "error_code": operation.get("errorCode"),
+                "object_count": total_rows,
+                "completed": False
+            }, indent=2)
+        
+        os.makedirs(BULK_EXPORT_DIR, exist_ok=True)
+        await asyncio.to_thread(_prune_exports)
+        path = os.path.join(BULK_EXPORT_DIR, f"orders-{_gid_to_id(operation_id)}.jsonl")
+        rows = orders = line_items = 0
+        progress = ToolProgress(ctx, "get_bulk_export", total=total_rows or None)
+        batch_order_ids = []
+        # parent order ID -> its line item rows, added to the store in one call per order
+        pending_line_items: dict[int, list[dict]] = {}
+        
+        def flush_line_items():
+            for order_id, items in pending_line_items.items():
+                order_store.add_line_items(order_id, items)
+            pending_line_items.clear()
+        
+        # Signed download URL: no Shopify auth header
+        client = _get_shopify_client()
+        async with client.stream("GET", operation["url"]) as response:
+            response.raise_for_status()
+            with open(path, "w", encoding="utf-8") as out:
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    out.write(line + "\n")
+                    rows += 1
+                    
+                    row = json.loads(line)
+                    if "__parentId" in row:
+                        line_items += 1
+                        if load_into_store:
+                            pending_line_items.setdefault(_gid_to_id(row["__parentId"]), []).append(_project_bulk_line_item(row))
+                    else:
+                        orders += 1
+                        order = _project_bulk_order(row)
+                        batch_order_ids.append(order["order_id"])
+                        if load_into_store:
+                            # Child rows follow their parent, so earlier orders' line items are complete
+                            flush_line_items()
+                            order_store.upsert(order)
+                    
+                    if rows % _BULK_PROGRESS_EVERY == 0:
+                        await progress.advance(_BULK_PROGRESS_EVERY, f"{orders} orders, {line_items} line items")
+                        await progress.partial({"order_ids": batch_order_ids})
+                        batch_order_ids = []
+        
+        flush_line_items()
+        progress.total = rows
+        await progress.advance(rows % _BULK_PROGRESS_EVERY, f"{orders} orders, {line_items} line items", force=True)
+        if batch_order_ids:
+            await progress.partial({"order_ids": batch_order_ids})
+        
+        return json.dumps({
+            "success": True,
+            "operation_id": operation_id,
+            "status": status,
+            "completed": True,
+            "file": path,
+            "file_size": operation.get("fileSize"),
+            "rows": rows,
+            "orders": orders,
+            "line_items": line_items,
+            "loaded_into_store": load_into_store,
+            "completed_at": operation.get("completedAt")
+        }, indent=2)
+    except ValueError as e:
+        return json.dumps({
+            "success": False,
+            "error": "Configuration Error",
+            "message": str(e)
+        }, indent=2)
+    except httpx.HTTPStatusError as e:
+        return json.dumps({
+            "success": False,
+            "error": "Shopify API Error",
+            "status_code": e.response.status_code,
+            "message": str(e)
+        }, indent=2)
+    except Exception as e:
+        return json.dumps({
+            "success": False,
+            "error": "Unexpected Error",
+            "message": str(e)
+        }, indent=2)
+
+
+# === ORDER ANALYTICS ===
+_ANALYTICS_GROUPS = ("day", "week", "month", "financial_status", "fulfillment_status", "currency", "none")
+
+
+class OrderColumns:
+    """
+    Columnar (struct-of-arrays) snapshot of the order store.
+    
+    One NumPy array per field, with statuses and currencies dictionary-encoded
+    as small integer codes, so filters and group-bys run as vectorized array
+    operations instead of Python loops over order dicts. Changed orders are
+    patched through a row index per order ID and new orders are appended, so
+    the snapshot follows the store without full rebuilds.
+    
+    A published snapshot is never mutated: patched() returns a new snapshot
+    with copied columns, so aggregate() calls still running on the previous
+    one always see a consistent set of rows.
+    """
+
+    def __init__(self, orders: Iterable[OrderRecord]):
+        import numpy as np
+
+        self.np = np
+        self.dictionaries: dict[str, dict[str | None, int]] = {
+            "financial_status": {},
+            "fulfillment_status": {},
+            "currency": {}
+        }
+        self.row_of: dict[int, int] = {}
+        self.size = 0
+        self.day = np.empty(0, dtype="datetime64[D]")
+        self.total_milli = np.empty(0, dtype=np.int64)
+        self.test = np.empty(0, dtype=bool)
+        self.cancelled = np.empty(0, dtype=bool)
+        self.codes = {name: np.empty(0, dtype=np.int32) for name in self.dictionaries}
+        self._apply(orders)
+
+    @property
+    def categories(self) -> dict[str, list]:
+        return {name: list(mapping) for name, mapping in self.dictionaries.items()}
+
+    def _encode(self, orders: list[OrderRecord]) -> dict:
+        np = self.np
+        days, milli, test, cancelled = [], [], [], []
+        codes: dict[str, list[int]] = {name: [] for name in self.dictionaries}
+        for order in orders:
+            days.append((order.created_at or "1970-01-01")[:10])
+            milli.append(order.total_milli or 0)
+            test.append(bool(order.test_order))
+            cancelled.append(order.cancelled_at is not None)
+            for name, mapping in self.dictionaries.items():
+                codes[name].append(mapping.setdefault(getattr(order, name), len(mapping)))
+        return {
+            "day": np.array(days, dtype="datetime64[D]"),
+            "total_milli": np.array(milli, dtype=np.int64),
+            "test": np.array(test, dtype=bool),
+            "cancelled": np.array(cancelled, dtype=bool),
+            "codes": {name: np.array(values, dtype=np.int32) for name, values in codes.items()}
+        }
+
+    def patched(self, orders: Iterable[OrderRecord]) -> "OrderColumns":
+        """Return a new snapshot with `orders` applied, leaving this one untouched."""
+        clone = object.__new__(OrderColumns)
+        clone.np = self.np
+        clone.dictionaries = {name: dict(mapping) for name, mapping in self.dictionaries.items()}
+        # Shared, not copied: only the latest snapshot is ever patched (under the
+        # analytics lock) and aggregate() does not read it
+        clone.row_of = self.row_of
+        clone.size = self.size
+        for name in ("day", "total_milli", "test", "cancelled"):
+            setattr(clone, name, getattr(self, name))
+        clone.codes = dict(self.codes)
+        clone._apply(orders)
+        return clone
+
+    def _apply(self, orders: Iterable[OrderRecord]) -> None:
+        """Overwrite the rows of known orders and append rows for new ones, replacing (never writing into) the arrays."""
+        np = self.np
+        updated, added = [], []
+        for order in orders:
+            (updated if order.order_id in self.row_of else added).append(order)
+        if updated:
+            rows = np.fromiter((self.row_of[order.order_id] for order in updated), dtype=np.int64, count=len(updated))
+            columns = self._encode(updated)
+            for name in ("day", "total_milli", "test", "cancelled"):
+                array = getattr(self, name).copy()
+                array[rows] = columns[name]
+                setattr(self, name, array)
+            for name, values in columns["codes"].items():
+                array = self.codes[name].copy()
+                array[rows] = values
+                self.codes[name] = array
+        if added:
+            columns = self._encode(added)
+            for name in ("day", "total_milli", "test", "cancelled"):
+                setattr(self, name, np.concatenate([getattr(self, name), columns[name]]))
+            for name, values in columns["codes"].items():
+                self.codes[name] = np.concatenate([self.codes[name], values])
+            for offset, order in enumerate(added):
+                self.row_of[order.order_id] = self.size + offset
+            self.size += len(added)
+
+    def aggregate(
+        self,
+        group_by: str,
+        start_date: str | None = None,
+        end_date: str | None = None,
+        include_test: bool = False,
+        include_cancelled: bool = False,
+        currency: str | None = None
+    ) -> list[dict]:
+        """
+        Order count, revenue and average order value per non-empty (group, currency) pair.
+        
+        Amounts in different currencies are never summed: every group is split
+        by currency, so a mixed-currency store yields one row per currency
+        within each group (dates ascending, then currency codes in first-seen order).
+        """
+        np = self.np
+        mask = np.ones(self.size, dtype=bool)
+        if start_date:
+            mask &= self.day >= np.datetime64(start_date[:10], "D")
+        if end_date:
+            mask &= self.day <= np.datetime64(end_date[:10], "D")
+        if not include_test:
+            mask &= ~self.test
+        if not include_cancelled:
+            mask &= ~self.cancelled
+        if currency:
+            categories = self.categories["currency"]
+            code = categories.index(currency) if currency in categories else -1
+            mask &= self.codes["currency"] == code
+
+        # Integer group keys so grouping is a single O(n) bincount (no sort)
+        milli = self.total_milli[mask]
+        if group_by == "none":
+            keys = np.zeros(milli.size, dtype=np.int64)
+            offset, label = 0, lambda k: "all"
+        elif group_by == "day":
+            keys = self.day[mask].astype(np.int64)
+            offset, label = (int(keys.min()) if keys.size else 0), lambda k: str(np.datetime64(k, "D"))
+        elif group_by == "week":
+            # Day 0 (1970-01-01) is a Thursday; shift by 3 days for Monday-start weeks
+            keys = (self.day[mask].astype(np.int64) + 3) // 7
+            offset, label = (int(keys.min()) if keys.size else 0), lambda k: str(np.datetime64(k * 7 - 3, "D"))
+        elif group_by == "month":
+            keys = self.day[mask].astype("datetime64[M]").astype(np.int64)
+            offset, label = (int(keys.min()) if keys.size else 0), lambda k: str(np.datetime64(k, "M"))
+        else:
+            keys = self.codes[group_by][mask]
+            categories = self.categories[group_by]
+            offset, label = 0, lambda k: categories[k]
+
+        # Compound (group, currency) keys keep each currency's amounts apart
+        currencies = self.categories["currency"]
+        compound = (keys - offset) * max(len(currencies), 1) + self.codes["currency"][mask]
+        counts = np.bincount(compound)
+        revenue = np.bincount(compound, weights=milli, minlength=counts.size)
+        present = np.flatnonzero(counts)
+        return [
+            {
+                "group": label(int(k) // len(currencies) + offset),
+                "currency": currencies[int(k) % len(currencies)],
+                "order_count": int(counts[k]),
+                "revenue": round(float(revenue[k]) / 1000, 3),
+                "average_order_value": round(float(revenue[k]) / counts[k] / 1000, 3)
+            }
+            for k in present
+        ]
+
+
+# Above this share of changed rows a full rebuild is cheaper than patching
+ANALYTICS_REBUILD_FRACTION = 0.25
+
+_order_columns: OrderColumns | None = None
+# event loop -> asyncio.Lock serialising snapshot updates
+_order_columns_locks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+async def _get_order_columns() -> OrderColumns:
+    """
+    Return the columnar snapshot, patched with the orders changed since the last call.
+    
+    Changed records are collected on the event loop, where get_order_status and
+    bulk ingest upsert into the store; only those records are handed to the
+    worker thread. Single-order upserts cost a column copy and row patch
+    rather than a rebuild; the first call, or one after a large bulk ingest,
+    rebuilds from a copy of the store. Either way the new snapshot is built
+    off to the side and published with a single assignment, so callers that
+    are still aggregating over the previous snapshot are unaffected.
+    """
+    global _order_columns
+    loop = asyncio.get_running_loop()
+    lock = _order_columns_locks.setdefault(loop, asyncio.Lock())
+    async with lock:
+        changed = order_store.drain_changed()
+        if _order_columns is None or len(changed) > ANALYTICS_REBUILD_FRACTION * _order_columns.size:
+            records = list(order_store.values())
+            _order_columns = await asyncio.to_thread(OrderColumns, records)
+        elif changed:
+            _order_columns = await asyncio.to_thread(_order_columns.patched, changed)
+        return _order_columns
+
+
+@mcp.tool()
+async def order_analytics(
+    group_by: str = "day",
+    start_date: str | None = None,
+    end_date: str | None = None,
+    include_test: bool = False,
+    include_cancelled: bool = False,
+    currency: str | None = None,
+    ctx: Context | None = None
+) -> str:
+    """
+    Aggregate synced orders: order count, revenue and average order value per group.
+    
+    Runs over a columnar snapshot of the in-memory order store (filled by
+    get_bulk_export and get_order_status), so it answers questions like
+    "revenue by day this month" or "average order value by status" without
+    calling Shopify.
+    
+    Args:
+        group_by: One of "day", "week", "month", "financial_status",
+            "fulfillment_status", "currency" or "none" (default: "day")
+        start_date: Optional first order date to include (YYYY-MM-DD)
+        end_date: Optional last order date to include (YYYY-MM-DD)
+        include_test: Include test orders (default: False)
+        include_cancelled: Include cancelled orders (default: False)
+        currency: Optional currency code filter (e.g. "USD")
+    
+    Returns:
+        JSON string with one row per group and currency plus the number of
+        orders in the snapshot; amounts in different currencies are never summed
+        
+    Example:
+        order_analytics(group_by="financial_status", start_date="2025-07-01")
+    """
+    if group_by not in _ANALYTICS_GROUPS:
+        return json.dumps({
+            "success": False,
+            "error": "Invalid Argument",
+            "message": f"group_by must be one of: {', '.join(_ANALYTICS_GROUPS)}"
+        }, indent=2)
+    try:
+        started = time.perf_counter()
+        async with ToolProgress(ctx, "order_analytics").keepalive("Building order snapshot"):
+            columns = await _get_order_columns()
+        groups = columns.aggregate(group_by, start_date, end_date, include_test, include_cancelled, currency)
+        return json.dumps({
+            "success": True,
+            "group_by": group_by,
+            "orders_in_snapshot": columns.size,
+            "currencies": [c for c in columns.categories["currency"] if c],
+            "groups": groups,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+        }, indent=2)
+    except Exception as e:
+        return json.dumps({
+            "success": False,
+            "error": "Unexpected Error",
+            "message": str(e)
+        }, indent=2)
+
+
+# === PARQUET / ARROW EXPORT ===
+# Orders per row group (record batch); bounds export memory regardless of store size
+EXPORT_ROW_GROUP_SIZE = int(os.getenv("EXPORT_ROW_GROUP_SIZE", "50000"))
+
+_EXPORT_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def _export_schemas(pa) -> dict:
+    """Fixed Arrow schemas for the orders, line_items and fulfillments tables."""
+    money = pa.decimal128(18, _AMOUNT_SCALE)
+    timestamp = pa.timestamp("us", tz="UTC")
+    return {
+        "orders": pa.schema([
+            ("order_id", pa.int64()),
+            ("order_number", pa.int64()),
+            ("financial_status", pa.string()),
+            ("fulfillment_status", pa.string()),
+            ("total_price", money),
+            ("currency", pa.string()),
+            ("created_at", timestamp),
+            ("updated_at", timestamp),
+            ("cancelled_at", timestamp),
+            ("test_order", pa.bool_()),
+            ("customer_email", pa.string()),
+            ("customer_first_name", pa.string()),
+            ("customer_last_name", pa.string()),
+            ("tags", pa.string()),
+            ("note", pa.string())
+        ]),
+        "line_items": pa.schema([
+            ("order_id", pa.int64()),
+            ("line_index", pa.int32()),
+            ("variant_id", pa.int64()),
+            ("title", pa.string()),
+            ("quantity", pa.int32()),
+            ("price", money),
+            ("fulfillment_status", pa.string())
+        ]),
+        "fulfillments": pa.schema([
+            ("order_id", pa.int64()),
+            ("fulfillment_index", pa.int32()),
+            ("status", pa.string()),
+            ("tracking_company", pa.string()),
+            ("tracking_number", pa.string()),
+            ("created_at", timestamp)
+        ])
+    }
+
+
+def _parse_timestamp(value: str | None):
+    """Parse a Shopify ISO 8601 timestamp into an aware UTC datetime (None if empty)."""
+    if not value:
+        return None
+    from datetime import datetime, timezone
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc)
+
+
+class _TableWriter:
+    """Buffers rows column-wise and writes them as Parquet row groups / Arrow IPC batches."""
+
+    def __init__(self, pa, schema, path: str, file_format: str):
+        self.pa = pa
+        self.schema = schema
+        self.path = path
+        self.columns = {name: [] for name in schema.names}
+        self.rows = 0
+        if file_format == "parquet":
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(path, schema, compression="zstd")
+        else:
+            self.writer = pa.ipc.new_file(path, schema)
+
+    def append(self, row: dict) -> None:
+        for name, values in self.columns.items():
+            values.append(row.get(name))
+
+    def flush(self) -> None:
+        buffered = len(next(iter(self.columns.values())))
+        if not buffered:
+            return
+        batch = self.pa.RecordBatch.from_pydict(self.columns, schema=self.schema)
+        self.writer.write_batch(batch)
+        self.rows += buffered
+        self.columns = {name: [] for name in self.schema.names}
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+
+
+def _prune_exports() -> int:
+    """
+    Delete files in BULK_EXPORT_DIR older than EXPORT_RETENTION_SECONDS.
+    
+    Exports hold customer emails and names, so they are not kept indefinitely.
+    Blocking; returns the number of files removed.
+    """
+    if EXPORT_RETENTION_SECONDS <= 0 or not os.path.isdir(BULK_EXPORT_DIR):
+        return 0
+    cutoff = time.time() - EXPORT_RETENTION_SECONDS
+    removed = 0
+    with os.scandir(BULK_EXPORT_DIR) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                # Removed concurrently or not ours to delete; try again next export
+                continue
+    return removed
+
+
+def _write_order_export(orders: list[OrderRecord], file_format: str, since: str | None) -> dict:
+    """
+    Write orders (updated after `since`) to orders/line_items/fulfillments files.
+    
+    Rows are flushed every EXPORT_ROW_GROUP_SIZE orders, so memory stays flat
+    regardless of how many orders are exported. Blocking; run in a thread.
+    """
+    import pyarrow as pa
+
+    since_ts = _parse_timestamp(since)
+    export_id = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    os.makedirs(BULK_EXPORT_DIR, exist_ok=True)
+    _prune_exports()
+    extension = _EXPORT_FORMATS[file_format]
+    writers = {
+        table: _TableWriter(pa, schema, os.path.join(BULK_EXPORT_DIR, f"{table}-{export_id}{extension}"), file_format)
+        for table, schema in _export_schemas(pa).items()
+    }
+    cursor = since_ts
+    pending = 0
+    try:
+        for order in orders:
+            updated_at = _parse_timestamp(order.updated_at)
+            if since_ts is not None and (updated_at is None or updated_at <= since_ts):
+                continue
+            if updated_at is not None and (cursor is None or updated_at > cursor):
+                cursor = updated_at
+            
+            order_id = order.order_id
+            writers["orders"].append({
+                "order_id": order_id,
+                "order_number": order.order_number if isinstance(order.order_number, int) else None,
+                "financial_status": order.financial_status,
+                "fulfillment_status": order.fulfillment_status,
+                "total_price": _milli_to_decimal(order.total_milli),
+                "currency": order.currency,
+                "created_at": _parse_timestamp(order.created_at),
+                "updated_at": updated_at,
+                "cancelled_at": _parse_timestamp(order.cancelled_at),
+                "test_order": order.test_order,
+                "customer_email": order.email,
+                "customer_first_name": order.first_name,
+                "customer_last_name": order.last_name,
+                "tags": order.tags,
+                "note": order.note
+            })
+            for index, item in enumerate(order.line_items):
+                writers["line_items"].append({
+                    "order_id": order_id,
+                    "line_index": index,
+                    "variant_id": item.variant_id,
+                    "title": item.title,
+                    "quantity": item.quantity,
+                    "price": _milli_to_decimal(item.price_milli),
+                    "fulfillment_status": item.fulfillment_status
+                })
+            for index, fulfillment in enumerate(order.fulfillments):
+                writers["fulfillments"].append({
+                    "order_id": order_id,
+                    "fulfillment_index": index,
+                    "status": fulfillment.status,
+                    "tracking_company": fulfillment.tracking_company,
+                    "tracking_number": fulfillment.tracking_number,
+                    "created_at": _parse_timestamp(fulfillment.created_at)
+                })
+            
+            pending += 1
+            if pending >= EXPORT_ROW_GROUP_SIZE:
+                for writer in writers.values():
+                    writer.flush()
+                pending = 0
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    return {
+        "format": file_format,
+        "since": since,
+        "next_cursor": cursor.isoformat().replace("+00:00", "Z") if cursor else None,
+        "files": {
+            table: {"file": os.path.basename(writer.path), "rows": writer.rows}
+            for table, writer in writers.items()
+        }
+    }
+
+
+@mcp.tool()
+async def export_orders(
+    file_format: str = "parquet",
+    since: str | None = None,
+    ctx: Context | None = None
+) -> str:
+    """
+    Export synced orders as Parquet or Arrow IPC files with fixed schemas.
+    
+    Writes three files (orders, line_items, fulfillments) under BULK_EXPORT_DIR
+    from the in-memory order store. Pass the returned next_cursor as `since`
+    on the next call to export only orders updated in between.
+    
+    Args:
+        file_format: "parquet" or "arrow" (Arrow IPC file) (default: "parquet")
+        since: Optional cursor (ISO 8601 updated_at); only export orders updated after it
+    
+    Returns:
+        JSON string with the written files, their row counts and the next cursor
+        
+    Example:
+        export_orders(file_format="parquet", since="2025-07-01T00:00:00Z")
+    """
+    if file_format not in _EXPORT_FORMATS:
+        return json.dumps({
+            "success": False,
+            "error": "Invalid Argument",
+            "message": f"file_format must be one of: {', '.join(_EXPORT_FORMATS)}"
+        }, indent=2)
+    try:
+        # Snapshot the order references so the store can keep changing during the export
+        orders = list(order_store.values())
+        progress = ToolProgress(ctx, "export_orders")
+        async with progress.keepalive(f"Writing {len(orders)} orders"):
+            manifest = await asyncio.to_thread(_write_order_export, orders, file_format, since)
+        return json.dumps({"success": True, **manifest}, indent=2)
+    except ValueError as e:
+        return json.dumps({
+            "success": False,
+            "error": "Invalid Argument",
+            "message": str(e)
+        }, indent=2)
+    except Exception as e:
+        return json.dumps({
+            "success": False,
+            "error": "Unexpected Error",
+            "message": str(e)
+        }, indent=2)
+
+
+# === HTTP CACHING & COMPRESSION ===
+def compute_order_etag(order: dict, fields: list[str] | None = None) -> str | None:
+    """
+    Compute a weak ETag for an order payload from its updated_at and projected fields.
+
+    Args:
+        order: Order payload as returned by get_order_status
+        fields: Optional list of top-level fields the client asked for
+
+    Returns:
+        ETag header value, or None if the payload is not a successful order lookup
+    """
+    if not order.get("success") or not order.get("updated_at"):
+        return None
+    projected = {k: order.get(k) for k in fields} if fields else order
+    canonical = json.dumps(projected, sort_keys=True, separators=(",", ":"))
+    digest = hashlib.sha256(f"{order['updated_at']}|{canonical}".encode("utf-8")).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def _negotiate_encoding(accept_encoding: str | None) -> str | None:
+    """Pick the best supported content encoding from an Accept-Encoding header."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def build_json_response(
+    request: Request,
+    payload: Any,
+    status_code: int = 200,
+    etag: str | None = None
+) -> Response:
+    """
+    Build a JSON response honouring If-None-Match and Accept-Encoding.
+
+    Unchanged payloads (matching ETag) are answered with 304 Not Modified.
+    Bodies of at least COMPRESSION_MIN_SIZE bytes are brotli- or gzip-compressed
+    when the client accepts it.
+    """
+    headers = {"Vary": "Accept-Encoding"}
+    if etag:
+        headers["ETag"] = etag
+        headers["Cache-Control"] = "no-cache"
+        if status_code == 200 and _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        encoding = _negotiate_encoding(request.headers.get("accept-encoding"))
+        if encoding == "br":
+            body = brotli.compress(body, quality=5)
+        elif encoding == "gzip":
+            body = gzip.compress(body, compresslevel=6)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+    return Response(body, status_code=status_code, headers=headers, media_type="application/json")
+
+
 # === REST API ENDPOINTS (for n8n, HTTP clients, etc.) ===
 async def api_create_order(request: Request) -> JSONResponse:
     """REST API endpoint: POST /api/create_order"""
@@ -456,27 +2077,328 @@ async def api_create_order(request: Request) -> JSONResponse:
         return JSONResponse({"success": False, "error": str(e)}, status_code=500)
 
 async def api_order_status(request: Request) -> JSONResponse:
-    """REST API endpoint: GET /api/order_status?order_id=123"""
+    """REST API endpoint: GET /api/order_status?order_id=123[&fields=financial_status,fulfillment_status]"""
     try:
         order_id = request.query_params.get("order_id")
         if not order_id:
             return JSONResponse({"success": False, "error": "order_id is required"}, status_code=400)
-        result_json = await get_order_status(int(order_id))
-        return JSONResponse(json.loads(result_json))
+        result = json.loads(await get_order_status(int(order_id)))
+
+        # Optional projection: only return (and tag) the requested top-level fields
+        fields = [f.strip() for f in request.query_params.get("fields", "").split(",") if f.strip()]
+        etag = compute_order_etag(result, fields)
+        if fields and result.get("success"):
+            result = {"success": True, **{k: result.get(k) for k in fields}}
+        return build_json_response(request, result, etag=etag)
+    except Exception as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+
+def _admin_auth_error(request: Request, feature: str = "debug endpoints") -> JSONResponse | None:
+    """Return an error response unless the request carries the admin token."""
+    if not ADMIN_TOKEN:
+        return JSONResponse({"success": False, "error": f"{feature} are disabled (ADMIN_TOKEN not set)"}, status_code=404)
+    supplied = request.headers.get("x-admin-token") or request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        return JSONResponse({"success": False, "error": "invalid admin token"}, status_code=403)
+    return None
+
+async def api_export_orders(request: Request) -> JSONResponse:
+    """REST API endpoint: GET /api/export_orders?format=parquet&since=2025-07-01T00:00:00Z (requires the admin token)"""
+    # Each call writes a full copy of customer data to disk; only admins may trigger it
+    if (error := _admin_auth_error(request, "exports")) is not None:
+        return error
+    try:
+        result = json.loads(await export_orders(
+            file_format=request.query_params.get("format", "parquet"),
+            since=request.query_params.get("since")
+        ))
+        if result.get("success"):
+            for entry in result["files"].values():
+                entry["url"] = str(request.url_for("api_export_file", filename=entry["file"]))
+        return JSONResponse(result, status_code=200 if result.get("success") else 400)
     except Exception as e:
         return JSONResponse({"success": False, "error": str(e)}, status_code=500)
 
+async def api_export_file(request: Request) -> Response:
+    """REST API endpoint: GET /api/exports/{filename} (download an export file; requires the admin token)"""
+    # Exports hold customer emails and names, and their file names are predictable
+    if (error := _admin_auth_error(request, "export downloads")) is not None:
+        return error
+    filename = os.path.basename(request.path_params["filename"])
+    path = os.path.join(BULK_EXPORT_DIR, filename)
+    if not os.path.isfile(path):
+        return JSONResponse({"success": False, "error": "export file not found"}, status_code=404)
+    return FileResponse(path, filename=filename)
+
 async def api_health(request: Request) -> JSONResponse:
     """Health check endpoint"""
-    return JSONResponse({"status": "ok", "tools": ["create_order", "get_order_status"]})
+    return JSONResponse({"status": "ok", "tools": ["create_order", "get_order_status", "get_order_statuses", "start_bulk_export", "get_bulk_export", "order_analytics", "export_orders"]})
+
+# === DEBUG / PROFILING ENDPOINTS ===
+# Nothing here runs until an endpoint is called: the sampler thread and
+# tracemalloc only exist for the requested number of seconds
+_DEBUG_MAX_SECONDS = 60.0
+_debug_lock = asyncio.Lock()
+
+
+def _debug_param(request: Request, name: str, default, minimum, maximum, convert=float):
+    """
+    Parse a numeric query parameter and clamp it to [minimum, maximum].
+    
+    Raises:
+        ValueError: If the value is not a finite number of the expected type
+    """
+    raw = request.query_params.get(name)
+    if raw is None:
+        return default
+    try:
+        value = convert(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be {'an integer' if convert is int else 'a number'}") from None
+    if not math.isfinite(value):
+        raise ValueError(f"{name} must be a finite number")
+    return min(maximum, max(minimum, value))
+
+
+def _debug_seconds(request: Request, default: float = 10.0) -> float:
+    return _debug_param(request, "seconds", default, 0.1, _DEBUG_MAX_SECONDS)
+
+
+def _bad_param(error: ValueError) -> JSONResponse:
+    return JSONResponse({"success": False, "error": str(error)}, status_code=400)
+
+
+class _StackSampler(threading.Thread):
+    """
+    Wall-clock sampling profiler.
+    
+    Periodically captures the stack of every other thread via
+    sys._current_frames() and counts identical stacks, producing folded-stack
+    output ("frame;frame;frame count") for flamegraph.pl, speedscope or
+    inferno.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="debug-stack-sampler", daemon=True)
+        self.interval = interval
+        self.samples: dict[str, int] = {}
+        self.sample_count = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(self.interval):
+            names.update({t.ident: t.name for t in threading.enumerate()})
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+            self.sample_count += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in sorted(self.samples.items())) + "\n"
+
+
+async def debug_profile(request: Request) -> Response:
+    """Debug endpoint: GET /debug/profile?seconds=10&interval_ms=5 (folded stacks for flamegraphs)"""
+    if (error := _admin_auth_error(request)) is not None:
+        return error
+    try:
+        seconds = _debug_seconds(request)
+        interval = _debug_param(request, "interval_ms", 5.0, 1.0, 1000.0) / 1000
+    except ValueError as e:
+        return _bad_param(e)
+    if _debug_lock.locked():
+        return JSONResponse({"success": False, "error": "another profiling session is running"}, status_code=409)
+    async with _debug_lock:
+        sampler = _StackSampler(interval)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await asyncio.to_thread(sampler.stop)
+        return PlainTextResponse(sampler.folded(), headers={
+            "X-Profile-Samples": str(sampler.sample_count),
+            "X-Profile-Seconds": str(seconds)
+        })
+
+
+async def debug_tracemalloc(request: Request) -> JSONResponse:
+    """Debug endpoint: GET /debug/tracemalloc?seconds=10&limit=25&frames=10 (allocation snapshot)"""
+    if (error := _admin_auth_error(request)) is not None:
+        return error
+    try:
+        seconds = _debug_seconds(request)
+        limit = _debug_param(request, "limit", 25, 1, 1000, convert=int)
+        frames = _debug_param(request, "frames", 10, 1, 100, convert=int)
+    except ValueError as e:
+        return _bad_param(e)
+    if _debug_lock.locked():
+        return JSONResponse({"success": False, "error": "another profiling session is running"}, status_code=409)
+    import tracemalloc
+    if tracemalloc.is_tracing():
+        return JSONResponse({"success": False, "error": "tracemalloc is already tracing"}, status_code=409)
+    async with _debug_lock:
+        tracemalloc.start(frames)
+        try:
+            start = tracemalloc.take_snapshot()
+            await asyncio.sleep(seconds)
+            end = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        def describe(stat) -> dict:
+            return {
+                "size_kib": round(stat.size / 1024, 1),
+                "count": stat.count,
+                "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+            }
+
+        growth = end.compare_to(start, "traceback")[:limit]
+        return JSONResponse({
+            "success": True,
+            "seconds": seconds,
+            "traced_current_kib": round(current / 1024, 1),
+            "traced_peak_kib": round(peak / 1024, 1),
+            "top_allocations": [describe(stat) for stat in end.statistics("traceback")[:limit]],
+            "top_growth": [
+                {**describe(stat), "size_diff_kib": round(stat.size_diff / 1024, 1), "count_diff": stat.count_diff}
+                for stat in growth
+            ]
+        })
+
+
+async def debug_tasks(request: Request) -> JSONResponse:
+    """Debug endpoint: GET /debug/tasks?frames=10 (dump of running asyncio tasks)"""
+    if (error := _admin_auth_error(request)) is not None:
+        return error
+    try:
+        frames = _debug_param(request, "frames", 10, 1, 100, convert=int)
+    except ValueError as e:
+        return _bad_param(e)
+    tasks = []
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        tasks.append({
+            "name": task.get_name(),
+            "coroutine": getattr(coro, "__qualname__", repr(coro)),
+            "done": task.done(),
+            "cancelled": task.cancelled(),
+            "stack": [
+                f"{frame.f_code.co_name} ({frame.f_code.co_filename}:{frame.f_lineno})"
+                for frame in task.get_stack(limit=frames)
+            ]
+        })
+    return JSONResponse({"success": True, "count": len(tasks), "tasks": tasks})
+
+
+# === STARTUP WARM-UP & READINESS ===
+_readiness: dict[str, Any] = {
+    "ready": False,
+    "status": "starting",
+    "token_valid": None,
+    "shop": None,
+    "warmup_seconds": None,
+    "error": None
+}
+
+
+async def _warm_up() -> None:
+    """
+    Pre-open Shopify connections and validate the access token.
+    
+    Transient network failures are retried with backoff; an auth failure
+    (401/403) or missing token is final. The server reports ready once the
+    token is validated, or immediately after warm-up in dummy-response mode.
+    """
+    started = time.perf_counter()
+    _readiness["status"] = "warming"
+    attempt = 0
+    while True:
+        try:
+            # Concurrent requests open SHOPIFY_WARM_CONNECTIONS pooled TLS connections
+            results = await asyncio.gather(*(
+                _make_shopify_request("GET", "/shop.json")
+                for _ in range(max(1, SHOPIFY_WARM_CONNECTIONS))
+            ))
+            _readiness["token_valid"] = True
+            _readiness["shop"] = results[0].get("shop", {}).get("myshopify_domain")
+            _readiness["error"] = None
+            break
+        except ValueError as e:
+            _readiness["token_valid"] = False
+            _readiness["error"] = str(e)
+            break
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code in (401, 403):
+                _readiness["token_valid"] = False
+                _readiness["error"] = f"Shopify rejected the access token ({e.response.status_code})"
+                break
+            _readiness["error"] = str(e)
+        except httpx.HTTPError as e:
+            _readiness["error"] = f"Shopify unreachable: {e}"
+        if USE_DUMMY_RESPONSES:
+            break
+        attempt += 1
+        await asyncio.sleep(min(30.0, 2.0 ** attempt))
+
+    _readiness["warmup_seconds"] = round(time.perf_counter() - started, 3)
+    _readiness["ready"] = bool(_readiness["token_valid"] or USE_DUMMY_RESPONSES)
+    _readiness["status"] = "ready" if _readiness["ready"] else "not_ready"
+
+
+async def _run_startup() -> None:
+    """Warm up, then keep the variant catalog cache loaded in the background"""
+    await _warm_up()
+    if _readiness["token_valid"] and VARIANT_CACHE_REFRESH_SECONDS > 0:
+        await variant_cache.run_refresh_loop()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    """Run the MCP session manager (mounted sub-app lifespans are not run by Starlette) and warm up"""
+    async with mcp.session_manager.run():
+        warm_up_task = asyncio.create_task(_run_startup())
+        try:
+            yield
+        finally:
+            warm_up_task.cancel()
+            await _close_shopify_client()
+
+async def api_ready(request: Request) -> JSONResponse:
+    """Readiness endpoint: 200 once warm (connections open, token validated), 503 before"""
+    return JSONResponse(
+        {**_readiness, "variants_cached": len(variant_cache)},
+        status_code=200 if _readiness["ready"] else 503
+    )
 
 # Combined ASGI app: MCP at /mcp, REST at /api/*
 app = Starlette(
+    lifespan=lifespan,
     routes=[
         Mount("/mcp", app=mcp_app),
         Route("/api/create_order", api_create_order, methods=["POST"]),
         Route("/api/order_status", api_order_status, methods=["GET"]),
+        Route("/api/export_orders", api_export_orders, methods=["GET"]),
+        Route("/api/exports/{filename}", api_export_file, methods=["GET"], name="api_export_file"),
         Route("/api/health", api_health, methods=["GET"]),
+        Route("/api/ready", api_ready, methods=["GET"]),
+        Route("/debug/profile", debug_profile, methods=["GET"]),
+        Route("/debug/tracemalloc", debug_tracemalloc, methods=["GET"]),
+        Route("/debug/tasks", debug_tasks, methods=["GET"]),
         Route("/", api_health, methods=["GET"]),
     ]
 )